@@ -1,12 +1,21 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, UploadFile, File, Query, HTTPException
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from app.services.chat_servers import chat_service
 from app.services.asr import asr_service
-from app.services.tts import tts_service
-from app.api.roles import mock_roles_db
+from app.services.tts import tts_service, tts_chunk_to_json
+from app.services.audio_buffer import AudioBuffer
+from app.services.role_repository import role_repository
+from app.api.chat_connection import ChatConnection
 from app.core.config import settings
-from typing import AsyncGenerator
+from app.core import fast_json
+from app.core.fast_json import sse_event
+from app.core.metrics import WS_CONNECTIONS_ACTIVE, CHAT_BATCH_ITEMS
+from app.core.admission import PRIORITY_BACKGROUND
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from collections import deque
+import asyncio
+import uuid
 
 # 创建聊天API路由
 router = APIRouter(prefix=f"{settings.API_PREFIX}/chat", tags=["聊天交互"])
@@ -15,6 +24,7 @@ router = APIRouter(prefix=f"{settings.API_PREFIX}/chat", tags=["聊天交互"])
 class TextChatRequest(BaseModel):
     role_id: str
     message: str
+    session_id: Optional[str] = None  # 传入上次返回的session_id可继续多轮对话
 
 # 文本聊天响应模型
 class TextChatResponse(BaseModel):
@@ -26,15 +36,15 @@ class TextChatResponse(BaseModel):
 async def text_chat(req: TextChatRequest):
     """单次文本聊天接口，返回AI回复"""
     # 校验角色是否存在
-    role = next((r for r in mock_roles_db if r.id == req.role_id), None)
+    role = await role_repository.get(req.role_id)
     if not role:
         raise HTTPException(status_code=404, detail=f"角色 {req.role_id} 不存在")
     
-    # 生成临时会话ID
-    session_id = f"text_session_{req.role_id}_{hash(req.message) % 1000000}"
+    # 未指定会话时生成唯一的临时会话ID
+    session_id = req.session_id or f"text_session_{req.role_id}_{uuid.uuid4().hex}"
     
     # 初始化会话
-    chat_service.init_session(session_id=session_id, role=role)
+    await chat_service.init_session(session_id=session_id, role=role)
     
     # 获取AI回复
     ai_reply = await chat_service.get_single_reply(session_id, req.message)
@@ -45,64 +55,141 @@ async def text_chat(req: TextChatRequest):
         session_id=session_id
     )
 
+# 批量文本聊天请求模型
+class TextChatBatchRequest(BaseModel):
+    items: List[TextChatRequest]
+    concurrency: Optional[int] = Field(default=None, ge=1)  # 本次并发数，不超过 BATCH_MAX_CONCURRENCY
+
+@router.post("/batch", summary="批量文本聊天接口")
+async def text_chat_batch(req: TextChatBatchRequest):
+    """批量文本聊天：并发执行多条文本聊天，按完成顺序以NDJSON逐行返回
+    每行一条结果：成功为 {"index", "role_id", "session_id", "reply"}，失败为 {"index", "role_id", "session_id", "error"}
+    index为该条在items中的位置；同一session_id的多条按提交顺序依次执行（多轮对话）"""
+    if len(req.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"单次最多 {settings.BATCH_MAX_ITEMS} 条")
+    concurrency = min(req.concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+    return StreamingResponse(_run_batch(req.items, concurrency), media_type="application/x-ndjson")
+
+async def _run_batch(items: List[TextChatRequest], concurrency: int) -> AsyncGenerator[str, None]:
+    """最多concurrency个任务并发执行，结果完成一条返回一条；客户端断开时取消未完成的条目"""
+    # 同一会话的条目串成一组按顺序执行，不同组之间并发；
+    # 未指定会话的条目各自成组，组键与调用方的session_id分属不同命名空间，不会碰巧撞在一起
+    groups: Dict[Tuple[str, Any], List[int]] = {}
+    for index, item in enumerate(items):
+        key = ("session", item.session_id) if item.session_id else ("item", index)
+        groups.setdefault(key, []).append(index)
+    pending = deque(groups.values())
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while pending:
+            for index in pending.popleft():
+                results.put_nowait(await _run_batch_item(index, items[index]))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(pending)))]
+    try:
+        for _ in range(len(items)):
+            yield fast_json.dumps(await results.get()) + "\n"
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+async def _run_batch_item(index: int, item: TextChatRequest) -> Dict[str, Any]:
+    """执行一条文本聊天，错误记入结果而不中断整批"""
+    result = {"index": index, "role_id": item.role_id, "session_id": item.session_id}
+    try:
+        role = await role_repository.get(item.role_id)
+        if not role:
+            raise LookupError(f"角色 {item.role_id} 不存在")
+        session_id = item.session_id or f"text_session_{item.role_id}_{uuid.uuid4().hex}"
+        result["session_id"] = session_id
+        await chat_service.init_session(session_id=session_id, role=role)
+        result["reply"] = await chat_service.get_single_reply(session_id, item.message, raise_on_error=True)
+    except Exception as e:
+        result["error"] = str(e)
+        CHAT_BATCH_ITEMS.labels("error").inc()
+    else:
+        CHAT_BATCH_ITEMS.labels("ok").inc()
+    return result
+
 @router.websocket(f"{settings.WS_PREFIX}/session/{settings.API_PREFIX.strip('/')}/{{session_id}}/{{role_id}}")
 async def chat_websocket(
     websocket: WebSocket,
     session_id: str,
     role_id: str,
-    enable_tts: bool = Query(default=True, description="是否开启TTS音频返回")
+    enable_tts: bool = Query(default=True, description="是否开启TTS音频返回"),
+    audio_stream: bool = Query(default=False, description="语音分多帧发送，以 {\"type\": \"audio-end\"} 结束一句话"),
+    audio_format: str = Query(default="json", description="TTS音频帧格式：json（Base64）或 binary（二进制帧）"),
+    tts_window: int = Query(default=0, ge=0, description="按播放确认发送音频时允许领先的块数，0表示不等待确认"),
+    barge_in: bool = Query(default=True, description="新的输入或 {\"type\": \"cancel\"} 立即打断当前回复"),
+    coalesce_ms: Optional[int] = Query(default=None, ge=0, description="llm-token合并发送的时间窗口（毫秒），0表示逐Token发送"),
+    coalesce_chars: Optional[int] = Query(default=None, ge=1, description="合并的Token累积到该字符数立即发送")
 ):
     """实时聊天WebSocket接口"""
     # 校验角色并初始化会话
-    role = next((r for r in mock_roles_db if r.id == role_id), None)
+    role = await role_repository.get(role_id)
     if not role:
         await websocket.close(code=1008, reason=f"角色 {role_id} 不存在")
         return
-    chat_service.init_session(session_id=session_id, role=role)
+    await chat_service.init_session(session_id=session_id, role=role)
 
     await websocket.accept()
+    WS_CONNECTIONS_ACTIVE.inc()
+    connection = ChatConnection(
+        websocket,
+        session_id=session_id,
+        enable_tts=enable_tts,
+        audio_stream=audio_stream,
+        binary_audio=audio_format == "binary",
+        tts_window=tts_window,
+        barge_in=barge_in,
+        coalesce_ms=settings.WS_TOKEN_COALESCE_MS if coalesce_ms is None else coalesce_ms,
+        coalesce_chars=coalesce_chars or settings.WS_TOKEN_COALESCE_CHARS
+    )
     try:
-        while True:
-            data = await websocket.receive()
-            if "text" in data:
-                # 处理文本输入
-                user_input = data["text"]
-                async for chat_data in chat_service.chat_with_llm_stream(
-                    session_id=session_id,
-                    user_input=user_input
-                ):
-                    if not enable_tts and chat_data["type"].startswith("tts-"):
-                        continue
-                    await websocket.send_json(chat_data)
-            elif "bytes" in data:
-                # 处理音频输入
-                await websocket.send_json({"type": "stt-status", "message": "开始识别语音"})
-                
-                async def audio_generator():
-                    yield data["bytes"]
-                    
-                async for asr_data in asr_service.transcribe_stream(audio_generator()):
-                    await websocket.send_json(asr_data)
-                    if asr_data["type"] == "stt-final":
-                        async for chat_data in chat_service.chat_with_llm_stream(
-                            session_id=session_id,
-                            user_input=asr_data["text"]
-                        ):
-                            if not enable_tts and chat_data["type"].startswith("tts-"):
-                                continue
-                            await websocket.send_json(chat_data)
+        await connection.run()
+        if connection.session_ended:
+            await websocket.close(code=1000, reason="会话结束")
     except WebSocketDisconnect:
         print(f"会话 {session_id} 已断开")
     except Exception as e:
-        await websocket.send_json({"type": "chat-error", "message": f"会话异常：{str(e)}"})
+        await websocket.send_text(fast_json.dumps({"type": "chat-error", "message": f"会话异常：{str(e)}"}))
         await websocket.close(code=1011, reason=str(e))
+    finally:
+        WS_CONNECTIONS_ACTIVE.dec()
+        # 只有客户端明确结束会话时才删除；断线时保留，重连后继续对话，空闲会话由TTL/LRU淘汰
+        if connection.session_ended:
+            await chat_service.close_session(session_id)
+
+@router.delete("/sessions/{session_id}", summary="结束会话")
+async def end_session(session_id: str):
+    """删除会话及其对话历史（文本聊天与WebSocket会话通用）"""
+    await chat_service.close_session(session_id)
+    return {"session_id": session_id, "closed": True}
+
+@router.get("/sessions/stats", summary="会话统计")
+async def session_stats():
+    """当前存活会话数及淘汰/过期计数"""
+    return await chat_service.sessions.stats()
 
 @router.post("/asr", summary="语音转文本HTTP接口")
 async def transcribe_audio(file: UploadFile = File(..., description="音频文件")):
     """通过HTTP上传音频文件，返回识别结果"""
+    # 上传文件在响应开始前就会被关闭，先分块读入缓冲区
+    audio_buffer = AudioBuffer()
+    while True:
+        chunk = await file.read(64 * 1024)
+        if not chunk:
+            break
+        audio_buffer.write(chunk)
+
     async def asr_generator():
-        async for data in asr_service.transcribe_stream(file.file):
-            yield f"data: {data}\n\n"
+        try:
+            async for data in asr_service.transcribe_stream(audio_buffer.iter_chunks()):
+                yield sse_event(data)
+        finally:
+            audio_buffer.close()
     return StreamingResponse(asr_generator(), media_type="text/event-stream")
 
 @router.post("/tts", summary="文本转语音HTTP接口")
@@ -112,6 +199,8 @@ async def text_to_speech(
 ):
     """生成TTS音频，流式返回Base64块"""
     async def tts_generator():
-        async for data in tts_service.text_to_speech_stream(text=text, voice=voice):
-            yield f"data: {data}\n\n"
+        async for data in tts_service.text_to_speech_stream(text=text, voice=voice, priority=PRIORITY_BACKGROUND):
+            if data["type"] == "tts-chunk":
+                data = tts_chunk_to_json(data)
+            yield sse_event(data)
     return StreamingResponse(tts_generator(), media_type="text/event-stream")
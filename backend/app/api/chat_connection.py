@@ -0,0 +1,310 @@
+"""
+WebSocket聊天连接
+接收循环与对话处理解耦：接收循环持续读取客户端消息（文本、语音帧、控制消息），对话在后台任务中处理
+开启打断（barge-in）时，用户发来新的文本/语音或 {"type": "cancel"} 会立即取消正在进行的回复
+连接断开不会删除会话（断线重连后可继续对话），客户端发送 {"type": "end-session"} 才结束会话
+"""
+import asyncio
+from typing import Dict, List, Optional, Any
+from fastapi import WebSocket, WebSocketDisconnect
+from app.services.chat_servers import chat_service
+from app.services.asr import asr_service
+from app.services.tts import tts_chunk_to_json, pack_tts_chunk
+from app.core.config import settings
+from app.core import fast_json
+from app.core.metrics import WS_FRAMES_SENT, WS_AUDIO_BYTES_SENT
+
+# 客户端控制消息类型（JSON文本帧）
+CONTROL_TYPES = {"audio-end", "tts-ack", "cancel", "end-session"}
+
+
+class ChatConnection:
+    """单个WebSocket连接的会话处理"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        session_id: str,
+        enable_tts: bool = True,
+        audio_stream: bool = False,
+        binary_audio: bool = False,
+        tts_window: int = 0,
+        barge_in: bool = True,
+        coalesce_ms: int = 0,
+        coalesce_chars: int = 64
+    ):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.enable_tts = enable_tts
+        # audio_stream=True：一句话可分多帧发送，以 {"type": "audio-end"} 结束
+        # audio_stream=False：每个二进制消息即一句完整的话（兼容旧客户端）
+        self.audio_stream = audio_stream
+        # binary_audio=True：TTS音频以二进制帧发送（帧头见TTS_FRAME_HEADER），其余事件仍为JSON
+        self.binary_audio = binary_audio
+        # 当前回复的语句编号，写入二进制帧头供客户端区分不同回复的音频
+        self._utterance_id = 0
+        # tts_window>0：按客户端播放进度发送音频，最多领先 tts_window 块未确认
+        # 客户端每播放完一块回复 {"type": "tts-ack", "seq": n}
+        self.tts_window = tts_window
+        self._audio_queue: asyncio.Queue = asyncio.Queue()
+        self._acked = (0, -1)  # (语句编号, 已确认的最大块序号)
+        self._sending_utterance = 0  # 音频发送任务正在发送的语句编号
+        self._ack_event = asyncio.Event()
+        self._cancelled_utterance = 0  # 已取消的最大语句编号，其音频不再发送
+        # barge_in=True：新的一轮输入到达时取消当前回复（停止LLM和TTS、关闭上游连接）
+        # barge_in=False：按顺序逐轮处理
+        self.barge_in = barge_in
+        self._turn_task: Optional[asyncio.Task] = None
+        # 待处理的对话轮次：("text", 用户文本) 或 ("audio", 语音帧队列)
+        self._turns: asyncio.Queue = asyncio.Queue()
+        # 当前正在接收的语音帧队列（None作为结束标记）
+        self._utterance: Optional[asyncio.Queue] = None
+        # coalesce_ms>0：llm-token合并发送，首个Token最多等待coalesce_ms毫秒，或累积coalesce_chars个字符立即发送
+        self.coalesce_ms = coalesce_ms
+        self.coalesce_chars = coalesce_chars
+        self._pending_tokens: List[str] = []
+        self._pending_chars = 0
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._token_sent = False  # 本轮是否已发出过Token（首个Token不等待，保证首字时间）
+        # 合并发送由定时器在独立任务中触发，发送加锁保证帧顺序
+        self._send_lock = asyncio.Lock()
+        # 客户端发送了 end-session：连接结束后删除会话
+        self.session_ended = False
+
+    async def run(self) -> None:
+        """运行连接直到客户端断开或出错"""
+        tasks = [
+            asyncio.create_task(self._receive_loop()),
+            asyncio.create_task(self._process_turns())
+        ]
+        if self.tts_window > 0:
+            tasks.append(asyncio.create_task(self._send_paced_audio()))
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            # 定时器触发的合并发送任务也一并取消，连接关闭后不再发送
+            if self._flush_task is not None:
+                tasks.append(self._flush_task)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        """发送事件给客户端（关闭TTS时过滤音频事件）"""
+        if not self.enable_tts and event["type"].startswith("tts-"):
+            return
+        if event["type"] == "llm-token" and self.coalesce_ms > 0 and self._token_sent:
+            self._buffer_token(event["token"])
+            if self._pending_chars >= self.coalesce_chars:
+                await self._flush_tokens()
+            return
+        # 其他事件发送前先发出已合并的Token，保持顺序
+        await self._flush_tokens()
+        if event["type"] == "llm-token":
+            self._token_sent = True
+        if event["type"] == "tts-chunk":
+            if self.tts_window > 0:
+                # 交给音频发送任务按播放进度发送，不阻塞文本Token的发送
+                self._audio_queue.put_nowait((self._utterance_id, event))
+                return
+            await self._send_audio(self._utterance_id, event)
+            return
+        await self._send_json(event)
+
+    def _buffer_token(self, token: str) -> None:
+        if not self._pending_tokens:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                self.coalesce_ms / 1000, self._on_flush_timer
+            )
+        self._pending_tokens.append(token)
+        self._pending_chars += len(token)
+
+    def _on_flush_timer(self) -> None:
+        self._flush_timer = None
+        self._flush_task = asyncio.create_task(self._flush_tokens())
+
+    async def _flush_tokens(self) -> None:
+        """把累积的Token合并为一个llm-token帧发送"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending_tokens:
+            return
+        token = "".join(self._pending_tokens)
+        self._pending_tokens = []
+        self._pending_chars = 0
+        await self._send_json({"type": "llm-token", "token": token})
+
+    async def _send_json(self, event: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(fast_json.dumps(event))
+        WS_FRAMES_SENT.labels(event["type"]).inc()
+
+    async def _send_audio(self, utterance_id: int, event: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            if self.binary_audio:
+                await self.websocket.send_bytes(pack_tts_chunk(event, utterance_id))
+            else:
+                await self.websocket.send_text(fast_json.dumps(tts_chunk_to_json(event)))
+        WS_FRAMES_SENT.labels("tts-chunk").inc()
+        if "audio_bytes" in event:
+            WS_AUDIO_BYTES_SENT.inc(len(event["audio_bytes"]))
+
+    async def _send_paced_audio(self) -> None:
+        """按客户端播放确认发送音频：未确认的块数达到窗口大小时等待"""
+        while True:
+            utterance_id, event = await self._audio_queue.get()
+            self._sending_utterance = utterance_id
+            while utterance_id > self._cancelled_utterance:
+                acked_utterance, acked_seq = self._acked
+                if acked_utterance != utterance_id:
+                    acked_seq = -1
+                if event["seq"] - acked_seq <= self.tts_window:
+                    break
+                self._ack_event.clear()
+                try:
+                    await asyncio.wait_for(self._ack_event.wait(), timeout=settings.TTS_ACK_TIMEOUT)
+                except asyncio.TimeoutError:
+                    # 客户端未及时确认，不再等待
+                    break
+            if utterance_id > self._cancelled_utterance:
+                await self._send_audio(utterance_id, event)
+
+    async def _receive_loop(self) -> None:
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                self._on_audio_frame(message["bytes"])
+            elif message.get("text") is not None:
+                control = self._parse_control(message["text"])
+                if control and control["type"] == "end-session":
+                    self.session_ended = True
+                    return
+                if control:
+                    self._on_control(control)
+                else:
+                    self._turns.put_nowait(("text", message["text"]))
+
+    @staticmethod
+    def _parse_control(text: str) -> Optional[Dict[str, Any]]:
+        """识别控制消息，普通聊天文本返回None"""
+        if not text.startswith("{"):
+            return None
+        try:
+            data = fast_json.loads(text)
+        except fast_json.JSONDecodeError:
+            return None
+        if isinstance(data, dict) and data.get("type") in CONTROL_TYPES:
+            return data
+        return None
+
+    def _on_audio_frame(self, data: bytes) -> None:
+        """收到一帧语音：流式模式下追加到当前这句话，否则作为完整一句"""
+        if not self.audio_stream:
+            frames: asyncio.Queue = asyncio.Queue()
+            frames.put_nowait(data)
+            frames.put_nowait(None)
+            self._turns.put_nowait(("audio", frames))
+            return
+        if self._utterance is None:
+            # 新的一句话：立即排队，识别与后续帧的接收并行进行
+            self._utterance = asyncio.Queue()
+            self._turns.put_nowait(("audio", self._utterance))
+        self._utterance.put_nowait(data)
+
+    def _on_control(self, control: Dict[str, Any]) -> None:
+        if control["type"] == "cancel":
+            # 客户端主动打断：取消当前回复，不开始新的一轮
+            if self._turn_task is not None:
+                self._turn_task.cancel()
+        elif control["type"] == "audio-end" and self._utterance is not None:
+            self._utterance.put_nowait(None)
+            self._utterance = None
+        elif control["type"] == "tts-ack":
+            # 未携带语句编号时视为确认正在发送的回复
+            utterance_id = control.get("utterance_id", self._sending_utterance)
+            acked_utterance, acked_seq = self._acked
+            seq = int(control.get("seq", -1))
+            if utterance_id != acked_utterance or seq > acked_seq:
+                self._acked = (utterance_id, seq)
+                self._ack_event.set()
+
+    async def _process_turns(self) -> None:
+        """逐轮启动对话任务：打断模式下新一轮开始前先取消上一轮，否则等待上一轮结束"""
+        try:
+            while True:
+                kind, payload = await self._turns.get()
+                if self._turn_task is not None:
+                    if self.barge_in:
+                        self._turn_task.cancel()
+                    # 等待上一轮收尾（包括记录被打断的部分回复），再开始新的一轮
+                    await asyncio.gather(self._turn_task, return_exceptions=True)
+                self._turn_task = asyncio.create_task(self._run_turn(kind, payload))
+        finally:
+            if self._turn_task is not None:
+                self._turn_task.cancel()
+                await asyncio.gather(self._turn_task, return_exceptions=True)
+
+    async def _run_turn(self, kind: str, payload: Any) -> None:
+        try:
+            if kind == "text":
+                await self._chat(payload)
+            else:
+                await self._transcribe_and_chat(payload)
+            # 本轮结束，不再等待合并窗口
+            await self._flush_tokens()
+        except asyncio.CancelledError:
+            self._drop_pending_audio(self._utterance_id)
+            await self.send({"type": "chat-cancelled", "utterance_id": self._utterance_id})
+            raise
+        except Exception as e:
+            await self.send({"type": "llm-error", "message": f"对话处理失败：{str(e)}"})
+
+    def _drop_pending_audio(self, utterance_id: int) -> None:
+        """丢弃被取消的回复中尚未发送的音频"""
+        self._cancelled_utterance = max(self._cancelled_utterance, utterance_id)
+        # 唤醒可能正在等待播放确认的发送任务
+        self._ack_event.set()
+        kept = []
+        while not self._audio_queue.empty():
+            item = self._audio_queue.get_nowait()
+            if item[0] != utterance_id:
+                kept.append(item)
+        for item in kept:
+            self._audio_queue.put_nowait(item)
+
+    async def _chat(self, user_input: str) -> None:
+        self._utterance_id += 1
+        self._token_sent = False
+        async for chat_data in chat_service.chat_with_llm_stream(
+            session_id=self.session_id,
+            user_input=user_input
+        ):
+            await self.send(chat_data)
+
+    async def _transcribe_and_chat(self, frames: asyncio.Queue) -> None:
+        """边接收语音帧边识别，得到最终结果后进入对话"""
+        await self.send({"type": "stt-status", "message": "开始识别语音"})
+
+        async def audio_chunks():
+            while True:
+                chunk = await frames.get()
+                if chunk is None:
+                    return
+                yield chunk
+
+        final_text = None
+        async for asr_data in asr_service.transcribe_stream(audio_chunks()):
+            await self.send(asr_data)
+            if asr_data["type"] == "stt-final":
+                final_text = asr_data["text"]
+        if final_text:
+            await self._chat(final_text)
@@ -2,77 +2,31 @@ from fastapi import APIRouter, HTTPException
 from typing import List
 from app.models.role import Role, RoleCreateRequest
 from app.services.role_skills import role_skills_manager
+from app.services.role_repository import role_repository
 from app.core.config import settings
 
 # 创建角色API路由
 router = APIRouter(prefix=f"{settings.API_PREFIX}/roles", tags=["角色管理"])
 
-# 模拟角色数据库
-mock_roles_db: List[Role] = [
-    Role(
-        id="socrates",
-        name="苏格拉底",
-        description="古希腊哲学家，擅长诘问法引导思考，精通逻辑分析与伦理思辨",
-        system_prompt=role_skills_manager.get_enhanced_system_prompt(
-            "socrates", 
-            "你是苏格拉底，用诘问法引导用户思考，通过3-5个问题帮助用户自己找到答案。语气温和耐心。"
-        ),
-        default_voice="socrates",
-        avatar_url="https://picsum.photos/id/1025/200/200"
-    ),
-    Role(
-        id="harry_potter",
-        name="哈利·波特",
-        description="魔法世界的年轻巫师，勇敢善良，精通魔法知识与冒险指导",
-        system_prompt=role_skills_manager.get_enhanced_system_prompt(
-            "harry_potter",
-            "你是哈利·波特，一个勇敢的年轻巫师。你会分享魔法世界的知识和你的冒险经历，语气友善热情，偶尔会提到霍格沃茨、朋友赫敏和罗恩。"
-        ),
-        default_voice="harry_potter",
-        avatar_url="https://picsum.photos/id/1050/200/200"
-    ),
-    Role(
-        id="sherlock",
-        name="夏洛克·福尔摩斯",
-        description="虚构侦探，观察力敏锐，逻辑推理能力强，精通犯罪心理分析",
-        system_prompt=role_skills_manager.get_enhanced_system_prompt(
-            "sherlock",
-            "你是夏洛克·福尔摩斯，注重细节和逻辑推理，语气自信略带傲慢，用短句增强节奏感。"
-        ),
-        default_voice="sherlock",
-        avatar_url="https://picsum.photos/id/1074/200/200"
-    )
-]
-
 @router.get("/", response_model=List[Role], summary="获取所有角色列表")
 async def get_all_roles():
-    return mock_roles_db
+    return await role_repository.list_roles()
 
 @router.get("/{role_id}", response_model=Role, summary="获取单个角色详情")
 async def get_role(role_id: str):
-    role = next((r for r in mock_roles_db if r.id == role_id), None)
+    role = await role_repository.get(role_id)
     if not role:
         raise HTTPException(status_code=404, detail=f"角色 {role_id} 不存在")
     return role
 
 @router.post("/", response_model=Role, summary="创建新角色")
 async def create_role(role_req: RoleCreateRequest):
-    role_id = role_req.name.lower().replace(" ", "_") + f"_{len(mock_roles_db)}"
-    new_role = Role(
-        id=role_id,
-        name=role_req.name,
-        description=role_req.description,
-        system_prompt=role_req.system_prompt,
-        default_voice=role_req.default_voice,
-        avatar_url=f"https://picsum.photos/id/{1080 + len(mock_roles_db)}/200/200"
-    )
-    mock_roles_db.append(new_role)
-    return new_role
+    return await role_repository.create(role_req)
 
 @router.get("/{role_id}/skills", summary="获取角色技能列表")
 async def get_role_skills(role_id: str):
     """获取指定角色的所有技能"""
-    role = next((r for r in mock_roles_db if r.id == role_id), None)
+    role = await role_repository.get(role_id)
     if not role:
         raise HTTPException(status_code=404, detail=f"角色 {role_id} 不存在")
     
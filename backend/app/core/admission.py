@@ -0,0 +1,226 @@
+"""
+上游调用准入控制
+每个服务商（如 llm:zhipu、tts:xunfei）限制并发调用数，超出时按优先级排队：
+实时WebSocket对话优先于 /api/chat/text、/api/chat/tts 等后台请求；排队超过期限直接返回“服务繁忙”，
+被服务商限流（HTTP 429）时按 Retry-After 暂停该服务商的准入并重新排队
+排队期间向客户端发送 {"type": "chat-queued"} 事件
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import ADMISSION_QUEUE_SECONDS, ADMISSION_REJECTED, ADMISSION_RATE_LIMITED
+
+# 请求优先级（数值越小越优先）
+PRIORITY_INTERACTIVE = 0  # WebSocket实时对话
+PRIORITY_BACKGROUND = 1  # HTTP接口、预热脚本等
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderGate:
+    """单个服务商的并发闸门：按（优先级, 到达顺序）放行"""
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        # 等待队列：(优先级, 序号, future)，被放弃的future惰性跳过
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self.paused_until = 0.0  # 限流暂停到的时间点
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+
+    def _can_admit(self) -> bool:
+        return self.active < self.limit and time.monotonic() >= self.paused_until
+
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    def try_acquire(self) -> bool:
+        """无人排队且有空闲名额时直接放行"""
+        if self.queued() == 0 and self._can_admit():
+            self.active += 1
+            return True
+        return False
+
+    def enqueue(self, priority: int) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        self._wake()
+        return waiter
+
+    def position(self, waiter: asyncio.Future) -> int:
+        """排在前面的等待者数量"""
+        for priority, order, item in self._waiters:
+            if item is waiter:
+                return sum(
+                    1 for p, o, other in self._waiters
+                    if not other.done() and (p, o) < (priority, order)
+                )
+        return 0
+
+    def abandon(self, waiter: asyncio.Future) -> None:
+        """放弃排队（超时或调用方取消）；若恰好已被放行则归还名额"""
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+        else:
+            waiter.cancel()
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    def pause(self, seconds: float) -> None:
+        """服务商限流：暂停准入一段时间"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self._wake()
+
+    def _wake(self) -> None:
+        """按优先级放行等待者；处于限流暂停时定时唤醒"""
+        while self._waiters and self._can_admit():
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue
+            self.active += 1
+            waiter.set_result(True)
+        delay = self.paused_until - time.monotonic()
+        if delay > 0 and self._waiters and self._wake_handle is None:
+            def wake():
+                self._wake_handle = None
+                self._wake()
+            self._wake_handle = asyncio.get_running_loop().call_later(delay, wake)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued(),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+        }
+
+
+class AdmissionController:
+    """所有服务商闸门的集合"""
+
+    def __init__(self):
+        self._gates: Dict[str, ProviderGate] = {}
+
+    def gate(self, name: str) -> ProviderGate:
+        gate = self._gates.get(name)
+        if gate is None:
+            limit = settings.admission_max_concurrency_map.get(name, settings.admission_default_concurrency)
+            gate = self._gates[name] = ProviderGate(name, limit, settings.ADMISSION_MAX_QUEUE)
+        return gate
+
+    @staticmethod
+    def _queue_timeout(priority: int) -> float:
+        if priority <= PRIORITY_INTERACTIVE:
+            return settings.ADMISSION_QUEUE_TIMEOUT_INTERACTIVE
+        return settings.ADMISSION_QUEUE_TIMEOUT_BACKGROUND
+
+    async def run(
+        self,
+        service: str,
+        provider: str,
+        priority: int,
+        call: Callable[[], AsyncGenerator[Any, None]],
+        announce_grant: bool = False
+    ) -> AsyncGenerator[Any, None]:
+        """在准入控制下执行一次服务商流式调用，原样转发其输出
+        service: "llm" 或 "tts"，出错时产出对应的 llm-error / tts-error 事件；
+        本地排队被拒（队列满或排队超时）的错误带 "source": "admission"，与服务商返回的错误区分
+        （服务商客户端等待本地连接池超时同样如此标记，见 app/core/http_client.py 的 pool_timeout_fields）
+        announce_grant：排队后拿到名额时产出 {"type": "chat-admitted"}（供LLM路由从此时开始计算首Token时间）"""
+        if not settings.ADMISSION_ENABLED:
+            async for item in call():
+                yield item
+            return
+
+        name = f"{service}:{provider}"
+        error_type = f"{service}-error"
+        gate = self.gate(name)
+        deadline = time.monotonic() + self._queue_timeout(priority)
+        retries = 0
+        queued_reason: Dict[str, Any] = {}
+        while True:
+            # 排队等待名额
+            enqueued_at = time.monotonic()
+            if not gate.try_acquire():
+                if gate.queued() >= gate.max_queue:
+                    ADMISSION_REJECTED.labels(name, "queue_full").inc()
+                    yield {"type": error_type, "message": "服务繁忙，请稍后再试", "status": 503, "source": "admission"}
+                    return
+                waiter = gate.enqueue(priority)
+                try:
+                    yield {
+                        "type": "chat-queued",
+                        "service": service,
+                        "provider": provider,
+                        "position": gate.position(waiter),
+                        **queued_reason,
+                    }
+                    await asyncio.wait({waiter}, timeout=max(0.0, deadline - time.monotonic()))
+                except BaseException:
+                    gate.abandon(waiter)
+                    raise
+                if not waiter.done():
+                    gate.abandon(waiter)
+                    ADMISSION_REJECTED.labels(name, "timeout").inc()
+                    yield {"type": error_type, "message": "服务繁忙，排队超时", "status": 503, "source": "admission"}
+                    return
+                if announce_grant:
+                    yield {"type": "chat-admitted", "service": service, "provider": provider}
+            ADMISSION_QUEUE_SECONDS.labels(name).observe(time.monotonic() - enqueued_at)
+
+            # 执行调用；只有第一条输出是限流错误时才重试（已输出的内容无法撤回）
+            rate_limited = None
+            stream = call()
+            try:
+                first = True
+                async for item in stream:
+                    if first and isinstance(item, dict) and item.get("type") == error_type \
+                            and item.get("status") == 429:
+                        rate_limited = item
+                        break
+                    first = False
+                    yield item
+            finally:
+                await stream.aclose()
+                gate.release()
+            if rate_limited is None:
+                return
+
+            ADMISSION_RATE_LIMITED.labels(name).inc()
+            retries += 1
+            delay = parse_retry_after(rate_limited.get("retry_after"))
+            if delay is None:
+                delay = settings.ADMISSION_BACKOFF_SECONDS * 2 ** (retries - 1)
+            gate.pause(delay)
+            if retries > settings.ADMISSION_RATE_LIMIT_RETRIES or time.monotonic() + delay > deadline:
+                yield rate_limited
+                return
+            queued_reason = {"reason": "rate_limited", "retry_after": round(delay, 3)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: gate.stats() for name, gate in self._gates.items()}
+
+
+# 创建全局准入控制实例
+admission = AdmissionController()
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 import os
-from typing import Optional, List
+from typing import Optional, List, Dict
 import json
 
 class Settings(BaseSettings):
@@ -26,19 +26,89 @@ class Settings(BaseSettings):
     BAIDU_APP_ID: str = ""
     BAIDU_API_KEY: str = ""
     BAIDU_SECRET_KEY: str = ""
+
+    # 访问令牌管理（百度等按令牌鉴权的服务商）
+    TOKEN_REFRESH_MARGIN_SECONDS: float = 600.0  # 到期前多少秒在后台提前刷新
+    TOKEN_DEFAULT_TTL_SECONDS: float = 3600.0  # 服务商未返回有效期时假定的有效期
+    TOKEN_FETCH_RETRY_SECONDS: float = 5.0  # 获取失败后的重试间隔，期间的请求直接失败，不重复请求令牌接口
     
-    # 语音服务选择："openai", "baidu", "xunfei"
+    # 语音服务选择："openai", "baidu", "xunfei", "loopback"
     ASR_PROVIDER: str = "xunfei"
     TTS_PROVIDER: str = "xunfei"
     
-    # LLM服务选择："openai" 或 "zhipu" 或 "qwen"
+    # LLM服务选择："openai" 或 "zhipu" 或 "qwen" 或 "loopback"
     LLM_PROVIDER: str = "zhipu"
 
-    # 数据库配置
+    # LLM多服务商路由：除LLM_PROVIDER外可参与选路的服务商（JSON数组），如 '["qwen", "openai"]'
+    # 为空时只使用LLM_PROVIDER；未配置密钥的服务商自动跳过
+    LLM_ROUTER_PROVIDERS: str = '[]'
+    LLM_ROUTER_WINDOW: int = 50  # 滚动统计的最近调用次数
+    LLM_ROUTER_WINDOW_SECONDS: float = 300.0  # 滚动统计只看最近多少秒内的调用
+    LLM_ROUTER_DEFAULT_TTFT: float = 1.0  # 无样本时假定的首Token时间（秒）
+    LLM_FIRST_TOKEN_TIMEOUT: float = 15.0  # 首Token超时（秒），超时切换下一个服务商
+    LLM_HEDGE_DELAY_MS: float = 0  # 对冲延迟（毫秒）：主服务商超过此时间未出首Token则并行请求下一个，0表示关闭
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 3  # 连续失败多少次后熔断
+    LLM_CIRCUIT_RESET_SECONDS: float = 30.0  # 熔断持续时间，到期后放行一个试探请求
+
+    # 上游调用准入控制：按服务商限制并发，超出时按优先级排队（实时对话优先）
+    ADMISSION_ENABLED: bool = True
+    # 各服务商并发上限（JSON对象），键为 "llm:服务商" 或 "tts:服务商"，如 '{"llm:zhipu": 20}'
+    ADMISSION_MAX_CONCURRENCY: str = '{}'
+    # 未单独配置的服务商的并发上限；为空时等于 HTTP_MAX_CONNECTIONS_PER_HOST，
+    # 放行的流式调用不会超过上游连接数而在连接池里等待（等待超时会被误当作服务商故障）
+    ADMISSION_DEFAULT_CONCURRENCY: Optional[int] = None
+    ADMISSION_MAX_QUEUE: int = 200  # 每个服务商最多排队数，超出直接返回繁忙
+    ADMISSION_QUEUE_TIMEOUT_INTERACTIVE: float = 5.0  # 实时对话最长排队时间（秒）
+    ADMISSION_QUEUE_TIMEOUT_BACKGROUND: float = 30.0  # 后台请求最长排队时间（秒）
+    ADMISSION_RATE_LIMIT_RETRIES: int = 2  # 被限流（429）后最多重试次数
+    ADMISSION_BACKOFF_SECONDS: float = 1.0  # 无Retry-After时的初始退避时间，每次翻倍
+
+    # 回环服务商配置（压测用，不访问外部服务）
+    LOOPBACK_SEED: int = 42  # 随机种子，相同输入+相同种子结果完全一致
+    LOOPBACK_TTFT_MS: float = 300  # 首Token延迟（毫秒）
+    LOOPBACK_TOKENS_PER_SECOND: float = 30  # 输出速率，0表示不限速
+    LOOPBACK_REPLY_TOKENS_MEAN: int = 80  # 回复长度（Token）均值
+    LOOPBACK_REPLY_TOKENS_STDDEV: int = 20  # 回复长度标准差
+    LOOPBACK_ERROR_RATE: float = 0.0  # 错误注入概率
+    LOOPBACK_ASR_LATENCY_MS: float = 200  # 音频结束到返回识别结果的延迟
+    LOOPBACK_TTS_LATENCY_MS: float = 150  # TTS首包延迟
+    LOOPBACK_TTS_BITRATE_KBPS: int = 48  # 合成音频码率
+    LOOPBACK_TTS_CHARS_PER_SECOND: float = 4.5  # 朗读语速（字/秒），决定音频时长
+
+    # LLM响应缓存：相同请求直接回放缓存的回复
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_ROLES: str = '[]'  # 开启缓存的角色id列表（JSON数组），默认不对任何角色缓存
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_TTL_SECONDS: int = 3600
+
+    # 数据库配置：sqlite:///路径 或 postgresql://...，未配置时使用backend/data/app.db
     DATABASE_URL: Optional[str] = None
+    ROLE_CACHE_TTL_SECONDS: int = 60  # 角色读缓存有效期（秒），多worker下新角色最迟在此时间后可见
+    ROLE_MISS_CACHE_TTL_SECONDS: float = 5  # 不存在的角色id的缓存时间（秒），避免反复查库
+
+    # 角色技能按轮选择：按用户本轮输入挑选最相关的技能写入System Prompt，而不是每轮发送全部技能
+    SKILL_ROUTER_ENABLED: bool = True  # 关闭时每轮都注入角色的全部技能
+    SKILL_ROUTER_TOP_K: int = 2  # 每轮最多注入的技能数
+    SKILL_ROUTER_MIN_SCORE: float = 1.0  # 相关度低于此值的技能不注入
+    SKILL_ROUTER_FALLBACK: str = "names"  # 没有相关技能时："names" 只列技能名称和简介，"all" 注入全部技能，"none" 不注入
+
+    # 对话日志：每条用户/AI消息连同耗时和Token用量追加写入数据库（DATABASE_URL），后台批量写入
+    CONVERSATION_LOG_ENABLED: bool = True
+    CONVERSATION_LOG_QUEUE_SIZE: int = 10000  # 待写入队列上限，数据库写入停滞时队列满即产生背压
+    CONVERSATION_LOG_BATCH_SIZE: int = 200  # 每批最多写入条数
+    CONVERSATION_LOG_FLUSH_INTERVAL: float = 0.2  # 攒批等待时间（秒）
+    CONVERSATION_LOG_ENQUEUE_TIMEOUT: float = 0.05  # 队列满时最多等待（秒），超时丢弃该条并计数，不拖慢对话
+    CONVERSATION_LOG_SHUTDOWN_TIMEOUT: float = 5.0  # 应用关闭时等待队列写完的最长时间（秒）
+
+    # 批量文本聊天（/api/chat/batch）：一个请求内并发执行多条文本聊天，按完成顺序流式返回
+    BATCH_MAX_ITEMS: int = 1000  # 单个请求最多条数
+    BATCH_MAX_CONCURRENCY: int = 8  # 单个请求内同时进行的对话数（仍受LLM准入控制的全局并发限制）
     
     # Redis配置
     REDIS_URL: Optional[str] = None
+
+    # 会话存储后端："memory"（默认，单进程）或 "redis"（多worker/多节点共享）
+    SESSION_BACKEND: str = "memory"
     
     # 应用配置
     DEBUG: bool = True
@@ -49,10 +119,41 @@ class Settings(BaseSettings):
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
 
+    # HTTP连接池配置（所有上游服务共享）
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20  # 每个上游主机最大连接数
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10  # 每个上游主机保持的空闲长连接数
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0  # 空闲长连接保留时间（秒）
+    HTTP_CONNECT_TIMEOUT: float = 5.0  # 建连超时（秒）
+    HTTP_READ_TIMEOUT: float = 30.0  # 读写超时（秒）
+    HTTP_POOL_TIMEOUT: float = 10.0  # 等待空闲连接超时（秒）
+    HTTP2_ENABLED: bool = False  # 是否启用HTTP/2（需安装h2）
+
+    # 流水线TTS配置：LLM输出按句切分后并发合成
+    TTS_PIPELINE_ENABLED: bool = True
+    TTS_PIPELINE_CONCURRENCY: int = 2  # 同时合成的句子数
+    TTS_SEGMENT_MIN_CHARS: int = 8  # 短于该长度的句子与下一句合并
+
+    # TTS音频分块与发送节奏
+    TTS_CHUNK_SIZE: int = 1024  # 每个tts-chunk携带的音频字节数
+    TTS_ACK_TIMEOUT: float = 5.0  # 按客户端播放确认发送时，等待确认的最长时间（秒），超时后不再等待
+
+    # WebSocket Token合并：把多个llm-token合并为一帧发送，减少帧数和JSON编码次数
+    WS_TOKEN_COALESCE_MS: int = 30  # 首个Token最多等待多久（毫秒）就发送，0表示逐Token发送
+    WS_TOKEN_COALESCE_CHARS: int = 64  # 累积字符数达到该值立即发送
+
+    # TTS音频磁盘缓存：相同文本+音色直接返回已合成的音频
+    TTS_CACHE_ENABLED: bool = True
+    TTS_CACHE_DIR: Optional[str] = None  # 默认backend/data/tts_cache
+    TTS_CACHE_MAX_BYTES: int = 512 * 1024 * 1024  # 缓存目录容量上限，超出按LRU淘汰
+
     # 服务配置
     API_PREFIX: str = "/api"
     WS_PREFIX: str = "/ws"
-    MAX_CONVERSATION_HISTORY: int = 20  # 对话历史最大长度
+    MAX_CONVERSATION_HISTORY: int = 100  # 对话历史最大条数（兜底上限，主要按Token预算截断）
+    HISTORY_TOKEN_BUDGET: int = 3000  # 每轮发送的对话历史Token预算（不含System Prompt）
+    LLM_REPLY_RESERVED_TOKENS: int = 1000  # 为模型回复预留的Token数
+    MAX_SESSIONS: int = 10000  # 单进程最多保留的会话数，超出按LRU淘汰
+    SESSION_TTL_SECONDS: int = 1800  # 会话空闲超时（秒）
     
     @property
     def cors_origins_list(self) -> List[str]:
@@ -62,6 +163,37 @@ class Settings(BaseSettings):
         except:
             return ["http://localhost:3000"]
 
+    @property
+    def llm_router_providers_list(self) -> List[str]:
+        """将LLM_ROUTER_PROVIDERS字符串转换为列表"""
+        try:
+            return json.loads(self.LLM_ROUTER_PROVIDERS)
+        except:
+            return []
+
+    @property
+    def admission_max_concurrency_map(self) -> Dict[str, int]:
+        """将ADMISSION_MAX_CONCURRENCY字符串转换为字典"""
+        try:
+            return json.loads(self.ADMISSION_MAX_CONCURRENCY)
+        except:
+            return {}
+
+    @property
+    def admission_default_concurrency(self) -> int:
+        """未单独配置的服务商的并发上限"""
+        if self.ADMISSION_DEFAULT_CONCURRENCY is None:
+            return self.HTTP_MAX_CONNECTIONS_PER_HOST
+        return self.ADMISSION_DEFAULT_CONCURRENCY
+
+    @property
+    def llm_cache_roles_list(self) -> List[str]:
+        """将LLM_CACHE_ROLES字符串转换为列表"""
+        try:
+            return json.loads(self.LLM_CACHE_ROLES)
+        except:
+            return []
+
     class Config:
         # 从backend根目录的.env文件加载配置
         env_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), ".env")
@@ -0,0 +1,46 @@
+"""
+数据库连接
+根据DATABASE_URL选择SQLite（默认）或PostgreSQL，统一返回DB-API连接
+"""
+import os
+import sqlite3
+from typing import Optional, Tuple
+from app.core.config import settings
+
+# backend根目录
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_DATABASE_URL = f"sqlite:///{os.path.join(BACKEND_DIR, 'data', 'app.db')}"
+
+
+def get_database_url(url: Optional[str] = None) -> str:
+    """获取数据库地址，未配置时使用backend/data/app.db"""
+    return url or settings.DATABASE_URL or DEFAULT_DATABASE_URL
+
+
+def is_postgres(url: str) -> bool:
+    return url.startswith(("postgresql://", "postgres://"))
+
+
+def connect(url: Optional[str] = None) -> Tuple[object, str]:
+    """
+    建立数据库连接
+    返回 (连接, SQL参数占位符)：SQLite为"?"，PostgreSQL为"%s"
+    """
+    url = get_database_url(url)
+    if is_postgres(url):
+        import psycopg2
+        conn = psycopg2.connect(url)
+        conn.autocommit = True
+        return conn, "%s"
+
+    if not url.startswith("sqlite:///"):
+        raise ValueError(f"不支持的数据库地址：{url}")
+    path = url[len("sqlite:///"):]
+    if path != ":memory:":
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+    # 连接会被线程池中的写入任务复用，由调用方加锁保证串行
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn, "?"
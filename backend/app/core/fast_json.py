@@ -0,0 +1,58 @@
+"""
+JSON编解码
+每个Token都要经过JSON（上游SSE解析、WebSocket事件、HTTP响应），安装了orjson时使用orjson，
+否则退回标准库json；两种实现输出相同的紧凑UTF-8 JSON（不转义中文）
+"""
+import json
+from typing import Any, Union
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖
+    orjson = None
+
+# 当前使用的实现，供健康检查和压测记录
+BACKEND = "orjson" if orjson is not None else "json"
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，统一捕获这一个即可
+JSONDecodeError = json.JSONDecodeError
+
+if orjson is not None:
+    def dumps_bytes(obj: Any) -> bytes:
+        """序列化为UTF-8字节"""
+        return orjson.dumps(obj)
+
+    def dumps(obj: Any) -> str:
+        """序列化为字符串（WebSocket文本帧、SSE行）"""
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """序列化为UTF-8字节"""
+        return _encoder.encode(obj).encode("utf-8")
+
+    def dumps(obj: Any) -> str:
+        """序列化为字符串（WebSocket文本帧、SSE行）"""
+        return _encoder.encode(obj)
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+def sse_event(data: Any) -> str:
+    """格式化一条SSE事件"""
+    return f"data: {dumps(data)}\n\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """使用上面的编码器的JSON响应，作为应用默认响应类"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
@@ -0,0 +1,158 @@
+"""
+共享HTTP连接池
+所有上游服务（智谱、通义千问、百度等）复用同一组长连接，避免每次调用都重新DNS解析+TCP+TLS握手
+连接池由应用生命周期创建和关闭（见 app/main.py），经服务商注册表注入各服务商客户端（见 app/core/providers.py），
+接口通过依赖 http_pool_dependency 取用；未经生命周期安装连接池时获取会直接报错，不会偷偷创建无人关闭的连接
+"""
+import time
+import httpx
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+from fastapi import Request
+from app.core.config import settings
+from app.core.metrics import UPSTREAM_CONNECT_SECONDS, UPSTREAM_REQUESTS
+
+
+def _http2_available() -> bool:
+    """检查是否安装了HTTP/2依赖（h2）"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HTTPClientPool:
+    """进程级HTTP连接池：按上游主机划分连接，每个主机独立限流"""
+
+    def __init__(self):
+        # 连接池：{origin: httpx.AsyncClient}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        # 使用过的上游主机（统计用，客户端关闭后仍保留）
+        self._origins = set()
+        self.http2 = settings.HTTP2_ENABLED and _http2_available()
+        if settings.HTTP2_ENABLED and not self.http2:
+            print("未安装h2，HTTP/2已降级为HTTP/1.1")
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        """提取URL的scheme://host:port作为连接池键"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    @staticmethod
+    def _connect_tracer(origin: str):
+        """httpcore trace扩展：只有新建连接时才会触发connect_tcp/start_tls事件，复用长连接时零开销"""
+        started = {}
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            step, _, stage = event_name.rpartition(".")
+            if step == "connection.connect_tcp":
+                phase = "tcp"
+            elif step == "connection.start_tls":
+                phase = "tls"
+            else:
+                return
+            if stage == "started":
+                started[phase] = time.perf_counter()
+            elif stage == "complete" and phase in started:
+                UPSTREAM_CONNECT_SECONDS.labels(origin, phase).observe(time.perf_counter() - started.pop(phase))
+
+        return trace
+
+    def _build_client(self, origin: str) -> httpx.AsyncClient:
+        """为单个上游主机创建长连接客户端"""
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            settings.HTTP_READ_TIMEOUT,
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            pool=settings.HTTP_POOL_TIMEOUT,
+        )
+
+        request_counter = UPSTREAM_REQUESTS.labels(origin)
+        self._origins.add(origin)
+
+        async def count_request(request: httpx.Request):
+            request_counter.inc()
+            request.extensions.setdefault("trace", self._connect_tracer(origin))
+
+        return httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            http2=self.http2,
+            event_hooks={"request": [count_request]},
+        )
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        """获取指定URL所在主机的共享客户端（首次使用时创建）"""
+        origin = self._origin(url)
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            client = self._build_client(origin)
+            self._clients[origin] = client
+        return client
+
+    async def close(self) -> None:
+        """关闭所有连接（应用关闭时调用）"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息，用于评估连接池大小是否合适
+        只使用自己记录的计数：请求数与新建连接数之差即复用长连接的请求数"""
+        hosts = {}
+        for origin in sorted(self._origins):
+            requests = UPSTREAM_REQUESTS.labels(origin).value
+            opened = UPSTREAM_CONNECT_SECONDS.labels(origin, "tcp").count
+            hosts[origin] = {
+                "open": origin in self._clients and not self._clients[origin].is_closed,
+                "requests_total": requests,
+                "connections_opened": opened,
+                "reuse_rate": round(1 - opened / requests, 4) if requests else 0.0,
+            }
+        return {
+            "http2": self.http2,
+            "max_connections_per_host": settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            "max_keepalive_connections": settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            "hosts": hosts,
+        }
+
+
+def pool_timeout_fields(error: BaseException) -> Optional[Dict[str, Any]]:
+    """等待本地连接池空闲连接超时（httpx.PoolTimeout，OpenAI SDK会包装为自己的异常）说明本进程过载，
+    返回与准入排队被拒相同的错误字段，路由不把它计为服务商故障；其他异常返回None"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, httpx.PoolTimeout):
+            return {"status": 503, "source": "admission"}
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+# 当前连接池：由应用生命周期（或自行管理连接池的脚本）安装和卸载
+_current_pool: Optional[HTTPClientPool] = None
+
+
+def set_http_pool(pool: Optional[HTTPClientPool]) -> None:
+    """安装当前连接池（None表示卸载）"""
+    global _current_pool
+    _current_pool = pool
+
+
+def get_http_pool() -> HTTPClientPool:
+    """获取当前连接池；尚未安装时抛出RuntimeError"""
+    if _current_pool is None:
+        raise RuntimeError("HTTP连接池未安装：需在应用生命周期内调用，或先调用 install_http_pool")
+    return _current_pool
+
+
+def http_pool_dependency(request: Request) -> HTTPClientPool:
+    """FastAPI依赖：应用生命周期创建的连接池"""
+    return request.app.state.http_pool
@@ -0,0 +1,91 @@
+"""
+LLM响应缓存
+相同（服务商、模型、采样参数、消息列表）的请求直接回放缓存的Token序列，不再调用上游
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+
+class LLMResponseCache:
+    """LRU + TTL的LLM回复缓存，按Token序列保存以便原样回放"""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # {缓存键: (Token列表, 过期时间)}
+        self._entries: "OrderedDict[str, Tuple[List[str], float]]" = OrderedDict()
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(
+        provider: str, model: str, params: Dict[str, Any], messages: List[Dict[str, str]]
+    ) -> str:
+        """计算缓存键：请求内容的SHA-256"""
+        raw = json.dumps(
+            {"provider": provider, "model": model, "params": params, "messages": messages},
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """查找缓存，命中时刷新LRU顺序"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def get_first(self, keys: List[str]) -> Tuple[Optional[str], Optional[List[str]]]:
+        """依次查找多个键（如各候选服务商的键），返回第一个命中的 (键, Token列表)；只计一次命中或未命中"""
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[1] <= now:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return key, entry[0]
+        self.misses += 1
+        return None, None
+
+    def put(self, key: str, tokens: List[str]) -> None:
+        """写入一条完整回复"""
+        self._entries[key] = (list(tokens), time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        self.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
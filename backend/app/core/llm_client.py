@@ -1,55 +1,212 @@
-from openai import AsyncOpenAI
 from app.core.config import settings
-from app.core.zhipu_client import zhipu_client
-from app.core.qwen_client import qwen_client
-from typing import List, Dict, AsyncGenerator
+from app.core.providers import llm_providers, openai_client, openai_configured, openai_status_error
+from app.core.llm_cache import LLMResponseCache
+from app.core.llm_router import LLMRouter
+from app.core.admission import admission, PRIORITY_INTERACTIVE
+from app.core.metrics import (
+    LLM_TTFT_SECONDS, LLM_DURATION_SECONDS, LLM_TOKENS, LLM_TOKENS_TOTAL, LLM_USAGE_TOKENS,
+    LLM_FINISH_REASONS, PROVIDER_ERRORS, elapsed
+)
+from app.core.sse import finish_event
+from app.core.http_client import pool_timeout_fields
+from typing import List, Dict, AsyncGenerator, Optional
+import time
 
 class LLMClient:
     """多大模型支持的LLM客户端：支持OpenAI、智谱AI和通义千问"""
     def __init__(self):
         self.provider = settings.LLM_PROVIDER
-        self.openai_client = None
-        
-        # 初始化OpenAI客户端（如果配置了）
-        if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != "sk-test-placeholder-key":
-            try:
-                self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            except Exception as e:
-                print(f"OpenAI初始化失败: {e}")
-                self.openai_client = None
+        # 服务商（含OpenAI客户端）在首次调用时才加载，见 app/core/providers.py
+
+        # 响应缓存（仅对开启缓存的角色生效）
+        self.response_cache = LLMResponseCache(
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.LLM_CACHE_TTL_SECONDS
+        )
+
+        # 多服务商路由在首次调用时创建（判断备选服务商是否配置需要加载其模块）
+        self._router: Optional[LLMRouter] = None
+        self._router_resolved = False
+
+    @property
+    def router(self) -> Optional[LLMRouter]:
+        """多服务商路由：LLM_PROVIDER优先，LLM_ROUTER_PROVIDERS中已配置密钥的服务商作为备选；
+        只有一个可用服务商时为None"""
+        if not self._router_resolved:
+            providers = [self.provider] + [
+                name for name in settings.llm_router_providers_list
+                if name != self.provider and self.is_configured(name)
+            ]
+            self._router = LLMRouter(self._provider_call, providers) if len(providers) > 1 else None
+            self._router_resolved = True
+        return self._router
+
+    def candidate_providers(self) -> List[str]:
+        """可能处理本轮请求的服务商：启用路由时为全部候选，否则只有LLM_PROVIDER"""
+        return list(self.router.providers) if self.router else [self.provider]
+
+    def is_configured(self, provider: str) -> bool:
+        """服务商是否可用（配置了密钥）"""
+        if provider == "openai":
+            return openai_configured()
+        if provider in llm_providers:
+            return llm_providers.get(provider).is_configured()
+        return False
+
+    def current_model(self, provider: Optional[str] = None) -> str:
+        """服务商（默认当前服务商）使用的模型名称"""
+        provider = provider or self.provider
+        if provider in llm_providers:
+            return llm_providers.get(provider).model
+        return settings.LLM_MODEL_NAME
+
+    def sampling_params(self, provider: Optional[str] = None) -> Dict:
+        """服务商（默认当前服务商）流式调用使用的采样参数"""
+        provider = provider or self.provider
+        if provider in llm_providers:
+            return llm_providers.get(provider).sampling_params
+        return {"temperature": 0.7}
 
     async def stream_chat_completion(
-        self, messages: List[Dict[str, str]]
+        self, messages: List[Dict[str, str]], use_cache: bool = False, priority: int = PRIORITY_INTERACTIVE
     ) -> AsyncGenerator[Dict[str, str], None]:
-        """流式调用LLM，逐Token返回结果"""
-        
-        # 根据配置选择不同的大模型服务
-        if self.provider == "qwen":
-            # 使用通义千问
-            async for result in qwen_client.stream_chat_completion(messages):
+        """流式调用LLM，逐Token返回结果；use_cache=True时相同请求直接回放缓存的回复
+        priority：上游名额紧张时的排队优先级（见 app/core/admission.py）"""
+        if not (use_cache and settings.LLM_CACHE_ENABLED):
+            async for result in self._stream_from_provider(messages, priority):
                 yield result
             return
-        elif self.provider == "zhipu":
-            # 使用智谱AI
-            async for result in zhipu_client.stream_chat_completion(messages):
+
+        # 每个候选服务商（按路由顺序）各有自己的缓存键：故障切换后由备选服务商生成的回复按备选服务商记录，
+        # 主服务商不可用期间同样能命中
+        providers = self.router.ranked() if self.router else [self.provider]
+        cache_keys = {self._cache_key(provider, messages): provider for provider in providers}
+        cache_key, cached_tokens = self.response_cache.get_first(list(cache_keys))
+        if cached_tokens is not None:
+            # 按原Token切分回放，客户端收到的帧结构与实时生成一致（同样以结束事件收尾）
+            for token in cached_tokens:
+                yield {"type": "llm-token", "token": token}
+            yield {**finish_event("stop", None), "provider": cache_keys[cache_key], "cached": True}
+            return
+
+        tokens = []
+        failed = False
+        served_by = self.provider
+        async for result in self._stream_from_provider(messages, priority):
+            if result["type"] == "llm-token":
+                tokens.append(result["token"])
+            elif result["type"] == "llm-error":
+                failed = True
+            elif result["type"] == "llm-finish":
+                served_by = result.get("provider", served_by)
+            yield result
+        # 只缓存完整成功的回复，按实际生成回复的服务商记录
+        if tokens and not failed:
+            self.response_cache.put(self._cache_key(served_by, messages), tokens)
+
+    def _cache_key(self, provider: str, messages: List[Dict[str, str]]) -> str:
+        """服务商（含模型和采样参数）+ 消息列表的缓存键"""
+        return self.response_cache.make_key(
+            provider, self.current_model(provider), self.sampling_params(provider), messages
+        )
+
+    async def _stream_from_provider(
+        self, messages: List[Dict[str, str]], priority: int
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """配置了多个服务商时经路由选择，否则直接调用LLM_PROVIDER"""
+        if self.router:
+            stream = self.router.stream_chat_completion(messages, priority)
+        else:
+            stream = self._provider_call(self.provider, messages, priority)
+        try:
+            async for result in stream:
                 yield result
+        finally:
+            # 调用方提前停止时立即释放上游请求（包括路由中仍在进行的对冲请求）
+            await stream.aclose()
+
+    def _provider_call(
+        self, provider: str, messages: List[Dict[str, str]], priority: int
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """在准入控制下调用单个服务商（排队时间不计入首Token指标）
+        经路由调用时产出 chat-admitted 事件，路由从拿到名额开始计算首Token时间（该事件不会发给客户端）"""
+        return admission.run(
+            "llm", provider, priority,
+            lambda: self._observed(provider, self._provider_stream(provider, messages)),
+            announce_grant=self.router is not None
+        )
+
+    async def _observed(
+        self, provider: str, stream: AsyncGenerator[Dict[str, str], None]
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """记录服务商调用的首Token时间、完整耗时、Token数、用量和失败次数"""
+        start = time.perf_counter()
+        tokens = 0
+        failed = False
+        async for result in stream:
+            if result["type"] == "llm-token":
+                if tokens == 0:
+                    LLM_TTFT_SECONDS.labels(provider).observe(elapsed(start))
+                tokens += 1
+            elif result["type"] == "llm-error":
+                failed = True
+            elif result["type"] == "llm-finish":
+                result["provider"] = provider
+                LLM_FINISH_REASONS.labels(provider, result["finish_reason"]).inc()
+                for kind in ("prompt", "completion"):
+                    count = result["usage"].get(f"{kind}_tokens")
+                    if count:
+                        LLM_USAGE_TOKENS.labels(provider, kind).inc(count)
+            yield result
+        if failed:
+            PROVIDER_ERRORS.labels("llm", provider).inc()
             return
-        elif self.provider == "openai" and self.openai_client:
+        LLM_DURATION_SECONDS.labels(provider).observe(elapsed(start))
+        LLM_TOKENS.labels(provider).observe(tokens)
+        LLM_TOKENS_TOTAL.labels(provider).inc(tokens)
+
+    async def _provider_stream(
+        self, provider: str, messages: List[Dict[str, str]]
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """调用指定服务商流式生成"""
+        
+        # 回环、智谱AI、通义千问等按名称登记的服务商
+        if provider in llm_providers:
+            async for result in llm_providers.get(provider).stream_chat_completion(messages):
+                yield result
+            return
+
+        client = openai_client() if provider == "openai" else None
+        if client:
             # 使用OpenAI
             try:
-                stream = await self.openai_client.chat.completions.create(
+                stream = await client.chat.completions.create(
                     model=settings.LLM_MODEL_NAME,
                     messages=messages,
                     stream=True,
-                    temperature=0.7
+                    stream_options={"include_usage": True},
+                    **self.sampling_params("openai")
                 )
+                finish_reason = None
+                usage = None
                 async for chunk in stream:
-                    token = chunk.choices[0].delta.content
-                    if token:
-                        yield {"type": "llm-token", "token": token}
+                    # 开启include_usage后最后一个块只有usage，没有choices
+                    if chunk.choices:
+                        token = chunk.choices[0].delta.content
+                        if token:
+                            yield {"type": "llm-token", "token": token}
+                        finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    if chunk.usage:
+                        usage = chunk.usage.model_dump()
+                yield finish_event(finish_reason, usage)
                 return
             except Exception as e:
-                yield {"type": "llm-error", "message": f"OpenAI调用失败：{str(e)}"}
+                # 附带状态码和Retry-After，供准入控制识别限流（429）；本地连接池等待超时标记为本地过载
+                yield {
+                    "type": "llm-error",
+                    "message": f"OpenAI调用失败：{str(e)}",
+                    **(openai_status_error(e) or pool_timeout_fields(e) or {})
+                }
                 return
         
         # 如果没有可用的服务，使用模拟回复
@@ -104,13 +261,12 @@ class LLMClient:
     async def get_chat_completion(self, messages: List[Dict[str, str]]) -> str:
         """非流式调用LLM，一次性返回结果"""
         
-        if self.provider == "qwen":
-            return await qwen_client.get_chat_completion(messages)
-        elif self.provider == "zhipu":
-            return await zhipu_client.get_chat_completion(messages)
-        elif self.provider == "openai" and self.openai_client:
+        if self.provider in llm_providers:
+            return await llm_providers.get(self.provider).get_chat_completion(messages)
+        client = openai_client() if self.provider == "openai" else None
+        if client:
             try:
-                response = await self.openai_client.chat.completions.create(
+                response = await client.chat.completions.create(
                     model=settings.LLM_MODEL_NAME,
                     messages=messages,
                     temperature=0.5
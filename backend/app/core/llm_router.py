@@ -0,0 +1,300 @@
+"""
+LLM服务商路由
+在多个已配置的大模型服务商之间选路：按滚动首Token时间和错误率排序，连续失败时熔断，
+首Token发出前出错或超时自动切换到下一个服务商；可选对冲请求（主服务商迟迟不出首Token时
+并行请求下一个服务商，谁先出Token用谁，另一个立即取消）
+只有服务商自身的错误和超时计入熔断：本地准入排队被拒、调用方取消都不算服务商失败；
+首Token时间从拿到准入名额开始计算，不含本地排队时间
+"""
+import asyncio
+import time
+from collections import deque
+from typing import AsyncGenerator, Callable, Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import LLM_ROUTER_EVENTS
+
+# 服务商流式调用：(服务商名, messages, 优先级) -> 事件流
+StreamFactory = Callable[[str, List[Dict[str, str]], int], AsyncGenerator[Dict[str, str], None]]
+
+
+class ProviderHealth:
+    """单个服务商的滚动统计与熔断状态"""
+
+    def __init__(
+        self, name: str, window: int, window_seconds: float, failure_threshold: int, reset_seconds: float
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        # 最近window次调用的 (时间, 首Token秒数) 与 (时间, 是否成功)；
+        # 超过window_seconds的样本不再参与排序，偶发失败后不会永远排在最后
+        self.ttft_samples: Deque[Tuple[float, float]] = deque(maxlen=window)
+        self.outcomes: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None  # 熔断开始时间，None表示未熔断
+        self.trial_in_flight = False  # 半开状态下是否已有试探请求
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        """熔断期间拒绝请求；熔断到期后只放行一个试探请求"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_ttft(self, seconds: float) -> None:
+        self.ttft_samples.append((time.monotonic(), seconds))
+
+    def record_success(self) -> None:
+        self.outcomes.append((time.monotonic(), True))
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.outcomes.append((time.monotonic(), False))
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            # 达到阈值或半开试探失败：（重新）熔断
+            self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """请求被取消（对冲落败等），不计入成败"""
+        self.trial_in_flight = False
+
+    def _recent(self, samples: Deque[Tuple[float, object]]) -> List:
+        cutoff = time.monotonic() - self.window_seconds
+        return [value for at, value in samples if at >= cutoff]
+
+    def ttft_p50(self) -> Optional[float]:
+        recent = self._recent(self.ttft_samples)
+        if not recent:
+            return None
+        ordered = sorted(recent)
+        return ordered[len(ordered) // 2]
+
+    def error_rate(self) -> float:
+        recent = self._recent(self.outcomes)
+        if not recent:
+            return 0.0
+        return recent.count(False) / len(recent)
+
+    def score(self) -> float:
+        """预期首Token时间，错误率越高惩罚越大；无样本时使用默认值"""
+        ttft = self.ttft_p50()
+        if ttft is None:
+            ttft = settings.LLM_ROUTER_DEFAULT_TTFT
+        return ttft * (1 + 4 * self.error_rate())
+
+    def stats(self) -> Dict:
+        ttft = self.ttft_p50()
+        return {
+            "state": self.state,
+            "ttft_p50": round(ttft, 4) if ttft is not None else None,
+            "error_rate": round(self.error_rate(), 4),
+            "samples": len(self._recent(self.outcomes)),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class _Attempt:
+    """一次对某个服务商的调用"""
+
+    def __init__(self, name: str, stream: AsyncGenerator[Dict[str, str], None]):
+        self.name = name
+        self.stream = stream
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + settings.LLM_FIRST_TOKEN_TIMEOUT
+        self.next_event = asyncio.ensure_future(stream.__anext__())
+
+    def queued(self) -> None:
+        """在本地准入排队：暂停首Token计时（排队时长由准入控制的排队超时限制）"""
+        self.deadline = float("inf")
+
+    def admitted(self) -> None:
+        """拿到准入名额：从此刻开始计算首Token时间"""
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + settings.LLM_FIRST_TOKEN_TIMEOUT
+
+    def advance(self) -> None:
+        self.next_event = asyncio.ensure_future(self.stream.__anext__())
+
+    async def cancel(self) -> None:
+        self.next_event.cancel()
+        await asyncio.gather(self.next_event, return_exceptions=True)
+        await self.stream.aclose()
+
+
+class LLMRouter:
+    """多服务商路由"""
+
+    def __init__(self, stream_factory: StreamFactory, providers: List[str]):
+        self.stream_factory = stream_factory
+        self.providers = providers
+        self.health: Dict[str, ProviderHealth] = {
+            name: ProviderHealth(
+                name,
+                window=settings.LLM_ROUTER_WINDOW,
+                window_seconds=settings.LLM_ROUTER_WINDOW_SECONDS,
+                failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                reset_seconds=settings.LLM_CIRCUIT_RESET_SECONDS,
+            )
+            for name in providers
+        }
+
+    def ranked(self) -> List[str]:
+        """按预期首Token时间排序（同分时保持配置顺序），熔断中的服务商排在最后"""
+        order = {name: index for index, name in enumerate(self.providers)}
+        return sorted(
+            self.providers,
+            key=lambda name: (self.health[name].state == "open", self.health[name].score(), order[name])
+        )
+
+    def _next_candidate(self, candidates: List[str]) -> Optional[str]:
+        """取出下一个熔断器允许的服务商"""
+        while candidates:
+            name = candidates.pop(0)
+            if self.health[name].allow_request():
+                return name
+        return None
+
+    async def stream_chat_completion(
+        self, messages: List[Dict[str, str]], priority: int
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """选路并流式返回；首Token之后的错误无法切换（已发给客户端），原样返回"""
+        ranked = self.ranked()
+        candidates = list(ranked)
+        hedge_delay = settings.LLM_HEDGE_DELAY_MS / 1000
+        attempts: List[_Attempt] = []
+        last_error = {"type": "llm-error", "message": "没有可用的大模型服务"}
+        winner: Optional[_Attempt] = None
+        first_event: Optional[Dict[str, str]] = None
+
+        def launch() -> bool:
+            name = self._next_candidate(candidates)
+            if name is None:
+                return False
+            attempts.append(_Attempt(name, self.stream_factory(name, messages, priority)))
+            return True
+
+        def fail(attempt: _Attempt, upstream: bool = True) -> None:
+            """移除失败的调用；只有服务商自身的错误计入熔断"""
+            attempts.remove(attempt)
+            if upstream:
+                self.health[attempt.name].record_failure()
+            else:
+                self.health[attempt.name].release_trial()
+
+        try:
+            if not launch() and ranked:
+                # 全部熔断时仍尝试排名第一的服务商，而不是直接拒绝
+                attempts.append(_Attempt(ranked[0], self.stream_factory(ranked[0], messages, priority)))
+            while winner is None:
+                if not attempts:
+                    if not launch():
+                        yield last_error
+                        return
+                    LLM_ROUTER_EVENTS.labels("failover").inc()
+                    continue
+
+                now = time.monotonic()
+                wake_at = min(attempt.deadline for attempt in attempts)
+                can_hedge = hedge_delay > 0 and len(attempts) == 1 and candidates
+                if can_hedge:
+                    wake_at = min(wake_at, attempts[0].started_at + hedge_delay)
+                done, _ = await asyncio.wait(
+                    [attempt.next_event for attempt in attempts],
+                    timeout=max(0.0, wake_at - now),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    now = time.monotonic()
+                    for attempt in [a for a in attempts if a.deadline <= now]:
+                        # 首Token超时：视为失败，切换服务商
+                        last_error = {"type": "llm-error", "message": f"{attempt.name} 首Token超时"}
+                        await attempt.cancel()
+                        fail(attempt)
+                        LLM_ROUTER_EVENTS.labels("timeout").inc()
+                    if can_hedge and attempts and launch():
+                        LLM_ROUTER_EVENTS.labels("hedge").inc()
+                    continue
+
+                for attempt in [a for a in attempts if a.next_event in done]:
+                    try:
+                        event = attempt.next_event.result()
+                    except StopAsyncIteration:
+                        event = {"type": "llm-error", "message": f"{attempt.name} 返回空回复"}
+                    except Exception as e:
+                        event = {"type": "llm-error", "message": f"{attempt.name} 调用失败：{str(e)}"}
+
+                    if event["type"] == "llm-token":
+                        winner, first_event = attempt, event
+                        break
+                    if event["type"] == "llm-error":
+                        last_error = event
+                        # 本地排队被拒说明本进程过载，不是服务商故障，只切换不熔断
+                        upstream = event.get("source") != "admission"
+                        fail(attempt, upstream)
+                        LLM_ROUTER_EVENTS.labels("provider_error" if upstream else "overloaded").inc()
+                        continue
+                    if event["type"] == "chat-queued":
+                        attempt.queued()
+                    elif event["type"] == "chat-admitted":
+                        attempt.admitted()
+                        attempt.advance()
+                        continue
+                    # 其他状态事件直接透传（空回复的结束事件除外，随后按空回复切换服务商）
+                    if event["type"] != "llm-finish":
+                        yield event
+                    attempt.advance()
+
+            # 取消落败的对冲请求
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.cancel()
+                    self.health[attempt.name].release_trial()
+            if len(attempts) > 1 and winner is not attempts[0]:
+                LLM_ROUTER_EVENTS.labels("hedge_win").inc()
+            attempts = [winner]
+
+            health = self.health[winner.name]
+            health.record_ttft(time.monotonic() - winner.started_at)
+            yield first_event
+            failed = False
+            async for event in winner.stream:
+                if event["type"] == "llm-error":
+                    failed = True
+                yield event
+            if failed:
+                health.record_failure()
+            else:
+                health.record_success()
+            attempts = []
+        finally:
+            # 调用方中途停止（如客户端断开）时释放仍在进行的请求
+            for attempt in attempts:
+                await attempt.cancel()
+                self.health[attempt.name].release_trial()
+
+    def stats(self) -> Dict:
+        return {
+            "providers": {name: self.health[name].stats() for name in self.providers},
+            "ranking": self.ranked(),
+            "events": {
+                event: LLM_ROUTER_EVENTS.labels(event).value
+                for event in ("failover", "timeout", "hedge", "hedge_win", "provider_error", "overloaded")
+            },
+        }
@@ -0,0 +1,132 @@
+"""
+回环（loopback）服务商
+不访问任何外部服务的LLM/ASR/TTS实现，延迟、速率、回复长度、错误率均可配置，
+相同输入+相同种子产出完全相同的结果，用于压测服务端自身开销
+选择方式：LLM_PROVIDER / ASR_PROVIDER / TTS_PROVIDER = "loopback"
+"""
+import asyncio
+import hashlib
+import random
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Union
+from app.core.config import settings
+from app.core.sse import finish_event
+from app.core.token_budget import estimate_tokens
+
+# 回复用词表：包含句末标点，便于分句流水线TTS正常工作
+LOOPBACK_VOCAB = [
+    "我们", "可以", "从", "这个", "问题", "的", "本质", "出发", "思考", "，",
+    "真正", "重要", "的是", "理解", "其中", "逻辑", "关系", "以及", "背后", "原因",
+    "观察", "细节", "推理", "结论", "魔法", "世界", "勇气", "友谊", "智慧", "真理",
+]
+SENTENCE_END_TOKENS = ["。", "！", "？"]
+
+
+def _rng_for(*parts: str) -> random.Random:
+    """由种子和输入内容派生独立的随机数生成器（与进程、调用顺序无关）"""
+    digest = hashlib.sha256("\x1f".join((str(settings.LOOPBACK_SEED), *parts)).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+async def _sleep_until(deadline: float) -> None:
+    """按绝对时间休眠，避免逐次sleep累积误差"""
+    delay = deadline - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+class LoopbackLLM:
+    """回环LLM：按配置的首Token延迟和输出速率生成确定性回复"""
+
+    def __init__(self):
+        self.model = "loopback"
+        self.sampling_params: Dict = {}
+
+    def is_configured(self) -> bool:
+        return True
+
+    def _reply_tokens(self, rng: random.Random) -> List[str]:
+        length = max(1, int(rng.gauss(settings.LOOPBACK_REPLY_TOKENS_MEAN, settings.LOOPBACK_REPLY_TOKENS_STDDEV)))
+        tokens = []
+        for i in range(length):
+            if i % 12 == 11 or i == length - 1:
+                tokens.append(rng.choice(SENTENCE_END_TOKENS))
+            else:
+                tokens.append(rng.choice(LOOPBACK_VOCAB))
+        return tokens
+
+    async def stream_chat_completion(
+        self, messages: List[Dict[str, str]]
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """流式生成：等待首Token延迟后按固定速率逐Token输出"""
+        rng = _rng_for("llm", *(f"{m['role']}:{m['content']}" for m in messages))
+        start = time.monotonic()
+        first_token_at = start + settings.LOOPBACK_TTFT_MS / 1000
+        if rng.random() < settings.LOOPBACK_ERROR_RATE:
+            await _sleep_until(first_token_at)
+            yield {"type": "llm-error", "message": "回环服务商模拟错误"}
+            return
+
+        interval = 1 / settings.LOOPBACK_TOKENS_PER_SECOND if settings.LOOPBACK_TOKENS_PER_SECOND > 0 else 0
+        count = 0
+        for i, token in enumerate(self._reply_tokens(rng)):
+            await _sleep_until(first_token_at + i * interval)
+            yield {"type": "llm-token", "token": token}
+            count += 1
+        prompt_tokens = sum(estimate_tokens(m["content"], "loopback") for m in messages)
+        yield finish_event("stop", {"prompt_tokens": prompt_tokens, "completion_tokens": count})
+
+    async def get_chat_completion(self, messages: List[Dict[str, str]]) -> str:
+        tokens = []
+        async for result in self.stream_chat_completion(messages):
+            if result["type"] == "llm-error":
+                return result["message"]
+            if result["type"] == "llm-token":
+                tokens.append(result["token"])
+        return "".join(tokens)
+
+
+class LoopbackASR:
+    """回环ASR：边接收边消费音频帧，音频结束后按配置延迟返回确定性文本（不产生中间识别文本）"""
+
+    async def transcribe_stream(self, audio_chunks: AsyncIterator[bytes]) -> AsyncGenerator[Dict[str, str], None]:
+        digest = hashlib.sha256()
+        async for chunk in audio_chunks:
+            digest.update(chunk)
+
+        rng = _rng_for("asr", digest.hexdigest())
+        await asyncio.sleep(settings.LOOPBACK_ASR_LATENCY_MS / 1000)
+        if rng.random() < settings.LOOPBACK_ERROR_RATE:
+            yield {"type": "stt-error", "message": "回环服务商模拟错误"}
+            return
+        text = "".join(rng.choice(LOOPBACK_VOCAB) for _ in range(8)) + "？"
+        yield {"type": "stt-final", "text": text, "confidence": 1.0}
+
+
+class LoopbackTTS:
+    """回环TTS：按文本时长和码率生成大小真实的合成音频"""
+
+    def audio_size(self, text: str) -> int:
+        """音频字节数 = 朗读时长 × 码率"""
+        duration = max(len(text), 1) / settings.LOOPBACK_TTS_CHARS_PER_SECOND
+        return int(duration * settings.LOOPBACK_TTS_BITRATE_KBPS * 1000 / 8)
+
+    async def synthesize(
+        self, text: str, voice: str = "alloy"
+    ) -> AsyncGenerator[Union[bytes, Dict[str, str]], None]:
+        rng = _rng_for("tts", voice, text)
+        await asyncio.sleep(settings.LOOPBACK_TTS_LATENCY_MS / 1000)
+        if rng.random() < settings.LOOPBACK_ERROR_RATE:
+            yield {"type": "tts-error", "message": "回环服务商模拟错误"}
+            return
+        remaining = self.audio_size(text)
+        while remaining > 0:
+            size = min(remaining, settings.TTS_CHUNK_SIZE)
+            yield rng.randbytes(size)
+            remaining -= size
+
+
+# 创建回环服务商实例
+loopback_llm = LoopbackLLM()
+loopback_asr = LoopbackASR()
+loopback_tts = LoopbackTTS()
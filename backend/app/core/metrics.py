@@ -0,0 +1,286 @@
+"""
+运行指标
+进程内的计数器、仪表和直方图，通过 /metrics 以Prometheus文本格式导出
+热路径只做字典查找和整数累加：所有更新都发生在事件循环线程内，无需加锁
+"""
+import time
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+# 默认延迟分桶（秒），覆盖从本地回环到慢速上游的范围
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Token数分桶
+TOKEN_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2000, 4000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # 最后一个位置对应 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    """指标基类：按标签值缓存子指标"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """按标签值获取子指标（标签值顺序与 labelnames 一致）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self, values: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self, values: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus文本格式（version 0.0.4）"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def elapsed(start: float) -> float:
+    """自 start（time.perf_counter()）起经过的秒数"""
+    return time.perf_counter() - start
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+
+# 上游连接
+UPSTREAM_CONNECT_SECONDS = registry.histogram(
+    "upstream_connect_seconds", "新建上游连接耗时（phase=tcp为TCP建连，tls为TLS握手）", ("origin", "phase")
+)
+UPSTREAM_REQUESTS = registry.counter(
+    "upstream_requests_total", "发往上游的HTTP请求数", ("origin",)
+)
+
+# LLM
+LLM_TTFT_SECONDS = registry.histogram(
+    "llm_ttft_seconds", "LLM首Token时间", ("provider",)
+)
+LLM_DURATION_SECONDS = registry.histogram(
+    "llm_duration_seconds", "LLM完整回复耗时", ("provider",)
+)
+LLM_TOKENS = registry.histogram(
+    "llm_completion_tokens", "每次回复的Token块数", ("provider",), buckets=TOKEN_BUCKETS
+)
+LLM_TOKENS_TOTAL = registry.counter(
+    "llm_tokens_total", "LLM输出的Token块总数", ("provider",)
+)
+LLM_USAGE_TOKENS = registry.counter(
+    "llm_usage_tokens_total", "服务商报告的Token用量（kind=prompt/completion）", ("provider", "kind")
+)
+LLM_FINISH_REASONS = registry.counter(
+    "llm_finish_reasons_total", "回复结束原因（stop/length等）", ("provider", "reason")
+)
+LLM_STREAM_MALFORMED = registry.counter(
+    "llm_stream_malformed_events_total", "流式响应中无法解析而被跳过的SSE事件数", ("provider",)
+)
+LLM_ROUTER_EVENTS = registry.counter(
+    "llm_router_events_total", "LLM路由事件（failover/timeout/hedge/hedge_win/provider_error/overloaded）", ("event",)
+)
+
+# 语音
+ASR_DURATION_SECONDS = registry.histogram(
+    "asr_duration_seconds", "语音识别耗时（从开始接收音频到得到结果）", ("provider",)
+)
+TTS_DURATION_SECONDS = registry.histogram(
+    "tts_duration_seconds", "语音合成耗时（cached=true为磁盘缓存命中）", ("provider", "cached")
+)
+
+# 错误
+PROVIDER_ERRORS = registry.counter(
+    "provider_errors_total", "服务商调用失败次数", ("service", "provider")
+)
+
+# 准入控制
+ADMISSION_QUEUE_SECONDS = registry.histogram(
+    "admission_queue_seconds", "等待服务商调用名额的排队时间", ("gate",)
+)
+ADMISSION_REJECTED = registry.counter(
+    "admission_rejected_total", "因排队超时或队列已满被拒绝的调用数", ("gate", "reason")
+)
+ADMISSION_RATE_LIMITED = registry.counter(
+    "admission_rate_limited_total", "服务商返回429限流的次数", ("gate",)
+)
+
+# 对话日志
+CONVERSATION_LOG_WRITTEN = registry.counter(
+    "conversation_log_written_total", "写入对话日志的消息数"
+)
+CONVERSATION_LOG_DROPPED = registry.counter(
+    "conversation_log_dropped_total", "未能写入对话日志的消息数（queue_full为队列满，write_error为写入失败）", ("reason",)
+)
+CONVERSATION_LOG_BATCH_SECONDS = registry.histogram(
+    "conversation_log_batch_seconds", "每批对话日志的写入耗时"
+)
+CONVERSATION_LOG_QUEUE_DEPTH = registry.gauge(
+    "conversation_log_queue_depth", "等待写入对话日志的消息数"
+)
+
+# 批量文本聊天
+CHAT_BATCH_ITEMS = registry.counter(
+    "chat_batch_items_total", "批量文本聊天处理的条数（result为ok或error）", ("result",)
+)
+
+# 连接与会话
+WS_CONNECTIONS_ACTIVE = registry.gauge(
+    "ws_connections_active", "当前WebSocket连接数"
+)
+SESSIONS_LIVE = registry.gauge(
+    "sessions_live", "当前存活会话数"
+)
+WS_FRAMES_SENT = registry.counter(
+    "ws_frames_sent_total", "WebSocket发送的帧数（按事件类型）", ("type",)
+)
+WS_AUDIO_BYTES_SENT = registry.counter(
+    "ws_audio_bytes_sent_total", "WebSocket发送的TTS音频字节数"
+)
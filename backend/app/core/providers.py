@@ -0,0 +1,110 @@
+"""
+服务商注册表
+各服务商按名称登记为 "模块:对象" 路径，首次使用时才导入模块、创建实例；
+未使用的服务商SDK（如openai）不会在启动时加载，新Worker冷启动更快
+访问HTTP接口的服务商登记为类，由注册表用应用生命周期安装的连接池创建（见 install_http_pool）
+OpenAI客户端在LLM、ASR、TTS之间共享一个实例
+"""
+from importlib import import_module
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.core.http_client import get_http_pool, set_http_pool, HTTPClientPool
+
+OPENAI_BASE_URL = "https://api.openai.com"
+
+
+class ProviderRegistry:
+    """一类服务（llm/asr/tts）的服务商注册表"""
+
+    def __init__(self, service: str):
+        self.service = service
+        self._targets: Dict[str, str] = {}
+        self._instances: Dict[str, Any] = {}
+        self._http = set()  # 需要注入连接池的服务商
+
+    def register(self, name: str, target: str, http: bool = False) -> None:
+        """登记服务商；target为 "模块路径:对象名"，此时不导入
+        http=True 时对象为类，首次使用时以当前连接池创建实例：cls(pool=...)"""
+        self._targets[name] = target
+        if http:
+            self._http.add(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._targets
+
+    def get(self, name: str) -> Any:
+        """获取服务商实例（首次调用时导入）"""
+        instance = self._instances.get(name)
+        if instance is None:
+            if name not in self._targets:
+                raise KeyError(f"未注册的{self.service}服务商：{name}")
+            module_path, _, attr = self._targets[name].partition(":")
+            target = getattr(import_module(module_path), attr)
+            instance = self._instances[name] = target(pool=get_http_pool()) if name in self._http else target
+        return instance
+
+    def drop_http_clients(self) -> None:
+        """丢弃用旧连接池创建的实例，之后用新安装的连接池重新创建"""
+        for name in self._http:
+            self._instances.pop(name, None)
+
+    def loaded(self) -> Dict[str, bool]:
+        """各服务商是否已加载（健康检查用）"""
+        return {name: name in self._instances for name in self._targets}
+
+
+def openai_configured() -> bool:
+    """是否配置了OpenAI密钥（不导入SDK）"""
+    return bool(settings.OPENAI_API_KEY) and settings.OPENAI_API_KEY != "sk-test-placeholder-key"
+
+
+_openai_client = None
+_openai_failed = False
+
+
+def openai_client():
+    """共享的 AsyncOpenAI 实例（使用当前连接池）；未配置或初始化失败时返回None"""
+    global _openai_client, _openai_failed
+    if _openai_client is None and not _openai_failed and openai_configured():
+        http_client = get_http_pool().client_for(OPENAI_BASE_URL)
+        try:
+            from openai import AsyncOpenAI
+            _openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client)
+        except Exception as e:
+            print(f"OpenAI初始化失败: {e}")
+            _openai_failed = True
+    return _openai_client
+
+
+def openai_status_error(error: Exception) -> Optional[Dict[str, Any]]:
+    """OpenAI返回错误状态码时提取状态码和Retry-After（供准入控制识别限流），其他异常返回None"""
+    from openai import APIStatusError  # 调用到这里时SDK已加载
+    if isinstance(error, APIStatusError):
+        return {"status": error.status_code, "retry_after": error.response.headers.get("retry-after")}
+    return None
+
+
+def install_http_pool(pool: Optional[HTTPClientPool]) -> None:
+    """安装连接池（应用生命周期启动时调用，关闭时传None卸载）：
+    此后首次使用的服务商客户端以该连接池创建；此前用其他连接池创建的客户端全部作废"""
+    global _openai_client
+    set_http_pool(pool)
+    for registry in (llm_providers, asr_providers, tts_providers):
+        registry.drop_http_clients()
+    _openai_client = None
+
+
+# 各类服务的注册表（OpenAI使用上面的共享客户端，不在此登记）
+llm_providers = ProviderRegistry("llm")
+llm_providers.register("loopback", "app.core.loopback:loopback_llm")
+llm_providers.register("zhipu", "app.core.zhipu_client:ZhipuClient", http=True)
+llm_providers.register("qwen", "app.core.qwen_client:QwenClient", http=True)
+
+asr_providers = ProviderRegistry("asr")
+asr_providers.register("loopback", "app.core.loopback:loopback_asr")
+asr_providers.register("xunfei", "app.services.xunfei_asr:xunfei_asr_service")
+asr_providers.register("baidu", "app.services.baidu_asr:BaiduASRService", http=True)
+
+tts_providers = ProviderRegistry("tts")
+tts_providers.register("loopback", "app.core.loopback:loopback_tts")
+tts_providers.register("xunfei", "app.services.xunfei_tts:xunfei_tts_service")
@@ -3,26 +3,37 @@
 支持文本生成和流式响应
 """
 import httpx
-import json
 import asyncio
 import random
 from typing import List, Dict, AsyncGenerator
 from app.core.config import settings
+from app.core import fast_json
+from app.core.sse import iter_sse, finish_event
+from app.core.metrics import LLM_STREAM_MALFORMED
+from app.core.http_client import pool_timeout_fields, HTTPClientPool
 
 class QwenClient:
     """通义千问客户端，兼容OpenAI接口格式"""
     
-    def __init__(self):
+    def __init__(self, pool: HTTPClientPool):
         self.api_key = settings.QWEN_API_KEY
         self.base_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
         self.model = "qwen-turbo"  # 或者使用 "qwen-plus", "qwen-max"
-        
+        # 采样参数（同时作为响应缓存键的一部分）
+        self.sampling_params = {"temperature": 0.7, "top_p": 0.9, "max_tokens": 1000}
+        # 共享连接池（由服务商注册表注入），复用到上游的长连接
+        self.http_pool = pool
+
+    def is_configured(self) -> bool:
+        """是否配置了API密钥（否则使用模拟回复）"""
+        return bool(self.api_key)
+
     async def stream_chat_completion(
         self, messages: List[Dict[str, str]]
     ) -> AsyncGenerator[Dict[str, str], None]:
         """流式调用通义千问，逐Token返回结果"""
         
-        if not self.api_key or self.api_key == "":
+        if not self.is_configured():
             # 模拟回复用于测试
             async for result in self._mock_response(messages):
                 yield result
@@ -40,42 +51,61 @@ class QwenClient:
                 "messages": messages
             },
             "parameters": {
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "max_tokens": 1000,
+                **self.sampling_params,
                 "incremental_output": True
             }
         }
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                async with client.stream(
-                    "POST", 
-                    self.base_url, 
-                    headers=headers, 
-                    json=payload
-                ) as response:
-                    if response.status_code != 200:
-                        yield {"type": "llm-error", "message": f"通义千问调用失败：{response.status_code}"}
+            client = self.http_pool.client_for(self.base_url)
+            async with client.stream(
+                "POST", 
+                self.base_url, 
+                headers=headers, 
+                json=payload
+            ) as response:
+                if response.status_code != 200:
+                    # 附带状态码和Retry-After，供准入控制识别限流（429）
+                    yield {
+                        "type": "llm-error",
+                        "message": f"通义千问调用失败：{response.status_code}",
+                        "status": response.status_code,
+                        "retry_after": response.headers.get("retry-after")
+                    }
+                    return
+                
+                finish_reason = None
+                usage = None
+                async for event in iter_sse(response):
+                    try:
+                        data = event.json()
+                    except fast_json.JSONDecodeError:
+                        data = None
+                    if not isinstance(data, dict):
+                        LLM_STREAM_MALFORMED.labels("qwen").inc()
+                        print(f"通义千问流式响应中有无法解析的事件：{event.data[:200]!r}")
+                        continue
+                    if event.event == "error" or ("code" in data and "output" not in data):
+                        error = {"type": "llm-error", "message": f"通义千问流式响应错误：{data.get('message')}"}
+                        if str(data.get("code", "")).startswith("Throttling"):
+                            # 流内限流错误同样交给准入控制重试
+                            error["status"] = 429
+                        yield error
                         return
-                    
-                    async for line in response.aiter_lines():
-                        if line.startswith("data:"):
-                            data_str = line[5:].strip()  # 移除 "data:" 前缀
-                            if data_str == "[DONE]":
-                                break
-                            
-                            try:
-                                data = json.loads(data_str)
-                                if "output" in data and "text" in data["output"]:
-                                    text = data["output"]["text"]
-                                    if text:
-                                        yield {"type": "llm-token", "token": text}
-                            except json.JSONDecodeError:
-                                continue
-                                
+                    output = data.get("output") or {}
+                    # incremental_output=True 时每个事件只包含新增的文本
+                    text = output.get("text")
+                    if text:
+                        yield {"type": "llm-token", "token": text}
+                    # 生成过程中 finish_reason 为字符串 "null"
+                    if output.get("finish_reason") not in (None, "null"):
+                        finish_reason = output["finish_reason"]
+                    if data.get("usage"):
+                        usage = data["usage"]
+                yield finish_event(finish_reason, usage)
+
         except Exception as e:
-            yield {"type": "llm-error", "message": f"通义千问调用异常：{str(e)}"}
+            yield {"type": "llm-error", "message": f"通义千问调用异常：{str(e)}", **(pool_timeout_fields(e) or {})}
     
     async def _mock_response(self, messages: List[Dict[str, str]]) -> AsyncGenerator[Dict[str, str], None]:
         """模拟响应（用于测试，无API密钥时）"""
@@ -145,7 +175,7 @@ class QwenClient:
     
     async def get_chat_completion(self, messages: List[Dict[str, str]]) -> str:
         """非流式调用，一次性返回结果"""
-        if not self.api_key or self.api_key == "":
+        if not self.is_configured():
             return "这是一个测试回复（通义千问模拟模式）。"
         
         headers = {
@@ -159,24 +189,19 @@ class QwenClient:
                 "messages": messages
             },
             "parameters": {
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "max_tokens": 1000
+                **self.sampling_params
             }
         }
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(self.base_url, headers=headers, json=payload)
+            client = self.http_pool.client_for(self.base_url)
+            response = await client.post(self.base_url, headers=headers, json=payload)
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data["output"]["text"]
+            else:
+                return f"通义千问调用失败：{response.status_code}"
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    return data["output"]["text"]
-                else:
-                    return f"通义千问调用失败：{response.status_code}"
-                    
         except Exception as e:
             return f"通义千问调用异常：{str(e)}"
-
-# 创建全局通义千问客户端实例
-qwen_client = QwenClient()
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+SSE（Server-Sent Events）增量解码
+上游大模型的流式接口都是SSE：直接在 aiter_bytes 的原始字节上按行切分，
+每行只复制一次，data 保持为字节交给JSON解码（orjson可直接解析字节，无需先转字符串）
+兼容 "data:" 与 "data: " 两种前缀、多行data、event/id/retry 字段和注释行；行尾支持LF与CRLF
+"""
+from typing import Any, AsyncGenerator, Dict, List, Optional
+import httpx
+from app.core import fast_json
+from app.core.metrics import LLM_STREAM_MALFORMED
+
+
+class SSEEvent:
+    """一条SSE事件"""
+
+    __slots__ = ("event", "data", "id", "retry")
+
+    def __init__(self, event: str, data: bytes, id: str = "", retry: Optional[int] = None):
+        self.event = event
+        self.data = data
+        self.id = id
+        self.retry = retry
+
+    @property
+    def is_done(self) -> bool:
+        """OpenAI风格的流结束标记 data: [DONE]"""
+        return self.data.strip() == b"[DONE]"
+
+    @property
+    def text(self) -> str:
+        return self.data.decode("utf-8")
+
+    def json(self) -> Any:
+        return fast_json.loads(self.data)
+
+
+class SSEDecoder:
+    """增量解码器：喂入任意切分的字节块，返回其中已完整的事件"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data: List[bytes] = []
+        self._event = ""
+        self._last_id = ""  # 按规范，id在后续事件中沿用
+        self._retry: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line_end = end - 1 if end > start and buffer[end - 1] == 0x0D else end
+            event = self._process_line(bytes(buffer[start:line_end]))
+            if event is not None:
+                events.append(event)
+            start = end + 1
+        if start:
+            del buffer[:start]
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """流结束：处理没有换行结尾的最后一行，并派发未以空行结束的事件（部分服务商省略最后的空行）"""
+        events = []
+        if self._buffer:
+            line = bytes(self._buffer.rstrip(b"\r"))
+            self._buffer.clear()
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        data, event = self._data, self._event
+        self._data = []
+        self._event = ""
+        if not data:
+            return None
+        return SSEEvent(event or "message", b"\n".join(data), self._last_id, self._retry)
+
+    def _process_line(self, line: bytes) -> Optional[SSEEvent]:
+        if not line:
+            return self._dispatch()
+        if line[0] == 0x3A:  # ":" 开头为注释（心跳）
+            return None
+        field, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+        if field == b"data":
+            self._data.append(value)
+        elif field == b"event":
+            self._event = value.decode("utf-8", "replace")
+        elif field == b"id":
+            if b"\0" not in value:
+                self._last_id = value.decode("utf-8", "replace")
+        elif field == b"retry":
+            if value.isdigit():
+                self._retry = int(value)
+        return None
+
+
+async def iter_sse(response: httpx.Response) -> AsyncGenerator[SSEEvent, None]:
+    """逐条产出响应中的SSE事件"""
+    decoder = SSEDecoder()
+    async for chunk in response.aiter_bytes():
+        for event in decoder.feed(chunk):
+            yield event
+    for event in decoder.flush():
+        yield event
+
+
+def finish_event(finish_reason: Optional[str], usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """回复结束事件：结束原因与Token用量（统一为 prompt/completion/total_tokens）"""
+    usage = usage or {}
+    prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+    completion = usage.get("completion_tokens", usage.get("output_tokens"))
+    total = usage.get("total_tokens")
+    if total is None and prompt is not None and completion is not None:
+        total = prompt + completion
+    return {
+        "type": "llm-finish",
+        "finish_reason": finish_reason or "stop",
+        "usage": {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": total},
+    }
+
+
+async def openai_compatible_events(
+    response: httpx.Response, provider: str
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """解析OpenAI兼容格式的流式响应（choices[].delta.content），最后产出 llm-finish 事件"""
+    finish_reason = None
+    usage = None
+    async for event in iter_sse(response):
+        if event.is_done:
+            break
+        try:
+            data = event.json()
+        except fast_json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            LLM_STREAM_MALFORMED.labels(provider).inc()
+            print(f"{provider} 流式响应中有无法解析的事件：{event.data[:200]!r}")
+            continue
+        if data.get("error"):
+            error = data["error"]
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            yield {"type": "llm-error", "message": f"{provider} 流式响应错误：{message}"}
+            return
+        choices = data.get("choices")
+        if choices:
+            choice = choices[0]
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield {"type": "llm-token", "token": content}
+            finish_reason = choice.get("finish_reason") or finish_reason
+        if data.get("usage"):
+            usage = data["usage"]
+    yield finish_event(finish_reason, usage)
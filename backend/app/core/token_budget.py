@@ -0,0 +1,92 @@
+"""
+Token预算估算
+按模型估算消息Token数，用于按预算截断对话历史（不依赖各厂商的分词器）
+配置了多服务商路由时，本轮可能由任一候选服务商处理：按上下文最小的候选计算预算，
+按中文Token比例最高的候选估算消息Token数
+"""
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from app.core.config import settings
+
+# 各模型上下文窗口（Token）
+MODEL_CONTEXT_TOKENS: Dict[str, int] = {
+    "glm-4": 128000,
+    "glm-3-turbo": 128000,
+    "qwen-turbo": 8000,
+    "qwen-plus": 32000,
+    "qwen-max": 8000,
+    "gpt-4o": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_TOKENS = 8000
+
+# 每个中文字符约合多少Token（各厂商分词器差异较大）
+CJK_TOKENS_PER_CHAR: Dict[str, float] = {
+    "zhipu": 0.7,
+    "qwen": 0.7,
+    "openai": 1.1,
+}
+# 非中文字符约4个字符合1个Token
+LATIN_CHARS_PER_TOKEN = 4
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF      # 中日韩统一表意文字
+        or 0x3000 <= code <= 0x303F   # 中文标点
+        or 0xFF00 <= code <= 0xFFEF   # 全角字符
+    )
+
+
+def estimate_tokens(text: str, provider: str = "zhipu") -> int:
+    """估算一段文本的Token数"""
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    latin = len(text) - cjk
+    ratio = CJK_TOKENS_PER_CHAR.get(provider, 1.0)
+    return int(cjk * ratio + latin / LATIN_CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+
+@lru_cache(maxsize=256)
+def estimate_prompt_tokens(text: str, provider: str = "zhipu") -> int:
+    """估算System Prompt的Token数（角色提示词数量有限，结果缓存）"""
+    return estimate_tokens(text, provider)
+
+
+def widest_provider(providers: List[str]) -> str:
+    """中文Token比例最高的服务商（按它估算Token数最保守）"""
+    return max(providers, key=lambda provider: CJK_TOKENS_PER_CHAR.get(provider, 1.0))
+
+
+def history_token_budget(candidates: List[Tuple[str, str]], system_prompt: str) -> int:
+    """对话历史可用的Token预算：上下文窗口扣除System Prompt和回复预留后，不超过HISTORY_TOKEN_BUDGET
+    candidates：可能处理本轮请求的 (服务商, 模型)，取其中最小的预算"""
+    budgets = []
+    for provider, model in candidates:
+        context = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+        budgets.append(context - settings.LLM_REPLY_RESERVED_TOKENS - estimate_prompt_tokens(system_prompt, provider))
+    return max(0, min(settings.HISTORY_TOKEN_BUDGET, *budgets))
+
+
+def window_by_budget(history: List[Dict], total: int, budget: int, provider: str = "zhipu") -> int:
+    """返回预算内可保留的起始下标（最新一条总是保留）
+    total：会话维护的历史Token总数，未超出预算时直接返回0；超出时从最早的消息开始扣除，只遍历被删除的消息"""
+    start = 0
+    last = len(history) - 1
+    while total > budget and start < last:
+        total -= history[start].get("tokens") or estimate_tokens(history[start].get("content", ""), provider)
+        start += 1
+    return start
+
+
+def align_to_user_turn(history: List[Dict], start: int) -> int:
+    """截断位置向后对齐到下一条用户消息，不拆开一问一答（之后没有用户消息时保持原位置）"""
+    if start <= 0:
+        return 0
+    for i in range(start, len(history)):
+        if history[i].get("role") == "user":
+            return i
+    return start
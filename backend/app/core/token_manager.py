@@ -0,0 +1,137 @@
+"""
+访问令牌管理
+缓存服务商的访问令牌（如百度OAuth），按有效期在后台提前刷新，请求路径上通常不需要等待令牌接口：
+- 并发请求同时需要刷新时只发起一次令牌请求（single-flight），其余请求等待同一个结果
+- 临近到期时先返回现有令牌并在后台刷新；到期前按计划自动刷新
+- 服务商返回鉴权失败时作废当前令牌，调用方重新获取后重试一次
+- 获取失败后在重试间隔内直接失败，避免令牌接口被大量请求冲击
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+# 获取令牌：返回 (令牌, 有效期秒数)，有效期未知时返回None；失败时抛出异常
+TokenFetcher = Callable[[], Awaitable[Tuple[str, Optional[float]]]]
+
+
+class TokenManager:
+    """单个服务商的访问令牌"""
+
+    def __init__(
+        self,
+        name: str,
+        fetch: TokenFetcher,
+        refresh_margin: Optional[float] = None,
+        default_ttl: Optional[float] = None,
+        retry_seconds: Optional[float] = None
+    ):
+        self.name = name
+        self._fetch = fetch
+        self.refresh_margin = settings.TOKEN_REFRESH_MARGIN_SECONDS if refresh_margin is None else refresh_margin
+        self.default_ttl = settings.TOKEN_DEFAULT_TTL_SECONDS if default_ttl is None else default_ttl
+        self.retry_seconds = settings.TOKEN_FETCH_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._retry_after = 0.0  # 上次获取失败后，此时间之前不再请求
+        self._inflight: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.fetches = 0
+        self.failures = 0
+        _managers.append(self)
+
+    async def get(self) -> Optional[str]:
+        """获取有效令牌；获取失败时返回None"""
+        now = time.monotonic()
+        if self._token is not None and now < self._expires_at:
+            if now >= self._refresh_at:
+                # 临近到期：先用现有令牌，后台刷新
+                self._start_refresh()
+            return self._token
+        if now < self._retry_after:
+            return None
+        try:
+            return await asyncio.shield(self._start_refresh())
+        except Exception:
+            return None
+
+    def invalidate(self, token: Optional[str] = None) -> None:
+        """服务商拒绝了令牌（鉴权失败）：作废当前令牌，下次get重新获取
+        token：被拒绝的令牌，已被其他请求刷新过时不再作废新令牌"""
+        if token is None or token == self._token:
+            self._token = None
+            self._expires_at = 0.0
+            self._retry_after = 0.0
+
+    def _start_refresh(self) -> asyncio.Future:
+        """发起刷新；已有刷新进行中时复用同一个"""
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+            self._inflight.add_done_callback(self._on_refreshed)
+        return self._inflight
+
+    def _on_refreshed(self, future: asyncio.Future) -> None:
+        self._inflight = None
+        if not future.cancelled() and future.exception() is not None and self._token is not None:
+            # 后台刷新失败但旧令牌仍有效：稍后重试
+            self._schedule(self.retry_seconds)
+
+    async def _refresh(self) -> str:
+        self.fetches += 1
+        try:
+            token, expires_in = await self._fetch()
+        except Exception as e:
+            print(f"获取{self.name}访问令牌失败: {e}")
+            self.failures += 1
+            self._retry_after = time.monotonic() + self.retry_seconds
+            raise
+        ttl = expires_in if expires_in and expires_in > 0 else self.default_ttl
+        now = time.monotonic()
+        self._token = token
+        self._expires_at = now + ttl
+        # 有效期很短时提前量不超过有效期的一半
+        self._refresh_at = self._expires_at - min(self.refresh_margin, ttl / 2)
+        self._retry_after = 0.0
+        self._schedule(self._refresh_at - now)
+        return token
+
+    def _schedule(self, delay: float) -> None:
+        """计划在delay秒后后台刷新"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(max(0.0, delay), self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._start_refresh()
+
+    def close(self) -> None:
+        """停止后台刷新"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._inflight is not None:
+            self._inflight.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "valid": self._token is not None and now < self._expires_at,
+            "expires_in": round(max(0.0, self._expires_at - now), 1) if self._token else None,
+            "fetches": self.fetches,
+            "failures": self.failures,
+        }
+
+
+# 所有令牌管理器，应用关闭时统一停止后台刷新
+_managers: List[TokenManager] = []
+
+
+def close_token_managers() -> None:
+    for manager in _managers:
+        manager.close()
+
+
+def token_stats() -> Dict[str, Dict[str, Any]]:
+    return {manager.name: manager.stats() for manager in _managers}
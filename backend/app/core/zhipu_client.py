@@ -3,25 +3,34 @@
 支持文本生成和流式响应
 """
 import httpx
-import json
 import asyncio
 from typing import List, Dict, AsyncGenerator
 from app.core.config import settings
+from app.core.sse import openai_compatible_events
+from app.core.http_client import pool_timeout_fields, HTTPClientPool
 
 class ZhipuClient:
     """智谱AI客户端，兼容OpenAI接口格式"""
     
-    def __init__(self):
+    def __init__(self, pool: HTTPClientPool):
         self.api_key = settings.ZHIPU_API_KEY
         self.base_url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
         self.model = "glm-4"  # 或者使用 "glm-3-turbo"
-        
+        # 采样参数（同时作为响应缓存键的一部分）
+        self.sampling_params = {"temperature": 0.7, "top_p": 0.9, "max_tokens": 1000}
+        # 共享连接池（由服务商注册表注入），复用到上游的长连接
+        self.http_pool = pool
+
+    def is_configured(self) -> bool:
+        """是否配置了真实的API密钥（否则使用模拟回复）"""
+        return bool(self.api_key) and self.api_key != "your-zhipu-api-key-here"
+
     async def stream_chat_completion(
         self, messages: List[Dict[str, str]]
     ) -> AsyncGenerator[Dict[str, str], None]:
         """流式调用智谱AI，逐Token返回结果"""
         
-        if not self.api_key or self.api_key == "your-zhipu-api-key-here":
+        if not self.is_configured():
             # 模拟回复用于测试
             async for result in self._mock_response(messages):
                 yield result
@@ -36,41 +45,33 @@ class ZhipuClient:
             "model": self.model,
             "messages": messages,
             "stream": True,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "max_tokens": 1000
+            **self.sampling_params
         }
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                async with client.stream(
-                    "POST", 
-                    self.base_url, 
-                    headers=headers, 
-                    json=payload
-                ) as response:
-                    if response.status_code != 200:
-                        yield {"type": "llm-error", "message": f"智谱AI调用失败：{response.status_code}"}
-                        return
-                    
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            data_str = line[6:]  # 移除 "data: " 前缀
-                            if data_str.strip() == "[DONE]":
-                                break
-                            
-                            try:
-                                data = json.loads(data_str)
-                                if "choices" in data and len(data["choices"]) > 0:
-                                    delta = data["choices"][0].get("delta", {})
-                                    content = delta.get("content")
-                                    if content:
-                                        yield {"type": "llm-token", "token": content}
-                            except json.JSONDecodeError:
-                                continue
-                                
+            client = self.http_pool.client_for(self.base_url)
+            async with client.stream(
+                "POST", 
+                self.base_url, 
+                headers=headers, 
+                json=payload
+            ) as response:
+                if response.status_code != 200:
+                    # 附带状态码和Retry-After，供准入控制识别限流（429）
+                    yield {
+                        "type": "llm-error",
+                        "message": f"智谱AI调用失败：{response.status_code}",
+                        "status": response.status_code,
+                        "retry_after": response.headers.get("retry-after")
+                    }
+                    return
+                
+                # 兼容OpenAI格式，最后产出结束原因与Token用量
+                async for result in openai_compatible_events(response, "zhipu"):
+                    yield result
+
         except Exception as e:
-            yield {"type": "llm-error", "message": f"智谱AI调用异常：{str(e)}"}
+            yield {"type": "llm-error", "message": f"智谱AI调用异常：{str(e)}", **(pool_timeout_fields(e) or {})}
     
     async def _mock_response(self, messages: List[Dict[str, str]]) -> AsyncGenerator[Dict[str, str], None]:
         """模拟响应（用于测试，无API密钥时）"""
@@ -145,7 +146,7 @@ class ZhipuClient:
     
     async def get_chat_completion(self, messages: List[Dict[str, str]]) -> str:
         """非流式调用，一次性返回结果"""
-        if not self.api_key or self.api_key == "your-zhipu-api-key-here":
+        if not self.is_configured():
             return "这是一个测试回复（智谱AI模拟模式）。"
         
         headers = {
@@ -157,23 +158,18 @@ class ZhipuClient:
             "model": self.model,
             "messages": messages,
             "stream": False,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "max_tokens": 1000
+            **self.sampling_params
         }
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(self.base_url, headers=headers, json=payload)
+            client = self.http_pool.client_for(self.base_url)
+            response = await client.post(self.base_url, headers=headers, json=payload)
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data["choices"][0]["message"]["content"]
+            else:
+                return f"智谱AI调用失败：{response.status_code}"
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    return data["choices"][0]["message"]["content"]
-                else:
-                    return f"智谱AI调用失败：{response.status_code}"
-                    
         except Exception as e:
             return f"智谱AI调用异常：{str(e)}"
-
-# 创建全局智谱AI客户端实例
-zhipu_client = ZhipuClient()
\ No newline at end of file
@@ -1,14 +1,48 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.chat import router as chat_router
 from app.api.roles import router as roles_router
 from app.core.config import settings
+from app.core.http_client import HTTPClientPool, http_pool_dependency
+from app.core.llm_client import llm_client
+from app.core.metrics import registry, SESSIONS_LIVE
+from app.core.admission import admission
+from app.core.providers import llm_providers, asr_providers, tts_providers, install_http_pool
+from app.core.token_manager import close_token_managers, token_stats
+from app.core.fast_json import FastJSONResponse
+from app.services.chat_servers import chat_service
+from app.services.conversation_log import conversation_log
+from app.services.tts_cache import tts_cache
+from app.services.role_repository import role_repository
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：统一管理共享资源"""
+    # 上游HTTP连接池由生命周期创建和关闭：经服务商注册表注入各服务商客户端，接口经依赖注入取用
+    http_pool = HTTPClientPool()
+    install_http_pool(http_pool)
+    app.state.http_pool = http_pool
+    # 启动时连接角色库并预热角色缓存、加载TTS缓存索引，首个请求不必等待建表和扫描目录
+    await role_repository.init()
+    await tts_cache.load()
+    await conversation_log.start()
+    yield
+    # 关闭时写完对话日志，停止令牌后台刷新，释放上游长连接和会话存储连接
+    await conversation_log.stop()
+    close_token_managers()
+    install_http_pool(None)
+    await http_pool.close()
+    await chat_service.sessions.aclose()
 
 # 创建FastAPI应用
 app = FastAPI(
     title="AI角色扮演聊天系统",
     description="基于FastAPI+OpenAI的多角色实时聊天系统",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse  # orjson可用时使用orjson编码
 )
 
 # 配置CORS
@@ -29,4 +63,58 @@ app.include_router(chat_router)
 async def health_check():
     return {"status": "healthy", "service": "ai-roleplay-chat-backend", "version": "1.0.0"}
 
+# HTTP连接池统计接口
+@app.get("/health/http-pool", summary="上游HTTP连接池统计")
+async def http_pool_stats(http_pool: HTTPClientPool = Depends(http_pool_dependency)):
+    return http_pool.stats()
+
+# LLM响应缓存统计接口
+@app.get("/health/llm-cache", summary="LLM响应缓存命中统计")
+async def llm_cache_stats():
+    return llm_client.response_cache.stats()
+
+# LLM路由统计接口
+@app.get("/health/llm-router", summary="LLM服务商路由与熔断状态")
+async def llm_router_stats():
+    if llm_client.router is None:
+        return {"enabled": False, "provider": llm_client.provider}
+    return {"enabled": True, **llm_client.router.stats()}
+
+# 上游准入控制统计接口
+@app.get("/health/admission", summary="各服务商并发名额与排队情况")
+async def admission_stats():
+    return admission.stats()
+
+# 服务商加载状态接口
+@app.get("/health/providers", summary="各服务商是否已加载（首次使用时才加载）")
+async def provider_stats():
+    return {
+        "llm": llm_providers.loaded(),
+        "asr": asr_providers.loaded(),
+        "tts": tts_providers.loaded(),
+    }
+
+# 访问令牌状态接口
+@app.get("/health/tokens", summary="服务商访问令牌有效期与刷新次数")
+async def token_manager_stats():
+    return token_stats()
+
+# 对话日志统计接口
+@app.get("/health/conversation-log", summary="对话日志写入与丢弃统计")
+async def conversation_log_stats():
+    return conversation_log.stats()
+
+# TTS音频缓存统计接口
+@app.get("/health/tts-cache", summary="TTS音频缓存统计")
+async def tts_cache_stats():
+    return tts_cache.stats()
+
 # 启动命令：uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
+
+# Prometheus指标接口
+@app.get("/metrics", summary="运行指标（Prometheus文本格式）", response_class=PlainTextResponse)
+async def metrics():
+    session_stats = await chat_service.sessions.stats()
+    # 内存后端直接取存活数；Redis后端由过期机制回收，取本进程创建减关闭的数量
+    SESSIONS_LIVE.set(session_stats.get("live", session_stats["created"] - session_stats["closed"]))
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
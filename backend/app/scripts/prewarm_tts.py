@@ -0,0 +1,57 @@
+"""
+TTS缓存预热
+部署时为所有角色的技能示例预先合成语音，写入TTS磁盘缓存
+
+用法（在backend目录下）：python -m app.scripts.prewarm_tts
+"""
+import asyncio
+from app.services.role_repository import role_repository
+from app.services.role_skills import role_skills_manager
+from app.services.tts import tts_service
+from app.services.tts_cache import tts_cache
+from app.core.admission import PRIORITY_BACKGROUND
+from app.core.http_client import HTTPClientPool
+from app.core.providers import install_http_pool
+
+
+async def prewarm() -> None:
+    """逐条合成技能示例语音，已缓存的文本会直接命中"""
+    provider = tts_service.caching_provider()
+    if provider is None:
+        # 合成结果不会进缓存，逐条合成只会白白调用服务商
+        print(
+            f"当前TTS服务商（{tts_service.provider}）的合成结果不写入缓存"
+            "（TTS缓存未开启、服务商未配置，或服务商返回的是模拟音频，如讯飞），跳过预热"
+        )
+        return
+    print(f"使用TTS服务商 {provider} 预热缓存")
+    total = 0
+    failed = 0
+    for role in await role_repository.list_roles():
+        for skill in role_skills_manager.get_role_skills(role.id):
+            for example in skill.examples:
+                total += 1
+                async for tts_data in tts_service.text_to_speech_stream(
+                    text=example, voice=role.default_voice, priority=PRIORITY_BACKGROUND
+                ):
+                    if tts_data["type"] == "tts-error":
+                        failed += 1
+                        print(f"[{role.id}] 合成失败：{example} - {tts_data['message']}")
+                        break
+    stats = tts_cache.stats()
+    print(f"预热完成：共{total}条，失败{failed}条，缓存文件{stats['files']}个，{stats['bytes']}字节")
+
+
+async def main() -> None:
+    """脚本不经过应用生命周期：自行创建并安装上游连接池，结束时关闭"""
+    http_pool = HTTPClientPool()
+    install_http_pool(http_pool)
+    try:
+        await prewarm()
+    finally:
+        install_http_pool(None)
+        await http_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,75 +1,81 @@
-from openai import AsyncOpenAI
 from app.core.config import settings
-from app.services.baidu_asr import baidu_asr_service
-from app.services.xunfei_asr import xunfei_asr_service
-from typing import AsyncGenerator, Dict
+from app.core.providers import asr_providers, openai_client
+from app.services.audio_buffer import AudioBuffer
+from app.core.metrics import ASR_DURATION_SECONDS, PROVIDER_ERRORS, elapsed
+from typing import AsyncGenerator, AsyncIterator, Dict
 import asyncio
+import time
 
 class ASRService:
     """多语音识别服务：支持OpenAI Whisper、百度语音识别和讯飞语音识别"""
     def __init__(self):
         self.provider = getattr(settings, 'ASR_PROVIDER', 'xunfei')  # 默认使用讯飞
-        self.openai_client = None
-        
-        # 初始化OpenAI客户端（如果配置了）
-        if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != "sk-test-placeholder-key":
-            try:
-                self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            except Exception as e:
-                print(f"ASR初始化失败: {e}")
-                self.openai_client = None
+        # 服务商（含OpenAI客户端）在首次识别时才加载，见 app/core/providers.py
 
     async def transcribe_stream(
-        self, audio_chunks: AsyncGenerator[bytes, None]
+        self, audio_chunks: AsyncIterator[bytes]
     ) -> AsyncGenerator[Dict[str, str], None]:
-        """流式处理音频，返回识别结果"""
+        """流式处理音频，返回识别结果；audio_chunks为一句话的音频帧，迭代结束即表示这句话说完"""
+        start = time.perf_counter()
+        async for result in self._transcribe_from_provider(audio_chunks):
+            if result["type"] == "stt-final":
+                ASR_DURATION_SECONDS.labels(self.provider).observe(elapsed(start))
+            elif result["type"] == "stt-error":
+                PROVIDER_ERRORS.labels("asr", self.provider).inc()
+            yield result
+
+    async def _transcribe_from_provider(
+        self, audio_chunks: AsyncIterator[bytes]
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """按配置的服务商识别"""
         
-        # 优先使用讯飞语音识别
-        if self.provider == "xunfei" and hasattr(settings, 'XUNFEI_API_KEY') and settings.XUNFEI_API_KEY:
-            # 收集音频数据
-            audio_buffer = b""
-            async for chunk in audio_chunks:
-                audio_buffer += chunk
-            
-            # 使用讯飞ASR
-            async for result in xunfei_asr_service.transcribe_stream(audio_buffer):
+        # 回环服务商（压测用）
+        if self.provider == "loopback":
+            async for result in asr_providers.get("loopback").transcribe_stream(audio_chunks):
+                yield result
+            return
+
+        # 优先使用讯飞语音识别（流式接口：边接收音频边识别）
+        elif self.provider == "xunfei" and hasattr(settings, 'XUNFEI_API_KEY') and settings.XUNFEI_API_KEY:
+            async for result in asr_providers.get("xunfei").transcribe_stream(audio_chunks):
                 yield result
             return
         
-        # 使用百度语音识别
+        # 使用百度语音识别（整段识别）
         elif self.provider == "baidu" and hasattr(settings, 'BAIDU_API_KEY') and settings.BAIDU_API_KEY:
             # 收集音频数据
-            audio_buffer = b""
-            async for chunk in audio_chunks:
-                audio_buffer += chunk
-            
-            # 使用百度ASR
-            async for result in baidu_asr_service.transcribe_stream(audio_buffer):
-                yield result
+            audio_buffer = await AudioBuffer.collect(audio_chunks)
+            try:
+                async for result in asr_providers.get("baidu").transcribe_stream(audio_buffer.getvalue()):
+                    yield result
+            finally:
+                audio_buffer.close()
             return
         
         # 使用OpenAI Whisper
-        elif self.provider == "openai" and self.openai_client:
+        elif self.provider == "openai" and openai_client():
             yield {"type": "stt-interim", "text": "正在识别语音..."}
             await asyncio.sleep(0.5)
             
             # 收集完整音频
-            audio_buffer = b""
-            async for chunk in audio_chunks:
-                audio_buffer += chunk
+            audio_buffer = await AudioBuffer.collect(audio_chunks)
 
             try:
-                response = await self.openai_client.audio.transcriptions.create(
+                response = await openai_client().audio.transcriptions.create(
                     model=settings.ASR_MODEL_NAME,
-                    file=("audio.wav", audio_buffer, "audio/wav"),
+                    file=("audio.wav", audio_buffer.getvalue(), "audio/wav"),
                     response_format="text"
                 )
                 yield {"type": "stt-final", "text": response.strip()}
             except Exception as e:
                 yield {"type": "stt-error", "message": f"语音识别失败：{str(e)}"}
+            finally:
+                audio_buffer.close()
             return
         
-        # 后备模拟模式
+        # 后备模拟模式：等这句话的音频接收完再返回结果
+        async for _ in audio_chunks:
+            pass
         yield {"type": "stt-interim", "text": "正在识别语音..."}
         await asyncio.sleep(0.5)
         yield {"type": "stt-interim", "text": "正在识别语音... 请稍候"}
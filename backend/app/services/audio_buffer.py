@@ -0,0 +1,45 @@
+"""
+音频缓冲区
+逐帧追加音频数据，内存中累积到阈值后自动转存临时文件，避免 bytes += chunk 的平方级复制
+"""
+import tempfile
+from typing import AsyncIterator
+
+
+class AudioBuffer:
+    """可增长的音频缓冲区（小于阈值时在内存中，超过后落到临时文件）"""
+
+    def __init__(self, max_memory_bytes: int = 4 * 1024 * 1024):
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory_bytes)
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def getvalue(self) -> bytes:
+        """取出全部音频（一次性拷贝，用于只支持整段识别的服务商）"""
+        self._file.seek(0)
+        data = self._file.read()
+        self._file.seek(0, 2)
+        return data
+
+    async def iter_chunks(self, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """按块读出缓冲区内容"""
+        self._file.seek(0)
+        while True:
+            chunk = self._file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        self._file.close()
+
+    @classmethod
+    async def collect(cls, audio_chunks: AsyncIterator[bytes]) -> "AudioBuffer":
+        """读取完整个音频流"""
+        buffer = cls()
+        async for chunk in audio_chunks:
+            buffer.write(chunk)
+        return buffer
@@ -3,43 +3,58 @@
 支持音频转文字功能
 """
 import base64
-import httpx
-import json
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional, Tuple
 from app.core.config import settings
+from app.core.http_client import HTTPClientPool
+from app.core.token_manager import TokenManager
+
+# 百度语音识别鉴权失败的错误码（令牌无效或过期）
+BAIDU_AUTH_ERRORS = {3302}
 
 class BaiduASRService:
     """百度语音识别服务"""
     
-    def __init__(self):
+    def __init__(self, pool: HTTPClientPool):
         self.app_id = settings.BAIDU_APP_ID
         self.api_key = settings.BAIDU_API_KEY
         self.secret_key = settings.BAIDU_SECRET_KEY
-        self.access_token = None
-        
-    async def get_access_token(self):
-        """获取百度API访问令牌"""
-        if not self.api_key or not self.secret_key:
-            return None
-            
+        # 共享连接池（由服务商注册表注入），复用到百度的长连接
+        self.http_pool = pool
+        # 访问令牌按有效期缓存，到期前后台刷新
+        self.tokens = TokenManager("百度", self._fetch_access_token)
+
+    async def _fetch_access_token(self) -> Tuple[str, Optional[float]]:
+        """请求百度OAuth接口，返回 (访问令牌, 有效期秒数)"""
         url = "https://aip.baidubce.com/oauth/2.0/token"
         params = {
             "grant_type": "client_credentials",
             "client_id": self.api_key,
             "client_secret": self.secret_key
         }
-        
+        client = self.http_pool.client_for(url)
+        response = await client.post(url, params=params)
+        data = response.json()
+        if response.status_code != 200 or not data.get("access_token"):
+            raise RuntimeError(f"{response.status_code} {data.get('error_description') or data.get('error')}")
+        return data["access_token"], data.get("expires_in")
+
+    async def get_access_token(self) -> Optional[str]:
+        """获取百度API访问令牌"""
+        if not self.api_key or not self.secret_key:
+            return None
+        return await self.tokens.get()
+
+    @staticmethod
+    def _is_auth_failure(response) -> bool:
+        """HTTP 401或鉴权失败错误码（令牌过期或被吊销）"""
+        if response.status_code == 401:
+            return True
+        if response.status_code != 200:
+            return False
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, params=params)
-                if response.status_code == 200:
-                    data = response.json()
-                    self.access_token = data.get("access_token")
-                    return self.access_token
-        except Exception as e:
-            print(f"获取百度访问令牌失败: {e}")
-        
-        return None
+            return response.json().get("err_no") in BAIDU_AUTH_ERRORS
+        except ValueError:
+            return False
     
     async def transcribe_stream(self, audio_data) -> AsyncGenerator[dict, None]:
         """
@@ -47,10 +62,8 @@ class BaiduASRService:
         audio_data: 音频文件数据或生成器
         """
         
-        if not self.access_token:
-            await self.get_access_token()
-        
-        if not self.access_token:
+        access_token = await self.get_access_token()
+        if not access_token:
             yield {
                 "type": "stt-error", 
                 "message": "百度语音识别未配置或配置错误"
@@ -78,43 +91,46 @@ class BaiduASRService:
                 "rate": 16000,     # 采样率
                 "channel": 1,      # 单声道
                 "cuid": "python_client",
-                "token": self.access_token,
+                "token": access_token,
                 "speech": audio_base64,
                 "len": len(audio_bytes)
             }
             
             yield {"type": "stt-processing", "message": "正在处理语音..."}
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("err_no") == 0:
-                        # 识别成功
-                        text = "".join(result.get("result", []))
-                        yield {
-                            "type": "stt-final",
-                            "text": text,
-                            "confidence": 0.95  # 百度API不返回置信度，使用默认值
-                        }
-                    else:
-                        # 识别失败
-                        yield {
-                            "type": "stt-error",
-                            "message": f"语音识别失败: {result.get('err_msg', '未知错误')}"
-                        }
+            client = self.http_pool.client_for(url)
+            response = await client.post(url, headers=headers, json=payload)
+            if self._is_auth_failure(response):
+                # 令牌被拒绝：作废后重新获取，重试一次
+                self.tokens.invalidate(access_token)
+                payload["token"] = await self.get_access_token()
+                if payload["token"]:
+                    response = await client.post(url, headers=headers, json=payload)
+            
+            if response.status_code == 200:
+                result = response.json()
+                if result.get("err_no") == 0:
+                    # 识别成功
+                    text = "".join(result.get("result", []))
+                    yield {
+                        "type": "stt-final",
+                        "text": text,
+                        "confidence": 0.95  # 百度API不返回置信度，使用默认值
+                    }
                 else:
+                    # 识别失败
                     yield {
                         "type": "stt-error",
-                        "message": f"API调用失败: {response.status_code}"
+                        "message": f"语音识别失败: {result.get('err_msg', '未知错误')}"
                     }
-                    
+            else:
+                yield {
+                    "type": "stt-error",
+                    "message": f"API调用失败: {response.status_code}"
+                }
+                
         except Exception as e:
             yield {
                 "type": "stt-error",
                 "message": f"语音识别异常: {str(e)}"
             }
-
-# 创建百度ASR服务实例
-baidu_asr_service = BaiduASRService()
\ No newline at end of file
@@ -1,81 +1,200 @@
 from app.core.llm_client import llm_client
 from app.services.tts import tts_service
+from app.services.tts_pipeline import SentenceSegmenter, TTSPipeline
+from app.services.session_backend import create_session_backend
+from app.services.role_skills import role_skills_manager
+from app.services.conversation_log import conversation_log, TurnStats
 from app.models.role import Role
-from typing import List, Dict, AsyncGenerator
+from typing import List, Dict, AsyncGenerator, Optional
+import asyncio
 from app.core.config import settings
+from app.core.admission import PRIORITY_BACKGROUND
+from app.core.token_budget import (
+    estimate_tokens, history_token_budget, window_by_budget, align_to_user_turn, widest_provider
+)
 
 class ChatService:
     """聊天核心服务：整合LLM/ASR/TTS，管理对话历史"""
     def __init__(self):
-        # 会话管理：{session_id: {"role": Role对象, "history": 对话历史}}
-        self.sessions: Dict[str, Dict] = {}
-
-    def init_session(self, session_id: str, role: Role) -> None:
-        """初始化会话：绑定角色并初始化对话历史"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "role": role,
-                "history": [{"role": "system", "content": role.system_prompt}]
-            }
-
-    def get_session_history(self, session_id: str) -> List[Dict[str, str]]:
-        """获取会话历史，自动截断超长记录"""
-        if session_id not in self.sessions:
-            raise ValueError(f"会话 {session_id} 未初始化")
-        history = self.sessions[session_id]["history"]
-        if len(history) > settings.MAX_CONVERSATION_HISTORY:
-            self.sessions[session_id]["history"] = history[-settings.MAX_CONVERSATION_HISTORY:]
-        return self.sessions[session_id]["history"]
+        # 会话管理：角色绑定+对话历史，后端可为进程内存或Redis
+        self.sessions = create_session_backend()
+
+    async def init_session(self, session_id: str, role: Role) -> None:
+        """初始化会话：绑定角色，对话历史为空（System Prompt由角色提供，每轮固定放在最前）
+        会话已存在（如断线重连、其他worker已创建）时保留原有对话历史"""
+        await self.sessions.create(session_id, role=role, history=[])
+
+    async def close_session(self, session_id: str) -> None:
+        """关闭会话并释放对话历史"""
+        await self.sessions.close(session_id)
+
+    async def get_session_history(
+        self, session_id: str, role: Role, user_input: str = ""
+    ) -> List[Dict[str, str]]:
+        """获取本轮发送给LLM的消息：System Prompt + Token预算内的最近对话，超出预算的旧消息被删除
+        System Prompt只包含与本轮用户输入相关的角色技能；预算按可能处理本轮的服务商中上下文最小的计算
+        会话维护历史Token总数，未超出预算时不需要逐条累加"""
+        history = await self.sessions.get_history(session_id)
+        total = await self.sessions.history_tokens(session_id)
+        providers = llm_client.candidate_providers()
+        system_prompt = role_skills_manager.compose_system_prompt(role.id, role.system_prompt, user_input)
+        budget = history_token_budget(
+            [(provider, llm_client.current_model(provider)) for provider in providers], system_prompt
+        )
+        start = window_by_budget(history, total, budget, widest_provider(providers))
+        start = max(start, len(history) - settings.MAX_CONVERSATION_HISTORY)
+        start = align_to_user_turn(history, start)
+        if start > 0:
+            await self.sessions.drop_oldest(session_id, start)
+
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(
+            {"role": m["role"], "content": m["content"]}
+            for m in history[start:] if m["role"] != "system"
+        )
+        return messages
+
+    async def _append_message(
+        self, session_id: str, role: str, content: str, role_id: str = "", **log_fields
+    ) -> None:
+        """追加一条消息到会话存储，同时缓存其Token估算值（按候选服务商中最保守的估算）；
+        并记入对话日志（后台写入，不等待数据库）
+        log_fields：助手消息的耗时与用量，见 TurnStats.fields"""
+        tokens = estimate_tokens(content, widest_provider(llm_client.candidate_providers()))
+        await self.sessions.append(session_id, {
+            "role": role,
+            "content": content,
+            "tokens": tokens
+        })
+        await conversation_log.record(session_id, role, content, role_id=role_id, tokens=tokens, **log_fields)
 
     async def chat_with_llm_stream(
         self, session_id: str, user_input: str
     ) -> AsyncGenerator[Dict[str, str], None]:
         """流式聊天：用户输入→LLM响应→TTS音频"""
-        if session_id not in self.sessions:
+        role = await self.sessions.get_role(session_id)
+        if role is None:
             yield {"type": "chat-error", "message": "会话未初始化，请先选择角色"}
             return
 
-        role = self.sessions[session_id]["role"]
-        history = self.get_session_history(session_id)
-        history.append({"role": "user", "content": user_input})
+        await self._append_message(session_id, "user", user_input, role.id)
+        history = await self.get_session_history(session_id, role, user_input)
+        use_cache = role.id in settings.llm_cache_roles_list
+
+        if settings.TTS_PIPELINE_ENABLED:
+            async for chat_data in self._stream_with_pipelined_tts(
+                session_id, history, role.default_voice, use_cache, role.id
+            ):
+                yield chat_data
+            return
 
-        # 流式获取LLM响应
+        # 流式获取LLM响应（排队等状态事件直接转发，只有错误才结束本轮）
         llm_response = []
-        async for llm_data in llm_client.stream_chat_completion(history):
-            if llm_data["type"] == "llm-token":
-                llm_response.append(llm_data["token"])
+        turn = TurnStats()
+        try:
+            async for llm_data in llm_client.stream_chat_completion(history, use_cache=use_cache):
+                turn.observe(llm_data)
+                if llm_data["type"] == "llm-token":
+                    llm_response.append(llm_data["token"])
                 yield llm_data
-            else:
-                yield llm_data
-                return
+                if llm_data["type"] == "llm-error":
+                    return
+        except (asyncio.CancelledError, GeneratorExit):
+            await self._record_partial_reply(session_id, llm_response, role.id, turn)
+            raise
 
         # 生成TTS音频
         final_llm_text = "".join(llm_response)
-        history.append({"role": "assistant", "content": final_llm_text})
+        await self._append_message(session_id, "assistant", final_llm_text, role.id, **turn.fields())
         async for tts_data in tts_service.text_to_speech_stream(
             text=final_llm_text,
             voice=role.default_voice
         ):
             yield tts_data
 
-    async def get_single_reply(self, session_id: str, user_input: str) -> str:
-        """获取单次AI回复（用于文本聊天API）"""
-        if session_id not in self.sessions:
+    async def _stream_with_pipelined_tts(
+        self, session_id: str, history: List[Dict[str, str]], voice: str, use_cache: bool = False,
+        role_id: str = ""
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """流水线模式：边生成边按句合成语音，首句生成完即可开始播放"""
+        segmenter = SentenceSegmenter(min_chars=settings.TTS_SEGMENT_MIN_CHARS)
+        pipeline = TTSPipeline(voice=voice, max_concurrency=settings.TTS_PIPELINE_CONCURRENCY)
+        llm_response = []
+        turn = TurnStats()
+        recorded = False
+        try:
+            async for llm_data in llm_client.stream_chat_completion(history, use_cache=use_cache):
+                turn.observe(llm_data)
+                if llm_data["type"] != "llm-token":
+                    # 排队等状态事件直接转发，只有错误才结束本轮
+                    yield llm_data
+                    if llm_data["type"] == "llm-error":
+                        return
+                    continue
+                llm_response.append(llm_data["token"])
+                yield llm_data
+                for sentence in segmenter.feed(llm_data["token"]):
+                    pipeline.submit(sentence)
+                # 在Token之间穿插发送已合成好的音频
+                for tts_data in pipeline.drain_ready():
+                    yield tts_data
+
+            rest = segmenter.flush()
+            if rest:
+                pipeline.submit(rest)
+            pipeline.close()
+            await self._append_message(session_id, "assistant", "".join(llm_response), role_id, **turn.fields())
+            recorded = True
+
+            async for tts_data in pipeline.remaining():
+                yield tts_data
+        except (asyncio.CancelledError, GeneratorExit):
+            if not recorded:
+                await self._record_partial_reply(session_id, llm_response, role_id, turn)
+            raise
+        finally:
+            pipeline.cancel()
+
+    async def _record_partial_reply(
+        self, session_id: str, llm_response: List[str], role_id: str = "", turn: Optional[TurnStats] = None
+    ) -> None:
+        """本轮被打断（用户插话或断开）时，把已生成的部分回复记入历史；写入不受取消影响"""
+        if llm_response:
+            log_fields = turn.fields(interrupted=True) if turn else {"interrupted": True}
+            await asyncio.shield(
+                self._append_message(session_id, "assistant", "".join(llm_response), role_id, **log_fields)
+            )
+
+    async def get_single_reply(
+        self, session_id: str, user_input: str, priority: int = PRIORITY_BACKGROUND,
+        raise_on_error: bool = False
+    ) -> str:
+        """获取单次AI回复（用于文本聊天API，默认按后台优先级排队）
+        raise_on_error：LLM出错时抛出RuntimeError，而不是返回致歉文本（批量接口按条报告错误）"""
+        role = await self.sessions.get_role(session_id)
+        if role is None:
             raise ValueError(f"会话 {session_id} 未初始化")
 
-        history = self.get_session_history(session_id)
-        history.append({"role": "user", "content": user_input})
+        await self._append_message(session_id, "user", user_input, role.id)
+        history = await self.get_session_history(session_id, role, user_input)
 
         # 获取LLM回复
         llm_response = []
-        async for llm_data in llm_client.stream_chat_completion(history):
+        turn = TurnStats()
+        use_cache = role.id in settings.llm_cache_roles_list
+        async for llm_data in llm_client.stream_chat_completion(
+            history, use_cache=use_cache, priority=priority
+        ):
+            turn.observe(llm_data)
             if llm_data["type"] == "llm-token":
                 llm_response.append(llm_data["token"])
             elif llm_data["type"] == "llm-error":
+                if raise_on_error:
+                    raise RuntimeError(llm_data["message"])
                 return f"抱歉，{llm_data['message']}"
 
         final_llm_text = "".join(llm_response)
-        history.append({"role": "assistant", "content": final_llm_text})
+        await self._append_message(session_id, "assistant", final_llm_text, role.id, **turn.fields())
         
         return final_llm_text
 
@@ -0,0 +1,229 @@
+"""
+对话日志
+每条用户/AI消息连同耗时、Token用量追加写入数据库（SQLite WAL或PostgreSQL，见 app/core/database.py），
+重启后可追溯，也可用于离线分析
+写入不在对话路径上：消息先进入有界队列，后台任务攒批后在线程中一次事务写入；
+数据库写入停滞时队列逐渐填满，新消息最多等待 CONVERSATION_LOG_ENQUEUE_TIMEOUT 后丢弃并计数
+日志是尽力而为的：启动时数据库不可用不影响应用启动，由后台写入任务在写入时重新连接
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.database import connect, get_database_url, is_postgres
+from app.core.metrics import (
+    CONVERSATION_LOG_WRITTEN, CONVERSATION_LOG_DROPPED, CONVERSATION_LOG_BATCH_SECONDS,
+    CONVERSATION_LOG_QUEUE_DEPTH, elapsed
+)
+
+LOG_COLUMNS = (
+    "session_id", "role_id", "message_role", "content", "created_at", "tokens",
+    "latency_ms", "ttft_ms", "prompt_tokens", "completion_tokens", "finish_reason", "provider", "interrupted"
+)
+# 写入失败时的重试间隔（秒），之后放弃这一批
+WRITE_RETRY_DELAYS = (0.5, 2.0)
+
+
+class TurnStats:
+    """一轮AI回复的计时与用量，生成助手消息的日志字段"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.finish: Optional[Dict[str, Any]] = None
+
+    def observe(self, event: Dict[str, Any]) -> None:
+        if event["type"] == "llm-token":
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - self.start
+        elif event["type"] == "llm-finish":
+            self.finish = event
+
+    def fields(self, interrupted: bool = False) -> Dict[str, Any]:
+        usage = self.finish["usage"] if self.finish else {}
+        return {
+            "latency_ms": round(elapsed(self.start) * 1000, 1),
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "finish_reason": self.finish["finish_reason"] if self.finish else None,
+            "provider": self.finish.get("provider") if self.finish else None,
+            "interrupted": interrupted,
+        }
+
+
+class ConversationLog:
+    """追加写入的对话日志"""
+
+    def __init__(self, database_url: Optional[str] = None):
+        self.database_url = database_url
+        self._conn = None
+        self._ph = "?"
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        """连接数据库并启动后台写入（应用启动时调用）；连接失败只打印警告，写入时再重试"""
+        if not settings.CONVERSATION_LOG_ENABLED or self._task is not None:
+            return
+        try:
+            await asyncio.to_thread(self._open)
+        except Exception as e:
+            print(f"对话日志数据库暂不可用，将在写入时重试: {e}")
+        self._queue = asyncio.Queue(maxsize=settings.CONVERSATION_LOG_QUEUE_SIZE)
+        self._task = asyncio.create_task(self._run())
+
+    def _open(self) -> None:
+        """连接数据库并建表（在线程中执行）"""
+        conn, ph = connect(self.database_url)
+        try:
+            self._init_schema(conn)
+        except Exception:
+            conn.close()
+            raise
+        self._conn, self._ph = conn, ph
+
+    def _init_schema(self, conn) -> None:
+        postgres = is_postgres(get_database_url(self.database_url))
+        cur = conn.cursor()
+        if not postgres:
+            # WAL模式下NORMAL同步级别不会损坏数据库，只可能丢失断电前最后一批
+            cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_log ("
+            "session_id VARCHAR(128) NOT NULL, "
+            "role_id VARCHAR(128), "
+            "message_role VARCHAR(16) NOT NULL, "
+            "content TEXT NOT NULL, "
+            "created_at DOUBLE PRECISION NOT NULL, "
+            "tokens INTEGER, "
+            "latency_ms DOUBLE PRECISION, "
+            "ttft_ms DOUBLE PRECISION, "
+            "prompt_tokens INTEGER, "
+            "completion_tokens INTEGER, "
+            "finish_reason VARCHAR(32), "
+            "provider VARCHAR(32), "
+            "interrupted INTEGER NOT NULL DEFAULT 0)"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversation_log_session "
+            "ON conversation_log (session_id, created_at)"
+        )
+        cur.close()
+
+    async def record(self, session_id: str, message_role: str, content: str, **fields: Any) -> None:
+        """记录一条消息；未启动时忽略。队列未满时立即返回，不会让出事件循环"""
+        if self._queue is None:
+            return
+        row = (
+            session_id, fields.get("role_id"), message_role, content, time.time(), fields.get("tokens"),
+            fields.get("latency_ms"), fields.get("ttft_ms"), fields.get("prompt_tokens"),
+            fields.get("completion_tokens"), fields.get("finish_reason"), fields.get("provider"),
+            1 if fields.get("interrupted") else 0
+        )
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # 写入跟不上：短暂等待（背压），仍写不进则丢弃，不拖慢对话
+            try:
+                await asyncio.wait_for(self._queue.put(row), settings.CONVERSATION_LOG_ENQUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                CONVERSATION_LOG_DROPPED.labels("queue_full").inc()
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if settings.CONVERSATION_LOG_FLUSH_INTERVAL > 0 and queue.qsize() < settings.CONVERSATION_LOG_BATCH_SIZE:
+                # 攒批：等一小段时间让同一时段的消息合并为一次事务
+                await asyncio.sleep(settings.CONVERSATION_LOG_FLUSH_INTERVAL)
+            while len(batch) < settings.CONVERSATION_LOG_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            CONVERSATION_LOG_QUEUE_DEPTH.set(queue.qsize())
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _write(self, batch: List[tuple]) -> None:
+        """一次事务写入一批；失败时重试，仍失败则丢弃这一批"""
+        for delay in (*WRITE_RETRY_DELAYS, None):
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._insert, batch)
+            except Exception as e:
+                print(f"对话日志写入失败: {e}")
+                if delay is None:
+                    CONVERSATION_LOG_DROPPED.labels("write_error").inc(len(batch))
+                    return
+                await asyncio.sleep(delay)
+                continue
+            CONVERSATION_LOG_BATCH_SECONDS.observe(elapsed(start))
+            CONVERSATION_LOG_WRITTEN.inc(len(batch))
+            return
+
+    def _insert(self, batch: List[tuple]) -> None:
+        """在一个事务中写入一批（在线程中执行）；尚未连接或连接已断开时先重新连接"""
+        if self._conn is None:
+            self._open()
+        conn = self._conn
+        cur = conn.cursor()
+        began = False
+        try:
+            cur.execute("BEGIN")
+            began = True
+            cur.executemany(
+                f"INSERT INTO conversation_log ({', '.join(LOG_COLUMNS)}) "
+                f"VALUES ({', '.join([self._ph] * len(LOG_COLUMNS))})",
+                batch
+            )
+            cur.execute("COMMIT")
+        except Exception:
+            if began:
+                try:
+                    cur.execute("ROLLBACK")
+                except Exception:
+                    pass  # 连接已不可用，保留原始异常
+            if getattr(conn, "closed", 0):
+                # PostgreSQL连接已断开，下一批重新连接
+                self._conn = None
+            raise
+        finally:
+            if not getattr(conn, "closed", 0):
+                cur.close()
+
+    async def stop(self) -> None:
+        """等待队列写完（最多 CONVERSATION_LOG_SHUTDOWN_TIMEOUT 秒）后停止（应用关闭时调用）"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), settings.CONVERSATION_LOG_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"对话日志关闭超时，{self._queue.qsize()} 条消息未写入")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._queue = None
+        if self._conn is not None:
+            await asyncio.to_thread(self._conn.close)
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "connected": self._conn is not None,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written": CONVERSATION_LOG_WRITTEN.labels().value,
+            "dropped": {
+                reason: CONVERSATION_LOG_DROPPED.labels(reason).value for reason in ("queue_full", "write_error")
+            },
+        }
+
+
+# 创建全局对话日志实例
+conversation_log = ConversationLog()
@@ -0,0 +1,202 @@
+"""
+角色仓库
+角色持久化到数据库（SQLite/PostgreSQL），进程内按id缓存，查询O(1)
+"""
+import asyncio
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.database import connect
+from app.models.role import Role, RoleCreateRequest
+
+# 内置角色：启动时写入数据库（已存在则更新为最新定义）
+# system_prompt只包含角色设定，技能说明每轮按用户输入挑选后追加（见 app/services/role_skills.py）
+DEFAULT_ROLES: List[Role] = [
+    Role(
+        id="socrates",
+        name="苏格拉底",
+        description="古希腊哲学家，擅长诘问法引导思考，精通逻辑分析与伦理思辨",
+        system_prompt="你是苏格拉底，用诘问法引导用户思考，通过3-5个问题帮助用户自己找到答案。语气温和耐心。",
+        default_voice="socrates",
+        avatar_url="https://picsum.photos/id/1025/200/200"
+    ),
+    Role(
+        id="harry_potter",
+        name="哈利·波特",
+        description="魔法世界的年轻巫师，勇敢善良，精通魔法知识与冒险指导",
+        system_prompt="你是哈利·波特，一个勇敢的年轻巫师。你会分享魔法世界的知识和你的冒险经历，语气友善热情，偶尔会提到霍格沃茨、朋友赫敏和罗恩。",
+        default_voice="harry_potter",
+        avatar_url="https://picsum.photos/id/1050/200/200"
+    ),
+    Role(
+        id="sherlock",
+        name="夏洛克·福尔摩斯",
+        description="虚构侦探，观察力敏锐，逻辑推理能力强，精通犯罪心理分析",
+        system_prompt="你是夏洛克·福尔摩斯，注重细节和逻辑推理，语气自信略带傲慢，用短句增强节奏感。",
+        default_voice="sherlock",
+        avatar_url="https://picsum.photos/id/1074/200/200"
+    )
+]
+
+ROLE_COLUMNS = ("id", "name", "description", "system_prompt", "default_voice", "avatar_url")
+
+
+class RoleRepository:
+    """角色仓库：数据库持久化 + 进程内读缓存（带TTL，便于多worker间同步新角色）
+    数据库访问在线程中执行，不阻塞事件循环；缓存命中时直接返回"""
+
+    def __init__(self, database_url: Optional[str] = None, cache_ttl: float = 60, miss_ttl: float = 5):
+        self.database_url = database_url
+        self.cache_ttl = cache_ttl
+        self.miss_ttl = miss_ttl
+        self._conn = None
+        self._ph = "?"
+        self._lock = threading.Lock()
+        # 读缓存：{role_id: (Role或None, 过期时间)}，None表示角色不存在（短时缓存）
+        self._cache: Dict[str, Tuple[Optional[Role], float]] = {}
+        # 全量列表缓存：(角色列表, 过期时间)
+        self._all: Optional[Tuple[List[Role], float]] = None
+
+    async def init(self) -> None:
+        """连接数据库、建表并预热缓存（应用启动时调用）"""
+        await self.list_roles()
+
+    def _connection(self):
+        """连接数据库并建表、写入内置角色；PostgreSQL连接断开后重新连接"""
+        if self._conn is not None and getattr(self._conn, "closed", 0):
+            self._conn = None
+        if self._conn is None:
+            self._conn, self._ph = connect(self.database_url)
+            self._init_schema()
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = (), fetch: Optional[str] = None):
+        """在锁内执行一条SQL（于线程中调用）；连接已断开时重连后重试一次
+        fetch："one"/"all" 返回查询结果，否则返回影响行数"""
+        with self._lock:
+            for attempt in range(2):
+                conn = self._connection()
+                cur = conn.cursor()
+                try:
+                    cur.execute(sql.format(ph=self._ph), params)
+                    if fetch == "one":
+                        return cur.fetchone()
+                    if fetch == "all":
+                        return cur.fetchall()
+                    return cur.rowcount
+                except Exception:
+                    if attempt or not getattr(conn, "closed", 0):
+                        raise
+                    print("数据库连接已断开，重新连接")
+                finally:
+                    if not getattr(conn, "closed", 0):
+                        cur.close()
+
+    def _init_schema(self) -> None:
+        conn, ph = self._conn, self._ph
+        cur = conn.cursor()
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS roles ("
+            "id VARCHAR(128) PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "description TEXT NOT NULL, "
+            "system_prompt TEXT NOT NULL, "
+            "default_voice TEXT, "
+            "avatar_url TEXT, "
+            "created_at DOUBLE PRECISION NOT NULL)"
+        )
+        placeholders = ", ".join([ph] * (len(ROLE_COLUMNS) + 1))
+        # 旧版本写入的内置角色System Prompt包含全部技能，这里一并更新
+        updates = ", ".join(f"{col} = excluded.{col}" for col in ROLE_COLUMNS if col != "id")
+        for i, role in enumerate(DEFAULT_ROLES):
+            cur.execute(
+                f"INSERT INTO roles ({', '.join(ROLE_COLUMNS)}, created_at) "
+                f"VALUES ({placeholders}) ON CONFLICT (id) DO UPDATE SET {updates}",
+                (*[getattr(role, col) for col in ROLE_COLUMNS], float(i))
+            )
+        cur.close()
+
+    @staticmethod
+    def _row_to_role(row) -> Role:
+        return Role(**dict(zip(ROLE_COLUMNS, row)))
+
+    async def get(self, role_id: str) -> Optional[Role]:
+        """按id获取角色：优先读缓存，未命中再查库；不存在的id也短时缓存，避免反复查库"""
+        cached = self._cache.get(role_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        row = await asyncio.to_thread(
+            self._execute, f"SELECT {', '.join(ROLE_COLUMNS)} FROM roles WHERE id = {{ph}}", (role_id,), "one"
+        )
+        now = time.monotonic()
+        if row is None:
+            # 未命中只缓存 miss_ttl 秒，其他worker新建的角色很快可见
+            self._cache[role_id] = (None, now + self.miss_ttl)
+            return None
+        role = self._row_to_role(row)
+        self._cache[role_id] = (role, now + self.cache_ttl)
+        return role
+
+    async def list_roles(self) -> List[Role]:
+        """获取全部角色（按创建顺序）"""
+        if self._all and self._all[1] > time.monotonic():
+            return self._all[0]
+
+        rows = await asyncio.to_thread(
+            self._execute, f"SELECT {', '.join(ROLE_COLUMNS)} FROM roles ORDER BY created_at, id", (), "all"
+        )
+        roles = [self._row_to_role(row) for row in rows]
+        expires_at = time.monotonic() + self.cache_ttl
+        self._all = (roles, expires_at)
+        for role in roles:
+            self._cache[role.id] = (role, expires_at)
+        return roles
+
+    @staticmethod
+    def _new_role_id(name: str) -> str:
+        """由名称生成id，附加随机后缀避免并发冲突"""
+        slug = re.sub(r"\s+", "_", name.strip().lower())
+        return f"{slug}_{uuid.uuid4().hex[:8]}"
+
+    async def create(self, role_req: RoleCreateRequest) -> Role:
+        """创建新角色并写入数据库"""
+        for _ in range(3):
+            role_id = self._new_role_id(role_req.name)
+            new_role = Role(
+                id=role_id,
+                name=role_req.name,
+                description=role_req.description,
+                system_prompt=role_req.system_prompt,
+                default_voice=role_req.default_voice,
+                avatar_url=f"https://picsum.photos/id/{1080 + int(role_id[-8:], 16) % 20}/200/200"
+            )
+            inserted = await asyncio.to_thread(
+                self._execute,
+                f"INSERT INTO roles ({', '.join(ROLE_COLUMNS)}, created_at) "
+                f"VALUES ({', '.join(['{ph}'] * (len(ROLE_COLUMNS) + 1))}) "
+                f"ON CONFLICT (id) DO NOTHING",
+                (*[getattr(new_role, col) for col in ROLE_COLUMNS], time.time())
+            ) == 1
+            if inserted:
+                self.invalidate(role_id)
+                self._cache[role_id] = (new_role, time.monotonic() + self.cache_ttl)
+                return new_role
+        raise RuntimeError("角色id生成冲突，请重试")
+
+    def invalidate(self, role_id: Optional[str] = None) -> None:
+        """清除缓存：指定id时只清除该角色"""
+        self._all = None
+        if role_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(role_id, None)
+
+
+# 创建全局角色仓库实例
+role_repository = RoleRepository(
+    cache_ttl=settings.ROLE_CACHE_TTL_SECONDS, miss_ttl=settings.ROLE_MISS_CACHE_TTL_SECONDS
+)
@@ -1,9 +1,20 @@
 """
 AI角色技能系统
 为每个角色定义专业技能和能力
+每轮对话按用户输入检索最相关的技能，只把这几个技能写入System Prompt（启动时为每个角色建立n-gram索引）
 """
-from typing import Dict, List, Any
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Any, Tuple
 from pydantic import BaseModel
+from app.core.config import settings
+
+# 每个管理器缓存的技能提示词组合数上限
+PROMPT_CACHE_SIZE = 256
+
+# 中文连续片段切成相邻二字组，英文和数字按词
+_TERM_PATTERN = re.compile(r"[\u4e00-\u9fff]+|[a-zA-Z0-9]+")
 
 
 class SkillConfig(BaseModel):
@@ -14,11 +25,71 @@ class SkillConfig(BaseModel):
     examples: List[str] = []
 
 
+def _terms(text: str) -> List[str]:
+    """切分检索词项"""
+    terms = []
+    for run in _TERM_PATTERN.findall(text.lower()):
+        if run.isascii() or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class SkillIndex:
+    """单个角色的技能检索索引：每个技能的 词项→权重（TF-IDF）
+    只出现在部分技能中的词项才有区分度，所有技能共有的词项权重为0；
+    只有一个技能时没有可比较的技能，词项只按词频计权，输入与技能相关时仍能选中"""
+
+    def __init__(self, skills: List[SkillConfig]):
+        self.skills = skills
+        counts = []
+        for skill in skills:
+            counter = Counter()
+            # 名称和简介比应用方法、示例更能代表技能
+            for term in _terms(f"{skill.name} {skill.description}"):
+                counter[term] += 2
+            for term in _terms(" ".join([skill.prompt_enhancement, *skill.examples])):
+                counter[term] += 1
+            counts.append(counter)
+        document_freq = Counter(term for counter in counts for term in counter)
+        total = len(skills)
+        if total == 1:
+            self.weights: List[Dict[str, float]] = [
+                {term: 1 + math.log(count) for term, count in counts[0].items()}
+            ]
+            return
+        self.weights = [
+            {
+                term: (1 + math.log(count)) * math.log(total / document_freq[term])
+                for term, count in counter.items() if document_freq[term] < total
+            }
+            for counter in counts
+        ]
+
+    def select(self, text: str, top_k: int, min_score: float) -> List[SkillConfig]:
+        """按相关度从高到低返回最多top_k个技能"""
+        terms = set(_terms(text))
+        if not terms:
+            return []
+        scored = []
+        for i, weights in enumerate(self.weights):
+            score = sum(weights.get(term, 0.0) for term in terms)
+            if score >= min_score:
+                scored.append((score, -i))
+        scored.sort(reverse=True)
+        return [self.skills[-i] for _, i in scored[:top_k]]
+
+
 class RoleSkills:
     """角色技能管理器"""
     
     def __init__(self):
         self.skills_db = self._init_skills_database()
+        # 技能检索索引（技能库固定，启动时建立）
+        self.indexes = {role_id: SkillIndex(skills) for role_id, skills in self.skills_db.items()}
+        # 拼接好的系统提示词，键为 (角色ID, 基础提示词, 技能名称, 是否详细)
+        self._prompt_cache: Dict[Tuple[str, str, Tuple[str, ...], bool], str] = {}
     
     def _init_skills_database(self) -> Dict[str, List[SkillConfig]]:
         """初始化技能数据库"""
@@ -164,15 +235,59 @@ class RoleSkills:
         return ""
     
     def get_enhanced_system_prompt(self, role_id: str, base_prompt: str) -> str:
-        """为角色生成增强的系统提示词"""
+        """为角色生成增强的系统提示词（包含全部技能）"""
+        names = tuple(skill.name for skill in self.get_role_skills(role_id))
+        return self._render_prompt(role_id, base_prompt, names, True)
+
+    def select_skills(self, role_id: str, user_input: str) -> List[SkillConfig]:
+        """按用户输入挑选最相关的技能"""
+        index = self.indexes.get(role_id)
+        if index is None:
+            return []
+        return index.select(user_input, settings.SKILL_ROUTER_TOP_K, settings.SKILL_ROUTER_MIN_SCORE)
+
+    def compose_system_prompt(self, role_id: str, base_prompt: str, user_input: str) -> str:
+        """生成本轮的系统提示词：只注入与用户输入相关的技能，没有相关技能时按 SKILL_ROUTER_FALLBACK 处理"""
         skills = self.get_role_skills(role_id)
         if not skills:
             return base_prompt
-        
+        if not settings.SKILL_ROUTER_ENABLED:
+            return self.get_enhanced_system_prompt(role_id, base_prompt)
+
+        selected = self.select_skills(role_id, user_input)
+        if selected:
+            return self._render_prompt(role_id, base_prompt, tuple(skill.name for skill in selected), True)
+        fallback = settings.SKILL_ROUTER_FALLBACK
+        if fallback == "all":
+            return self.get_enhanced_system_prompt(role_id, base_prompt)
+        if fallback == "names":
+            return self._render_prompt(role_id, base_prompt, tuple(skill.name for skill in skills), False)
+        return base_prompt
+
+    def _render_prompt(self, role_id: str, base_prompt: str, skill_names: Tuple[str, ...], detailed: bool) -> str:
+        """拼接技能说明（技能组合有限，结果缓存；相同组合的提示词完全一致）
+        detailed=False 时只列名称和简介，不含应用方法"""
+        if not skill_names:
+            return base_prompt
+        key = (role_id, base_prompt, skill_names, detailed)
+        prompt = self._prompt_cache.get(key)
+        if prompt is None:
+            prompt = self._build_prompt(role_id, base_prompt, skill_names, detailed)
+            if len(self._prompt_cache) >= PROMPT_CACHE_SIZE:
+                # 超出上限时丢弃最早缓存的组合
+                del self._prompt_cache[next(iter(self._prompt_cache))]
+            self._prompt_cache[key] = prompt
+        return prompt
+
+    def _build_prompt(self, role_id: str, base_prompt: str, skill_names: Tuple[str, ...], detailed: bool) -> str:
+        skills = {skill.name: skill for skill in self.get_role_skills(role_id)}
+
         skills_description = "\n\n你具备以下专业技能：\n"
-        for skill in skills:
+        for name in skill_names:
+            skill = skills[name]
             skills_description += f"- {skill.name}：{skill.description}\n"
-            skills_description += f"  应用方法：{skill.prompt_enhancement}\n"
+            if detailed:
+                skills_description += f"  应用方法：{skill.prompt_enhancement}\n"
         
         skills_description += "\n请根据对话内容灵活运用这些技能，为用户提供专业的指导和帮助。"
         
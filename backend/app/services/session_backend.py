@@ -0,0 +1,221 @@
+"""
+会话存储后端
+默认使用进程内存；配置Redis后会话可被任意worker/节点读取，无需粘性路由
+"""
+import json
+from typing import Dict, List, Any, Optional
+from app.core.config import settings
+from app.models.role import Role
+from app.services.session_store import SessionStore
+
+
+def _tokens(messages) -> int:
+    return sum(m.get("tokens") or 0 for m in messages)
+
+
+class SessionBackend:
+    """会话存储后端接口：保存角色绑定和对话历史"""
+
+    name = "base"
+
+    async def create(self, session_id: str, role: Role, history: List[Dict[str, str]]) -> bool:
+        """创建会话；会话已存在时不做任何修改（多个worker可能同时初始化同一会话），返回是否新建"""
+        raise NotImplementedError
+
+    async def exists(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    async def get_role(self, session_id: str) -> Optional[Role]:
+        """获取会话绑定的角色，同时刷新会话过期时间"""
+        raise NotImplementedError
+
+    async def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        """获取对话历史（副本）"""
+        raise NotImplementedError
+
+    async def history_tokens(self, session_id: str) -> int:
+        """对话历史的Token总数（各消息 "tokens" 字段之和，追加和删除时维护，读取为O(1)）"""
+        raise NotImplementedError
+
+    async def append(self, session_id: str, *messages: Dict[str, str]) -> None:
+        """向对话历史末尾追加消息"""
+        raise NotImplementedError
+
+    async def drop_oldest(self, session_id: str, count: int) -> None:
+        """删除最早的count条消息"""
+        raise NotImplementedError
+
+    async def close(self, session_id: str) -> None:
+        """删除会话"""
+        raise NotImplementedError
+
+    async def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        """释放后端连接（应用关闭时调用）"""
+
+
+class MemorySessionBackend(SessionBackend):
+    """进程内存后端：基于有界的SessionStore"""
+
+    name = "memory"
+
+    def __init__(self, store: Optional[SessionStore] = None):
+        self.store = store or SessionStore(
+            max_sessions=settings.MAX_SESSIONS,
+            ttl_seconds=settings.SESSION_TTL_SECONDS
+        )
+
+    async def create(self, session_id: str, role: Role, history: List[Dict[str, str]]) -> bool:
+        if session_id in self.store:
+            return False
+        self.store.create(session_id, {"role": role, "history": list(history), "tokens": _tokens(history)})
+        return True
+
+    async def exists(self, session_id: str) -> bool:
+        return session_id in self.store
+
+    async def get_role(self, session_id: str) -> Optional[Role]:
+        session = self.store.get(session_id)
+        return session["role"] if session else None
+
+    async def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        session = self.store.get(session_id)
+        return list(session["history"]) if session else []
+
+    async def history_tokens(self, session_id: str) -> int:
+        session = self.store.get(session_id)
+        return session["tokens"] if session else 0
+
+    async def append(self, session_id: str, *messages: Dict[str, str]) -> None:
+        session = self.store.get(session_id)
+        if session:
+            session["history"].extend(messages)
+            session["tokens"] += _tokens(messages)
+
+    async def drop_oldest(self, session_id: str, count: int) -> None:
+        session = self.store.get(session_id)
+        if session and count > 0:
+            session["tokens"] -= _tokens(session["history"][:count])
+            del session["history"][:count]
+
+    async def close(self, session_id: str) -> None:
+        self.store.close(session_id)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self.store.stats()}
+
+
+class RedisSessionBackend(SessionBackend):
+    """Redis后端：角色绑定存为字符串，对话历史存为列表（只追加），历史Token总数存为计数器，三者共用TTL"""
+
+    name = "redis"
+
+    def __init__(self, redis, ttl_seconds: int = 1800, key_prefix: str = "session:"):
+        # redis: redis.asyncio.Redis 或接口兼容的实现（如fakeredis）
+        self.redis = redis
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+        # 本进程统计计数（存活会话数由Redis过期机制决定）
+        self.created = 0
+        self.closed = 0
+
+    def _role_key(self, session_id: str) -> str:
+        return f"{self.key_prefix}{session_id}:role"
+
+    def _history_key(self, session_id: str) -> str:
+        return f"{self.key_prefix}{session_id}:history"
+
+    def _tokens_key(self, session_id: str) -> str:
+        return f"{self.key_prefix}{session_id}:tokens"
+
+    async def create(self, session_id: str, role: Role, history: List[Dict[str, str]]) -> bool:
+        # SET NX：只有一个worker能创建成功，其余worker不会覆盖角色绑定，也不会清空正在使用的对话历史
+        created = await self.redis.set(
+            self._role_key(session_id), role.model_dump_json(), ex=self.ttl_seconds, nx=True
+        )
+        if not created:
+            return False
+        if history:
+            history_key, tokens_key = self._history_key(session_id), self._tokens_key(session_id)
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.rpush(history_key, *[json.dumps(m, ensure_ascii=False) for m in history])
+            pipe.set(tokens_key, _tokens(history))
+            pipe.expire(history_key, self.ttl_seconds)
+            pipe.expire(tokens_key, self.ttl_seconds)
+            await pipe.execute()
+        self.created += 1
+        return True
+
+    async def exists(self, session_id: str) -> bool:
+        return bool(await self.redis.exists(self._role_key(session_id)))
+
+    async def get_role(self, session_id: str) -> Optional[Role]:
+        role_key, history_key = self._role_key(session_id), self._history_key(session_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(role_key)
+        pipe.expire(role_key, self.ttl_seconds)
+        pipe.expire(history_key, self.ttl_seconds)
+        pipe.expire(self._tokens_key(session_id), self.ttl_seconds)
+        raw, _, _, _ = await pipe.execute()
+        return Role.model_validate_json(raw) if raw else None
+
+    async def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        items = await self.redis.lrange(self._history_key(session_id), 0, -1)
+        return [json.loads(item) for item in items]
+
+    async def history_tokens(self, session_id: str) -> int:
+        return int(await self.redis.get(self._tokens_key(session_id)) or 0)
+
+    async def append(self, session_id: str, *messages: Dict[str, str]) -> None:
+        if not messages:
+            return
+        history_key, tokens_key = self._history_key(session_id), self._tokens_key(session_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.rpush(history_key, *[json.dumps(m, ensure_ascii=False) for m in messages])
+        pipe.incrby(tokens_key, _tokens(messages))
+        pipe.expire(history_key, self.ttl_seconds)
+        pipe.expire(tokens_key, self.ttl_seconds)
+        pipe.expire(self._role_key(session_id), self.ttl_seconds)
+        await pipe.execute()
+
+    async def drop_oldest(self, session_id: str, count: int) -> None:
+        if count <= 0:
+            return
+        history_key = self._history_key(session_id)
+        dropped = await self.redis.lrange(history_key, 0, count - 1)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.ltrim(history_key, len(dropped), -1)
+        pipe.decrby(self._tokens_key(session_id), _tokens(json.loads(item) for item in dropped))
+        await pipe.execute()
+
+    async def close(self, session_id: str) -> None:
+        deleted = await self.redis.delete(
+            self._role_key(session_id), self._history_key(session_id), self._tokens_key(session_id)
+        )
+        if deleted:
+            self.closed += 1
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "ttl_seconds": self.ttl_seconds,
+            "created": self.created,
+            "closed": self.closed,
+        }
+
+    async def aclose(self) -> None:
+        await self.redis.aclose()
+
+
+def create_session_backend() -> SessionBackend:
+    """根据配置创建会话后端：SESSION_BACKEND=redis且配置了REDIS_URL时使用Redis"""
+    if settings.SESSION_BACKEND == "redis":
+        if not settings.REDIS_URL:
+            print("未配置REDIS_URL，会话存储回退为内存模式")
+            return MemorySessionBackend()
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        return RedisSessionBackend(client, ttl_seconds=settings.SESSION_TTL_SECONDS)
+    return MemorySessionBackend()
@@ -0,0 +1,95 @@
+"""
+有界会话存储
+限制最大会话数并按空闲时间过期，超出容量时淘汰最久未使用的会话
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+class SessionStore:
+    """内存会话存储：LRU淘汰 + 空闲TTL过期"""
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        # 按最近访问时间排序：最久未访问的在最前
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        # 统计计数
+        self.created = 0
+        self.closed = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def _purge_expired(self, now: float) -> None:
+        """清理空闲超时的会话（从最久未访问的开始，遇到未过期的即停止）"""
+        while self._sessions:
+            session_id = next(iter(self._sessions))
+            if now - self._last_access[session_id] < self.ttl_seconds:
+                break
+            self._remove(session_id)
+            self.expired += 1
+
+    def _remove(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        self._last_access.pop(session_id, None)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话并刷新访问时间，不存在或已过期返回None"""
+        now = time.monotonic()
+        self._purge_expired(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        self._sessions.move_to_end(session_id)
+        self._last_access[session_id] = now
+        return session
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def create(self, session_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """创建会话，容量已满时淘汰最久未使用的会话"""
+        now = time.monotonic()
+        self._purge_expired(now)
+        if session_id in self._sessions:
+            self._remove(session_id)
+        while len(self._sessions) >= self.max_sessions:
+            oldest = next(iter(self._sessions))
+            self._remove(oldest)
+            self.evicted += 1
+        self._sessions[session_id] = data
+        self._last_access[session_id] = now
+        self.created += 1
+        return data
+
+    def close(self, session_id: str) -> bool:
+        """主动关闭会话（如WebSocket断开）"""
+        if session_id not in self._sessions:
+            return False
+        self._remove(session_id)
+        self.closed += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """会话统计信息"""
+        self._purge_expired(time.monotonic())
+        return {
+            "live": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "created": self.created,
+            "closed": self.closed,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
@@ -1,35 +1,68 @@
-from openai import AsyncOpenAI
 from app.core.config import settings
-from app.services.xunfei_tts import xunfei_tts_service
-from typing import AsyncGenerator, Dict
+from app.core.providers import tts_providers, openai_client, openai_status_error
+from app.services.tts_cache import tts_cache, TTSAudioWriter
+from app.core.metrics import TTS_DURATION_SECONDS, PROVIDER_ERRORS, elapsed
+from app.core.admission import admission, PRIORITY_INTERACTIVE
+from typing import AsyncGenerator, Dict, Optional, Union
 import base64
-import asyncio
+import struct
+import time
+
+# 二进制音频帧头：版本(1B) 标志位(1B，bit0=is_end) 保留(2B) 语句编号(4B) 块序号(4B)，网络字节序
+TTS_FRAME_HEADER = struct.Struct("!BBHII")
+TTS_FRAME_VERSION = 1
+TTS_FRAME_FLAG_END = 0x01
+
+
+def tts_chunk_to_json(tts_data: Dict) -> Dict:
+    """把内部tts-chunk事件转换为JSON帧（音频为Base64 data URL）"""
+    if "audio" in tts_data:
+        return tts_data
+    base64_chunk = base64.b64encode(tts_data["audio_bytes"]).decode("utf-8")
+    return {
+        "type": "tts-chunk",
+        "audio": f"data:audio/{tts_data.get('format', 'mp3')};base64,{base64_chunk}",
+        "seq": tts_data["seq"],
+        "is_end": tts_data["is_end"]
+    }
+
+
+def pack_tts_chunk(tts_data: Dict, utterance_id: int) -> bytes:
+    """把内部tts-chunk事件打包为二进制帧：帧头 + 原始音频"""
+    flags = TTS_FRAME_FLAG_END if tts_data["is_end"] else 0
+    header = TTS_FRAME_HEADER.pack(TTS_FRAME_VERSION, flags, 0, utterance_id, tts_data["seq"])
+    return b"".join((header, tts_data.get("audio_bytes", b"")))
 
 class TTSService:
     """文本转语音(TTS)服务：封装OpenAI TTS接口和讯飞TTS接口"""
     def __init__(self):
         self.provider = getattr(settings, 'TTS_PROVIDER', 'xunfei')  # 默认使用讯飞
-        self.client = None
-        if settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != "sk-test-placeholder-key":
-            try:
-                self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            except Exception as e:
-                print(f"TTS初始化失败: {e}")
-                self.client = None
+        # 服务商（含OpenAI客户端）在首次合成时才加载，见 app/core/providers.py
+
+    def _active_provider(self) -> Optional[str]:
+        """当前可用的TTS服务商，均未配置时返回None"""
+        if self.provider == "loopback":
+            return "loopback"
+        if self.provider == "xunfei" and hasattr(settings, 'XUNFEI_API_KEY') and settings.XUNFEI_API_KEY:
+            return "xunfei"
+        if openai_client():
+            return "openai"
+        return None
+
+    def caching_provider(self) -> Optional[str]:
+        """合成结果会写入磁盘缓存的当前服务商；缓存未开启、服务商未配置或其结果不缓存时返回None"""
+        provider = self._active_provider()
+        if provider is None or not settings.TTS_CACHE_ENABLED or not self._cacheable(provider):
+            return None
+        return provider
 
     async def text_to_speech_stream(
-        self, text: str, voice: str = "alloy"
+        self, text: str, voice: str = "alloy", priority: int = PRIORITY_INTERACTIVE
     ) -> AsyncGenerator[Dict[str, str], None]:
-        """流式生成音频，分块返回Base64编码的MP3"""
-        
-        # 优先使用讯飞TTS
-        if self.provider == "xunfei" and hasattr(settings, 'XUNFEI_API_KEY') and settings.XUNFEI_API_KEY:
-            async for result in xunfei_tts_service.text_to_speech_stream(text, voice):
-                yield result
-            return
-            
-        # 使用OpenAI TTS
-        if not self.client:
+        """流式生成音频，分块返回原始MP3（发送时再编码）；相同文本优先读取磁盘缓存
+        priority：上游名额紧张时的排队优先级（见 app/core/admission.py）"""
+        provider = self._active_provider()
+        if provider is None:
             # 模拟TTS输出
             yield {
                 "type": "tts-chunk",
@@ -38,39 +71,108 @@ class TTSService:
                 "is_end": True
             }
             return
-            
+
         # 处理过长文本
-        if len(text) > 4000:
+        if provider == "openai" and len(text) > 4000:
             text = text[:3997] + "..."
             yield {"type": "tts-warning", "message": "文本过长，已截断"}
 
+        writer = None
+        if settings.TTS_CACHE_ENABLED and self._cacheable(provider):
+            cache_voice = tts_providers.get("xunfei")._get_voice_name(voice) if provider == "xunfei" else voice
+            cache_key = tts_cache.make_key(provider, cache_voice, text, "mp3")
+            cached_path = await tts_cache.lookup(cache_key)
+            if cached_path:
+                async for tts_data in self._audio_frames(self._read_cached(cached_path), provider, cached=True):
+                    yield tts_data
+                return
+            writer = tts_cache.writer(cache_key)
+
+        synthesis = admission.run("tts", provider, priority, lambda: self._synthesize(provider, text, voice))
+        async for tts_data in self._audio_frames(synthesis, provider, writer=writer):
+            yield tts_data
+
+    @staticmethod
+    def _cacheable(provider: str) -> bool:
+        """服务商的合成结果能否写入缓存：返回模拟音频的服务商（cacheable=False）不缓存，
+        否则接入真实接口后仍会命中缓存里的模拟音频"""
+        if provider in tts_providers:
+            return getattr(tts_providers.get(provider), "cacheable", True)
+        return True
+
+    async def _synthesize(
+        self, provider: str, text: str, voice: str
+    ) -> AsyncGenerator[Union[bytes, Dict[str, str]], None]:
+        """调用服务商合成音频：产出状态事件（dict）和音频数据（bytes）"""
+        if provider in tts_providers:
+            async for item in tts_providers.get(provider).synthesize(text, voice):
+                yield item
+            return
+
         try:
-            # 调用TTS接口生成音频
-            response = await self.client.audio.speech.create(
+            # 流式调用TTS接口：音频边到达边转发，不等待整段合成完成
+            async with openai_client().audio.speech.with_streaming_response.create(
                 model=settings.TTS_MODEL_NAME,
                 voice=voice,
                 input=text,
                 response_format="mp3"
-            )
-            audio_bytes = await response.aread()
-
-            # 分块处理并返回
-            chunk_size = 1024
-            total_chunks = len(audio_bytes) // chunk_size + 1
-            for i in range(total_chunks):
-                start = i * chunk_size
-                end = start + chunk_size
-                chunk = audio_bytes[start:end]
-                base64_chunk = base64.b64encode(chunk).decode("utf-8")
-                yield {
-                    "type": "tts-chunk",
-                    "audio": f"data:audio/mp3;base64,{base64_chunk}",
-                    "seq": i,
-                    "is_end": i == total_chunks - 1
-                }
-                await asyncio.sleep(0.05)
+            ) as response:
+                async for chunk in response.iter_bytes(settings.TTS_CHUNK_SIZE):
+                    yield chunk
         except Exception as e:
-            yield {"type": "tts-error", "message": f"语音生成失败：{str(e)}"}
+            # 附带状态码和Retry-After，供准入控制识别限流（429）
+            yield {"type": "tts-error", "message": f"语音生成失败：{str(e)}", **(openai_status_error(e) or {})}
+
+    @staticmethod
+    async def _read_cached(path: str) -> AsyncGenerator[memoryview, None]:
+        """按块读取缓存的音频文件"""
+        async for chunk in tts_cache.iter_chunks(path, settings.TTS_CHUNK_SIZE):
+            yield chunk
+
+    async def _audio_frames(
+        self, items: AsyncGenerator, provider: str,
+        writer: Optional[TTSAudioWriter] = None, cached: bool = False
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """把音频数据编号为tts-chunk（仅最后一块is_end=True），状态事件原样透传；成功后写入缓存"""
+        start_time = time.perf_counter()
+        seq = 0
+        pending = None
+        failed = False
+        async for item in items:
+            if isinstance(item, dict):
+                if item.get("type") == "tts-error":
+                    failed = True
+                yield item
+                continue
+            if writer:
+                writer.write(item)
+            # memoryview切片不复制数据
+            view = memoryview(item)
+            for start in range(0, len(view), settings.TTS_CHUNK_SIZE):
+                # 暂存一块，收到下一块后才能确定上一块不是结尾
+                if pending is not None:
+                    yield self._chunk_frame(pending, seq, False)
+                    seq += 1
+                pending = view[start:start + settings.TTS_CHUNK_SIZE]
+        if pending is not None:
+            yield self._chunk_frame(pending, seq, True)
+        if failed:
+            PROVIDER_ERRORS.labels("tts", provider).inc()
+            return
+        TTS_DURATION_SECONDS.labels(provider, "true" if cached else "false").observe(elapsed(start_time))
+        if writer:
+            await writer.commit()
+
+    @staticmethod
+    def _chunk_frame(chunk: memoryview, seq: int, is_end: bool) -> Dict:
+        """内部tts-chunk事件：携带原始音频，发送时再按连接协商的格式编码"""
+        return {
+            "type": "tts-chunk",
+            "audio_bytes": chunk,
+            "format": "mp3",
+            "seq": seq,
+            "is_end": is_end
+        }
 
 # 创建全局TTS服务实例
 tts_service = TTSService()
\ No newline at end of file
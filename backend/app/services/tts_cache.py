@@ -0,0 +1,185 @@
+"""
+TTS音频磁盘缓存
+按（键版本、服务商、音色、规范化文本、格式）的内容哈希保存合成结果，超出容量按LRU淘汰
+磁盘读写都在线程中执行，不阻塞事件循环；索引在应用启动时加载（见 load）
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from app.core.config import settings
+from app.core.database import BACKEND_DIR
+
+# 缓存键版本：音频格式或缓存内容的含义变化时递增，旧文件不再命中，随后按LRU淘汰
+CACHE_KEY_VERSION = "2"
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：全角半角统一、合并空白，保证同一句话命中同一缓存"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TTSAudioWriter:
+    """缓存写入器：合成过程中累积音频，完整结束后原子落盘"""
+
+    def __init__(self, cache: "TTSAudioCache", key: str):
+        self.cache = cache
+        self.key = key
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+
+    async def commit(self) -> None:
+        """合成成功后写入缓存（中途失败则不调用，不会留下残缺文件）"""
+        if self._buffer:
+            await self.cache.store(self.key, self._buffer)
+
+
+class TTSAudioCache:
+    """内容寻址的音频文件缓存"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 索引：{key: (文件大小, 最近访问时间)}，启动时扫描目录建立
+        self._index: Optional[Dict[str, Tuple[int, float]]] = None
+        self.total_bytes = 0
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(provider: str, voice: str, text: str, audio_format: str = "mp3") -> str:
+        raw = "\x1f".join([CACHE_KEY_VERSION, provider, voice, audio_format, normalize_text(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.audio")
+
+    def _scan(self) -> Dict[str, Tuple[int, float]]:
+        """扫描缓存目录（在线程中执行）"""
+        index = {}
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".audio"):
+                        continue
+                    stat = os.stat(os.path.join(root, name))
+                    index[name[:-len(".audio")]] = (stat.st_size, stat.st_mtime)
+        return index
+
+    async def load(self) -> Dict[str, Tuple[int, float]]:
+        """建立索引（进程内仅一次，应用启动时调用）"""
+        if self._index is None:
+            index = await asyncio.to_thread(self._scan)
+            if self._index is None:
+                self._index = index
+                self.total_bytes = sum(size for size, _ in index.values())
+        return self._index
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """查找缓存文件，命中返回文件路径"""
+        index = await self.load()
+        entry = index.get(key)
+        path = self._path(key)
+        if entry is None or not await asyncio.to_thread(os.path.exists, path):
+            if entry is not None:
+                # 文件被外部删除，修正索引
+                index.pop(key, None)
+                self.total_bytes -= entry[0]
+            self.misses += 1
+            return None
+        index[key] = (entry[0], time.time())
+        self.hits += 1
+        return path
+
+    def writer(self, key: str) -> TTSAudioWriter:
+        return TTSAudioWriter(self, key)
+
+    @staticmethod
+    def _write_file(path: str, audio: bytes) -> None:
+        """先写临时文件再原子替换（在线程中执行）"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+    async def store(self, key: str, audio: bytes) -> None:
+        """写入音频文件，并按容量淘汰"""
+        index = await self.load()
+        await asyncio.to_thread(self._write_file, self._path(key), audio)
+
+        old = index.get(key)
+        if old is not None:
+            self.total_bytes -= old[0]
+        index[key] = (len(audio), time.time())
+        self.total_bytes += len(audio)
+        self.stores += 1
+        await self._evict(keep=key)
+
+    async def _evict(self, keep: str) -> None:
+        """超出容量时按最近访问时间淘汰：先在索引中摘除，再在线程中删除文件"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        index = self._index
+        victims: List[str] = []
+        for key, (size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            del index[key]
+            self.total_bytes -= size
+            self.evictions += 1
+            victims.append(self._path(key))
+        if victims:
+            await asyncio.to_thread(self._remove_files, victims)
+
+    @staticmethod
+    def _remove_files(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def iter_chunks(self, path: str, chunk_size: int) -> AsyncIterator[memoryview]:
+        """在线程中一次读入缓存文件（单句音频不大），按块返回切片（不再复制）"""
+        view = memoryview(await asyncio.to_thread(self._read_file, path))
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    def stats(self) -> Dict[str, Any]:
+        index = self._index or {}
+        lookups = self.hits + self.misses
+        return {
+            "dir": self.cache_dir,
+            "files": len(index),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+# 创建全局TTS缓存实例
+tts_cache = TTSAudioCache(
+    cache_dir=settings.TTS_CACHE_DIR or os.path.join(BACKEND_DIR, "data", "tts_cache"),
+    max_bytes=settings.TTS_CACHE_MAX_BYTES
+)
@@ -0,0 +1,158 @@
+"""
+分句流水线TTS
+LLM逐Token输出时按句切分，每句话一结束就提交TTS合成，使语音合成与文本生成重叠进行
+"""
+import asyncio
+from typing import AsyncGenerator, Dict, List, Optional
+from app.services.tts import tts_service
+
+# 句末标点：中文与西文
+SENTENCE_ENDINGS = "。！？；…!?;\n"
+# 紧跟在句末标点后、应归入同一句的收尾符号
+CLOSING_MARKS = "”’」』）)】\"'"
+
+
+class SentenceSegmenter:
+    """增量分句器：逐Token喂入，返回已完整的句子"""
+
+    def __init__(self, min_chars: int = 8):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def _find_boundary(self, start: int) -> int:
+        """返回从start开始的第一个句子边界（句末之后的下标），未找到返回-1"""
+        text = self._buffer
+        i = start
+        while i < len(text):
+            ch = text[i]
+            is_end = ch in SENTENCE_ENDINGS
+            # 西文句号需后跟空白才算句末，避免切开小数和缩写
+            if ch == "." and i + 1 < len(text) and text[i + 1].isspace():
+                is_end = True
+            if is_end:
+                end = i + 1
+                while end < len(text) and (text[end] in SENTENCE_ENDINGS or text[end] in CLOSING_MARKS):
+                    end += 1
+                # 收尾符号可能还没到达，等待下一个Token再判断
+                if end == len(text) and ch not in "\n":
+                    return -1
+                return end
+            i += 1
+        return -1
+
+    def feed(self, token: str) -> List[str]:
+        """喂入一个Token，返回本次新切出的句子"""
+        self._buffer += token
+        sentences = []
+        start = 0
+        while True:
+            boundary = self._find_boundary(start)
+            if boundary < 0:
+                break
+            # 过短的片段与下一句合并，减少TTS调用次数
+            if len(self._buffer[:boundary].strip()) < self.min_chars:
+                start = boundary
+                continue
+            sentence = self._buffer[:boundary].strip()
+            self._buffer = self._buffer[boundary:]
+            start = 0
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """取出剩余文本（LLM输出结束时调用）"""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+
+class TTSPipeline:
+    """并发合成各句语音，并按句子顺序输出重新编号的tts-chunk"""
+
+    _END = object()
+
+    def __init__(self, voice: str, max_concurrency: int = 2):
+        self.voice = voice
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # 按提交顺序排列的句子：(事件队列, 合成任务)
+        self._segments: asyncio.Queue = asyncio.Queue()
+        self._output: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._order_task = asyncio.create_task(self._emit_in_order())
+
+    async def _synthesize(self, text: str, events: asyncio.Queue) -> None:
+        """合成单句语音，事件写入该句自己的队列"""
+        try:
+            async with self._semaphore:
+                async for tts_data in tts_service.text_to_speech_stream(text=text, voice=self.voice):
+                    await events.put(tts_data)
+        except Exception as e:
+            await events.put({"type": "tts-error", "message": f"语音生成失败：{str(e)}"})
+        finally:
+            await events.put(self._END)
+
+    def submit(self, text: str) -> None:
+        """提交一句文本进行合成"""
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._synthesize(text, events))
+        self._tasks.append(task)
+        self._segments.put_nowait((events, task))
+
+    def close(self) -> None:
+        """不再提交新句子"""
+        self._segments.put_nowait(self._END)
+
+    async def _emit_in_order(self) -> None:
+        """按句子顺序转发事件，音频块统一编号，仅最后一块标记is_end"""
+        seq = 0
+        pending: Optional[Dict] = None
+        try:
+            while True:
+                segment = await self._segments.get()
+                if segment is self._END:
+                    break
+                events, _ = segment
+                while True:
+                    tts_data = await events.get()
+                    if tts_data is self._END:
+                        break
+                    if tts_data.get("type") != "tts-chunk":
+                        await self._output.put(tts_data)
+                        continue
+                    # 暂存一块，收到下一块后才能确定上一块不是结尾
+                    if pending is not None:
+                        await self._output.put(pending)
+                    pending = {**tts_data, "seq": seq, "is_end": False}
+                    seq += 1
+            if pending is not None:
+                pending["is_end"] = True
+                await self._output.put(pending)
+        finally:
+            await self._output.put(self._END)
+
+    def drain_ready(self) -> List[Dict]:
+        """非阻塞取出当前已就绪的事件（在LLM Token之间穿插发送）"""
+        ready = []
+        while not self._output.empty():
+            tts_data = self._output.get_nowait()
+            if tts_data is self._END:
+                # 结束标记放回，交给remaining()处理
+                self._output.put_nowait(tts_data)
+                break
+            ready.append(tts_data)
+        return ready
+
+    async def remaining(self) -> AsyncGenerator[Dict, None]:
+        """阻塞输出剩余全部事件，直到所有句子合成完毕"""
+        while True:
+            tts_data = await self._output.get()
+            if tts_data is self._END:
+                return
+            yield tts_data
+
+    def cancel(self) -> None:
+        """取消所有未完成的合成任务"""
+        for task in self._tasks:
+            task.cancel()
+        self._order_task.cancel()
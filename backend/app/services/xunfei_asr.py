@@ -17,7 +17,7 @@ class XunfeiASRService:
     async def transcribe_stream(self, audio_data) -> AsyncGenerator[dict, None]:
         """
         流式语音识别
-        audio_data: 音频数据（bytes或文件对象）
+        audio_data: 音频数据（bytes、文件对象或逐帧产出bytes的异步迭代器）
         """
         
         if not all([self.api_key, self.app_id, self.api_secret]):
@@ -29,7 +29,11 @@ class XunfeiASRService:
         
         try:
             # 读取音频数据
-            if hasattr(audio_data, 'read'):
+            if hasattr(audio_data, '__aiter__'):
+                # 流式输入：边接收边消费音频帧；模拟实现没有真实的中间识别文本，不产出stt-interim
+                async for _ in audio_data:
+                    pass
+            elif hasattr(audio_data, 'read'):
                 audio_bytes = await audio_data.read()
             else:
                 audio_bytes = audio_data
@@ -1,7 +1,7 @@
 """
 讯飞语音合成服务 - 简化版
 """
-from typing import AsyncGenerator, Dict
+from typing import AsyncGenerator, Dict, Union
 import asyncio
 import base64
 from app.core.config import settings
@@ -9,6 +9,9 @@ from app.core.config import settings
 
 class XunfeiTTSService:
     """讯飞语音合成服务"""
+
+    # 尚未接入真实接口，合成结果是模拟音频，不写入TTS缓存
+    cacheable = False
     
     def __init__(self):
         self.api_key = settings.XUNFEI_API_KEY
@@ -39,12 +42,15 @@ class XunfeiTTSService:
         
         return voice_map.get(voice, 'xiaoyan')
         
-    async def text_to_speech_stream(
+    def is_configured(self) -> bool:
+        return all([self.api_key, self.app_id, self.api_secret])
+
+    async def synthesize(
         self, text: str, voice: str = "alloy"
-    ) -> AsyncGenerator[Dict[str, str], None]:
-        """流式生成音频，分块返回Base64编码的音频"""
+    ) -> AsyncGenerator[Union[bytes, Dict[str, str]], None]:
+        """合成原始音频：依次产出状态事件（dict）和音频数据（bytes）"""
         
-        if not all([self.api_key, self.app_id, self.api_secret]):
+        if not self.is_configured():
             yield {
                 "type": "tts-error",
                 "message": "讯飞语音合成未配置或配置错误"
@@ -66,14 +72,7 @@ class XunfeiTTSService:
             
             # TODO: 实现真正的讯飞TTS API调用
             # 这里先使用模拟音频数据
-            mock_audio = base64.b64encode(b"mock_audio_data").decode('utf-8')
-            
-            yield {
-                "type": "tts-chunk",
-                "audio": f"data:audio/mp3;base64,{mock_audio}",
-                "seq": 0,
-                "is_end": True
-            }
+            yield b"mock_audio_data"
             
         except Exception as e:
             yield {
@@ -81,6 +80,24 @@ class XunfeiTTSService:
                 "message": f"语音合成异常：{str(e)}"
             }
 
+    async def text_to_speech_stream(
+        self, text: str, voice: str = "alloy"
+    ) -> AsyncGenerator[Dict[str, str], None]:
+        """流式生成音频，分块返回Base64编码的音频"""
+        audio = bytearray()
+        async for item in self.synthesize(text, voice):
+            if isinstance(item, dict):
+                yield item
+            else:
+                audio += item
+        if audio:
+            yield {
+                "type": "tts-chunk",
+                "audio": f"data:audio/mp3;base64,{base64.b64encode(audio).decode('utf-8')}",
+                "seq": 0,
+                "is_end": True
+            }
+
 
 # 创建讯飞TTS服务实例
 xunfei_tts_service = XunfeiTTSService()
\ No newline at end of file
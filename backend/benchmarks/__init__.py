@@ -0,0 +1,3 @@
+"""
+性能压测（不属于测试用例，手动运行）
+"""
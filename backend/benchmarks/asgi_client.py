@@ -0,0 +1,167 @@
+"""
+进程内ASGI客户端（WebSocket与流式HTTP）
+直接调用ASGI应用，不经过网络和事件循环线程切换，压测结果只反映服务端自身开销
+"""
+import asyncio
+from typing import Any, Dict, Optional, Union
+
+
+class ASGIWebSocketClosed(Exception):
+    """服务端关闭了WebSocket"""
+
+    def __init__(self, code: int = 1000, reason: str = ""):
+        super().__init__(f"WebSocket closed: {code} {reason}")
+        self.code = code
+        self.reason = reason
+
+
+class ASGIWebSocket:
+    """单个进程内WebSocket连接"""
+
+    def __init__(self, app, path: str, query_string: str = ""):
+        self.app = app
+        self.path = path
+        self.query_string = query_string
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "http_version": "1.1",
+            "path": self.path,
+            "raw_path": self.path.encode(),
+            "root_path": "",
+            "query_string": self.query_string.encode(),
+            "headers": [(b"host", b"benchmark")],
+            "client": ("127.0.0.1", 0),
+            "server": ("benchmark", 80),
+            "subprotocols": [],
+        }
+        self._task = asyncio.create_task(self.app(scope, self._to_app.get, self._from_app.put))
+        await self._to_app.put({"type": "websocket.connect"})
+        message = await self._next()
+        if message["type"] != "websocket.accept":
+            raise ASGIWebSocketClosed(message.get("code", 1000), message.get("reason", ""))
+
+    async def _next(self) -> Dict[str, Any]:
+        """等待服务端的下一条消息；服务端处理结束且无消息时视为关闭"""
+        get = asyncio.ensure_future(self._from_app.get())
+        done, _ = await asyncio.wait({get, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        if get in done:
+            return get.result()
+        get.cancel()
+        if not self._from_app.empty():
+            return self._from_app.get_nowait()
+        self._task.result()
+        raise ASGIWebSocketClosed()
+
+    async def send_text(self, text: str) -> None:
+        await self._to_app.put({"type": "websocket.receive", "text": text})
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self._to_app.put({"type": "websocket.receive", "bytes": data})
+
+    async def receive(self) -> Union[str, bytes]:
+        """接收一条文本或二进制消息"""
+        message = await self._next()
+        if message["type"] == "websocket.close":
+            raise ASGIWebSocketClosed(message.get("code", 1000), message.get("reason", ""))
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        return message["text"]
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """客户端断开，等待服务端处理结束"""
+        if self._task is None:
+            return
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+        self._task = None
+
+    async def __aenter__(self) -> "ASGIWebSocket":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+
+class ASGIHTTPError(Exception):
+    """HTTP接口返回错误状态码"""
+
+    def __init__(self, status: int, body: bytes):
+        super().__init__(f"HTTP {status}: {body[:200]!r}")
+        self.status = status
+        self.body = body
+
+
+async def stream_http(
+    app,
+    method: str,
+    path: str,
+    query_string: str = "",
+    headers: Optional[Dict[str, str]] = None,
+    body: bytes = b""
+):
+    """进程内发起HTTP请求，按服务端发送的顺序逐块产出响应体
+    （httpx.ASGITransport会等整个响应结束才返回，无法测量首包时间）"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": [(b"host", b"benchmark")] + [
+            (key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in (headers or {}).items()
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    from_app: asyncio.Queue = asyncio.Queue()
+    finished = asyncio.Event()
+    request_sent = False
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # 响应结束前不报告断开，否则流式响应会被提前取消
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    task = asyncio.create_task(app(scope, receive, from_app.put))
+    try:
+        start = await from_app.get()
+        status = start["status"]
+        error_body = bytearray()
+        while True:
+            message = await from_app.get()
+            if message["type"] != "http.response.body":
+                continue
+            chunk = message.get("body", b"")
+            if status >= 400:
+                error_body += chunk
+            elif chunk:
+                yield chunk
+            if not message.get("more_body", False):
+                break
+        if status >= 400:
+            raise ASGIHTTPError(status, bytes(error_body))
+    finally:
+        finished.set()
+        try:
+            await asyncio.wait_for(task, timeout=5.0)
+        except (asyncio.TimeoutError, Exception):
+            task.cancel()
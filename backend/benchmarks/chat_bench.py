@@ -0,0 +1,396 @@
+"""
+聊天链路端到端压测
+在进程内启动ASGI应用，LLM/ASR/TTS均使用回环服务商（见 app/core/loopback.py），
+并发N个会话驱动 WebSocket聊天、/api/chat/text、/api/chat/tts、/api/chat/asr，
+统计首Token时间、首音频时间、文本输出速率、延迟分位数、音频帧速率和每会话内存，结果写入JSON便于不同提交间对比
+
+用法（在backend目录下）：
+    python -m benchmarks.chat_bench --sessions 50 --turns 3 --output bench.json
+    python -m benchmarks.chat_bench --compare bench-before.json --output bench-after.json
+回环服务商的延迟、速率等参数可通过 LOOPBACK_* 环境变量调整
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+SCENARIOS = ["ws", "text", "tts", "asr"]
+PROMPT = "请介绍一下你自己，并讲一个你最难忘的经历。"
+TTS_TEXT = "这是一段用于压测的语音合成文本。它包含两句话，长度接近一次普通回复中的一句。"
+
+
+def _configure_environment(args: argparse.Namespace) -> None:
+    """导入应用前设置环境变量：回环服务商、临时数据库，已设置的变量不覆盖"""
+    workdir = tempfile.mkdtemp(prefix="chat_bench_")
+    defaults = {
+        "LLM_PROVIDER": "loopback",
+        "ASR_PROVIDER": "loopback",
+        "TTS_PROVIDER": "loopback",
+        "SESSION_BACKEND": "memory",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts_cache"),
+        # 默认每次都真实合成，只测缓存命中时用 --tts-cache
+        "TTS_CACHE_ENABLED": "true" if args.tts_cache else "false",
+        "LLM_CACHE_ROLES": "[]",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def _rss_bytes() -> int:
+    """当前进程常驻内存"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    # 非Linux：退化为峰值常驻内存（macOS单位为字节，其余为KB）；Windows没有resource模块，不统计内存
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3),
+    }
+
+
+class ScenarioRecorder:
+    """单个场景的测量结果"""
+
+    def __init__(self, name: str, sessions: int):
+        self.name = name
+        self.sessions = sessions
+        self.latency_ms: List[float] = []
+        self.ttft_ms: List[float] = []
+        self.ttfa_ms: List[float] = []
+        self.chars_per_s: List[float] = []
+        self.token_frames = 0
+        self.final_ms: List[float] = []  # 得到最终结果（如ASR最终识别文本）的时间
+        self.frames = 0
+        self.audio_bytes = 0
+        self.requests = 0
+        self.errors: Dict[str, int] = {}
+        self.wall_s = 0.0
+        self.rss_before = 0
+        self.rss_peak = 0
+
+    def error(self, message: str) -> None:
+        self.errors[message] = self.errors.get(message, 0) + 1
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "sessions": self.sessions,
+            "requests": self.requests,
+            "errors": sum(self.errors.values()),
+            "error_messages": self.errors,
+            "wall_s": round(self.wall_s, 3),
+            "requests_per_s": round(self.requests / self.wall_s, 3) if self.wall_s else None,
+            "latency_ms": summarize(self.latency_ms),
+            "ttft_ms": summarize(self.ttft_ms),
+            "ttfa_ms": summarize(self.ttfa_ms),
+            "chars_per_s": summarize(self.chars_per_s),
+            "token_frames": self.token_frames,
+            "final_ms": summarize(self.final_ms),
+            "frames": self.frames,
+            "frames_per_s": round(self.frames / self.wall_s, 3) if self.wall_s else None,
+            "audio_bytes": self.audio_bytes,
+            "rss_before_bytes": self.rss_before,
+            "rss_peak_bytes": self.rss_peak,
+            "rss_per_session_bytes": max(0, self.rss_peak - self.rss_before) // max(self.sessions, 1),
+        }
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+async def ws_session(app, index: int, args: argparse.Namespace, rec: ScenarioRecorder) -> None:
+    """WebSocket会话：每轮发送文本，收到带结束标记的最后一块音频视为本轮结束"""
+    from app.services.tts import TTS_FRAME_HEADER, TTS_FRAME_FLAG_END
+    from benchmarks.asgi_client import ASGIWebSocket
+
+    path = f"/api/chat/ws/session/api/bench_ws_{index}/{args.role}"
+    query = "audio_format=binary"
+    if args.coalesce_ms is not None:
+        query += f"&coalesce_ms={args.coalesce_ms}"
+    async with ASGIWebSocket(app, path, query) as ws:
+        for _ in range(args.turns):
+            rec.requests += 1
+            start = time.perf_counter()
+            ttft = ttfa = last_token = None
+            chars = 0
+            end = None
+            await ws.send_text(PROMPT)
+            while True:
+                try:
+                    message = await asyncio.wait_for(ws.receive(), timeout=args.idle_timeout)
+                except asyncio.TimeoutError:
+                    # 没有收到结束标记（例如关闭了TTS），以最后一条消息的时间为准
+                    rec.error("idle timeout")
+                    break
+                end = _elapsed_ms(start)
+                if isinstance(message, bytes):
+                    rec.frames += 1
+                    rec.audio_bytes += len(message) - TTS_FRAME_HEADER.size
+                    ttfa = ttfa if ttfa is not None else end
+                    if TTS_FRAME_HEADER.unpack_from(message)[1] & TTS_FRAME_FLAG_END:
+                        break
+                    continue
+                event = json.loads(message)
+                if event["type"] == "llm-token":
+                    # 服务端可能合并多个Token为一帧，速率按字符统计
+                    rec.token_frames += 1
+                    chars += len(event["token"])
+                    ttft = ttft if ttft is not None else end
+                    last_token = end
+                elif event["type"].endswith("-error"):
+                    rec.error(event["type"])
+                    break
+            if end is not None:
+                rec.latency_ms.append(end)
+            if ttft is not None:
+                rec.ttft_ms.append(ttft)
+                if last_token > ttft:
+                    rec.chars_per_s.append(chars / ((last_token - ttft) / 1000))
+            if ttfa is not None:
+                rec.ttfa_ms.append(ttfa)
+
+
+async def text_session(app, index: int, args: argparse.Namespace, rec: ScenarioRecorder) -> None:
+    """文本聊天接口：同一会话连续多轮"""
+    from benchmarks.asgi_client import stream_http, ASGIHTTPError
+
+    for _ in range(args.turns):
+        rec.requests += 1
+        body = json.dumps({
+            "role_id": args.role, "message": PROMPT, "session_id": f"bench_text_{index}"
+        }).encode("utf-8")
+        start = time.perf_counter()
+        try:
+            async for _ in stream_http(app, "POST", "/api/chat/text",
+                                       headers={"content-type": "application/json"}, body=body):
+                pass
+        except ASGIHTTPError as e:
+            rec.error(f"HTTP {e.status}")
+            continue
+        rec.latency_ms.append(_elapsed_ms(start))
+
+
+async def _stream_events(
+    app, rec: ScenarioRecorder, path: str, final_marker: Optional[str] = None, **kwargs
+) -> None:
+    """读取SSE响应，统计首个音频块时间、音频块数和得到最终结果的时间"""
+    from benchmarks.asgi_client import stream_http, ASGIHTTPError
+
+    start = time.perf_counter()
+    ttfa = final = None
+    try:
+        async for chunk in stream_http(app, "POST", path, **kwargs):
+            text = chunk.decode("utf-8", errors="replace")
+            if "tts-chunk" in text:
+                rec.frames += text.count("tts-chunk")
+                ttfa = ttfa if ttfa is not None else _elapsed_ms(start)
+            if "-error" in text:
+                rec.error(f"{path} error event")
+            if final_marker and final is None and final_marker in text:
+                final = _elapsed_ms(start)
+    except ASGIHTTPError as e:
+        rec.error(f"HTTP {e.status}")
+        return
+    rec.latency_ms.append(_elapsed_ms(start))
+    if ttfa is not None:
+        rec.ttfa_ms.append(ttfa)
+    if final is not None:
+        rec.final_ms.append(final)
+
+
+async def tts_session(app, index: int, args: argparse.Namespace, rec: ScenarioRecorder) -> None:
+    """TTS接口：每次合成不同文本，避免命中缓存"""
+    from urllib.parse import urlencode
+
+    for turn in range(args.turns):
+        rec.requests += 1
+        query = urlencode({"text": f"{TTS_TEXT}（{index}-{turn}）", "voice": "alloy"})
+        await _stream_events(app, rec, "/api/chat/tts", query_string=query)
+
+
+async def asr_session(app, index: int, args: argparse.Namespace, rec: ScenarioRecorder) -> None:
+    """ASR接口：上传一段合成的语音文件（16kHz 16bit单声道）"""
+    import httpx
+
+    audio = os.urandom(int(args.asr_seconds * 16000 * 2))
+    request = httpx.Request("POST", "http://benchmark/api/chat/asr",
+                            files={"file": (f"bench_{index}.pcm", audio, "audio/pcm")})
+    body = request.read()
+    headers = {"content-type": request.headers["content-type"]}
+    for _ in range(args.turns):
+        rec.requests += 1
+        await _stream_events(app, rec, "/api/chat/asr", final_marker="stt-final", headers=headers, body=body)
+
+
+SESSION_RUNNERS = {
+    "ws": ws_session,
+    "text": text_session,
+    "tts": tts_session,
+    "asr": asr_session,
+}
+
+
+async def run_scenario(app, name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    rec = ScenarioRecorder(name, args.sessions)
+    rec.rss_before = rec.rss_peak = _rss_bytes()
+    runner = SESSION_RUNNERS[name]
+
+    async def sample_rss():
+        while True:
+            rec.rss_peak = max(rec.rss_peak, _rss_bytes())
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_rss())
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(runner(app, i, args, rec) for i in range(args.sessions)), return_exceptions=True
+    )
+    rec.wall_s = time.perf_counter() - start
+    sampler.cancel()
+    rec.rss_peak = max(rec.rss_peak, _rss_bytes())
+    for result in results:
+        if isinstance(result, Exception):
+            rec.error(f"{type(result).__name__}: {result}")
+    return rec.result()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.main import app
+    from app.core.config import settings
+    from app.core import fast_json
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json": fast_json.BACKEND,
+            "args": vars(args),
+            "providers": {
+                "llm": settings.LLM_PROVIDER, "asr": settings.ASR_PROVIDER, "tts": settings.TTS_PROVIDER
+            },
+            "loopback": {
+                key: value for key, value in settings.model_dump().items() if key.startswith("LOOPBACK_")
+            },
+        },
+        "scenarios": {},
+    }
+    # 与正式部署一样经过应用生命周期（初始化与资源释放）
+    async with app.router.lifespan_context(app):
+        for name in args.scenarios:
+            print(f"运行场景 {name}：{args.sessions}个会话 × {args.turns}轮", file=sys.stderr)
+            report["scenarios"][name] = await run_scenario(app, name, args)
+    return report
+
+
+COMPARE_METRICS = [
+    ("latency_ms", "p50"), ("latency_ms", "p95"), ("latency_ms", "p99"),
+    ("ttft_ms", "p50"), ("ttft_ms", "p95"),
+    ("ttfa_ms", "p50"), ("ttfa_ms", "p95"),
+    ("chars_per_s", "p50"), ("token_frames", None), ("final_ms", "p50"),
+    ("frames_per_s", None), ("rss_per_session_bytes", None), ("errors", None),
+]
+
+
+def _metric(scenario: Dict[str, Any], name: str, stat: Optional[str]) -> Optional[float]:
+    value = scenario.get(name)
+    return value.get(stat) if stat and isinstance(value, dict) else value
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> str:
+    """输出两次结果的对比表"""
+    lines = [f"基准 {baseline['meta'].get('commit')} → 当前 {current['meta'].get('commit')}"]
+    for name, scenario in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        lines.append(f"[{name}]")
+        for metric, stat in COMPARE_METRICS:
+            old, new = _metric(base, metric, stat), _metric(scenario, metric, stat)
+            if old is None or new is None:
+                continue
+            label = f"{metric}.{stat}" if stat else metric
+            delta = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            lines.append(f"  {label:<24} {old:>14.3f} → {new:>14.3f}  {delta}")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="聊天链路端到端压测")
+    parser.add_argument("--sessions", type=int, default=20, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的请求轮数")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="要运行的场景")
+    parser.add_argument("--role", default="sherlock", help="使用的角色ID")
+    parser.add_argument("--asr-seconds", type=float, default=3.0, help="ASR场景上传的语音时长（秒）")
+    parser.add_argument("--idle-timeout", type=float, default=30.0, help="WebSocket单条消息最长等待时间（秒）")
+    parser.add_argument("--coalesce-ms", type=int, help="WebSocket Token合并窗口（毫秒），默认使用服务端配置")
+    parser.add_argument("--tts-cache", action="store_true", help="开启TTS磁盘缓存（默认关闭，每次真实合成）")
+    parser.add_argument("--output", help="结果JSON输出路径，默认输出到标准输出")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    _configure_environment(args)
+    report = asyncio.run(run(args))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(json.load(f), report), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
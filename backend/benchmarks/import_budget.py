@@ -0,0 +1,122 @@
+"""
+启动导入耗时检查
+在全新子进程中导入 app.main（即新Worker冷启动时的导入），统计应用自身的导入耗时并检查服务商SDK和
+各服务商模块没有在导入时被加载（它们应在首次使用时才加载，见 app/core/providers.py）
+超出预算或加载了不该加载的模块时以非零状态退出；tests/test_import_budget.py 只检查延迟加载
+（结果确定），导入耗时受机器负载影响，只在这里检查
+
+用法（在backend目录下）：
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 150 --runs 7
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+# 应用自身导入耗时预算（毫秒）
+DEFAULT_BUDGET_MS = 200.0
+
+# 导入 app.main 时不应加载的模块（前缀匹配）
+LAZY_MODULES = [
+    "openai",
+    "app.core.loopback",
+    "app.core.zhipu_client",
+    "app.core.qwen_client",
+    "app.services.baidu_asr",
+    "app.services.xunfei_asr",
+    "app.services.xunfei_tts",
+]
+
+# 子进程：先导入框架（不计入预算），再导入应用，输出应用自身的导入耗时与已加载模块
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import fastapi, httpx, pydantic_settings
+framework = time.perf_counter()
+import app.main
+end = time.perf_counter()
+print(json.dumps({
+    "framework_ms": (framework - start) * 1000, "ms": (end - framework) * 1000, "modules": sorted(sys.modules)
+}))
+"""
+
+
+def environment() -> Dict[str, str]:
+    """临时数据库与缓存目录；配置各服务商密钥和多服务商路由，确认配置了也不会在导入时加载，已设置的变量不覆盖"""
+    workdir = tempfile.mkdtemp(prefix="import_budget_")
+    env = dict(os.environ)
+    defaults = {
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'import.db')}",
+        "TTS_CACHE_DIR": os.path.join(workdir, "tts_cache"),
+        "SESSION_BACKEND": "memory",
+        "OPENAI_API_KEY": "sk-import-budget",
+        "ZHIPU_API_KEY": "import-budget",
+        "QWEN_API_KEY": "import-budget",
+        "LLM_ROUTER_PROVIDERS": '["openai", "zhipu", "qwen"]',
+    }
+    for key, value in defaults.items():
+        env.setdefault(key, value)
+    return env
+
+
+def probe(env: Dict[str, str]) -> Dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, env=env, check=True
+    )
+    # 应用导入时可能打印提示信息，结果在最后一行
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def lazy_modules_loaded(modules: List[str]) -> List[str]:
+    """已加载模块中应延迟加载的那些（按LAZY_MODULES前缀匹配）"""
+    return sorted(
+        prefix for prefix in LAZY_MODULES
+        if any(name == prefix or name.startswith(prefix + ".") for name in modules)
+    )
+
+
+def measure(runs: int) -> Tuple[float, float, List[str]]:
+    """多次导入，返回 (应用导入耗时中位数ms, 框架导入耗时中位数ms, 导入时被加载的延迟模块)"""
+    env = environment()
+    samples = []
+    framework = []
+    loaded = set()
+    for _ in range(max(1, runs)):
+        result = probe(env)
+        samples.append(result["ms"])
+        framework.append(result["framework_ms"])
+        loaded.update(lazy_modules_loaded(result["modules"]))
+    samples.sort()
+    framework.sort()
+    return samples[len(samples) // 2], framework[len(framework) // 2], sorted(loaded)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="启动导入耗时检查")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="应用自身的导入耗时预算（毫秒，取多次运行的中位数）")
+    parser.add_argument("--runs", type=int, default=5, help="运行次数")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    median, framework, loaded = measure(args.runs)
+
+    print(f"框架（fastapi/httpx/pydantic）导入：中位数 {framework:.1f} ms（不计入预算）")
+    print(f"导入 app.main：中位数 {median:.1f} ms，预算 {args.budget_ms:.0f} ms")
+    failed = False
+    if median > args.budget_ms:
+        print("超出导入耗时预算")
+        failed = True
+    if loaded:
+        print(f"导入时加载了应延迟加载的模块：{', '.join(loaded)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
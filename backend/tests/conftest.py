@@ -0,0 +1,22 @@
+"""
+测试公共配置
+异步测试使用anyio的pytest插件（随httpx/fastapi安装），只在asyncio上运行
+"""
+import pytest
+from app.core.http_client import HTTPClientPool
+from app.core.providers import install_http_pool
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def http_pool():
+    """代替应用生命周期安装连接池（访问HTTP服务商的客户端只能用已安装的连接池创建）"""
+    pool = HTTPClientPool()
+    install_http_pool(pool)
+    yield pool
+    install_http_pool(None)
+    await pool.close()
@@ -0,0 +1,142 @@
+import asyncio
+import httpx
+import pytest
+from app.core.admission import AdmissionController, ProviderGate, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from app.core.config import settings
+from app.core.loopback import LoopbackLLM
+from app.core.zhipu_client import ZhipuClient
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+@pytest.fixture
+def fast_loopback(monkeypatch):
+    monkeypatch.setattr(settings, "LOOPBACK_TTFT_MS", 20)
+    monkeypatch.setattr(settings, "LOOPBACK_TOKENS_PER_SECOND", 0)
+    monkeypatch.setattr(settings, "LOOPBACK_REPLY_TOKENS_MEAN", 5)
+    monkeypatch.setattr(settings, "LOOPBACK_REPLY_TOKENS_STDDEV", 0)
+    monkeypatch.setattr(settings, "LOOPBACK_ERROR_RATE", 0.0)
+
+
+async def test_gate_grants_by_priority_then_arrival():
+    gate = ProviderGate("llm:zhipu", limit=1, max_queue=10)
+    assert gate.try_acquire()
+    background = gate.enqueue(PRIORITY_BACKGROUND)
+    first = gate.enqueue(PRIORITY_INTERACTIVE)
+    second = gate.enqueue(PRIORITY_INTERACTIVE)
+    assert gate.position(second) == 1
+    assert gate.position(background) == 2
+
+    gate.release()
+    assert first.done() and not second.done() and not background.done()
+    gate.release()
+    assert second.done() and not background.done()
+    gate.release()
+    assert background.done()
+
+
+async def test_abandon_after_grant_returns_the_slot():
+    gate = ProviderGate("llm:zhipu", limit=1, max_queue=10)
+    assert gate.try_acquire()
+    late = gate.enqueue(PRIORITY_INTERACTIVE)
+    waiting = gate.enqueue(PRIORITY_INTERACTIVE)
+    gate.release()
+    assert late.done() and gate.active == 1
+    # 调用方在放行的同时超时放弃：名额转给下一个等待者，而不是丢失
+    gate.abandon(late)
+    assert waiting.done()
+    assert gate.active == 1
+
+
+async def test_abandon_while_queued_is_skipped():
+    gate = ProviderGate("llm:zhipu", limit=1, max_queue=10)
+    assert gate.try_acquire()
+    gone = gate.enqueue(PRIORITY_INTERACTIVE)
+    waiting = gate.enqueue(PRIORITY_BACKGROUND)
+    gate.abandon(gone)
+    assert gate.queued() == 1
+    gate.release()
+    assert gone.cancelled()
+    assert waiting.done()
+    assert gate.active == 1
+
+
+async def test_queue_full_is_rejected_locally(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_CONCURRENCY", '{"llm:zhipu": 1}')
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUE", 1)
+    controller = AdmissionController()
+    release = asyncio.Event()
+
+    async def held():
+        await release.wait()
+        yield {"type": "llm-token", "token": "好"}
+
+    holder = controller.run("llm", "zhipu", PRIORITY_INTERACTIVE, held)
+    queued = controller.run("llm", "zhipu", PRIORITY_INTERACTIVE, held)
+    holder_task = asyncio.ensure_future(holder.__anext__())
+    await asyncio.sleep(0)
+    assert (await queued.__anext__())["type"] == "chat-queued"
+
+    rejected = [event async for event in controller.run("llm", "zhipu", PRIORITY_INTERACTIVE, held)]
+    assert rejected == [{"type": "llm-error", "message": "服务繁忙，请稍后再试", "status": 503, "source": "admission"}]
+
+    release.set()
+    assert (await holder_task)["type"] == "llm-token"
+    await holder.aclose()
+    assert (await queued.__anext__())["type"] == "llm-token"
+    await queued.aclose()
+    assert controller.gate("llm:zhipu").active == 0
+
+
+def test_default_concurrency_follows_connection_limit(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_DEFAULT_CONCURRENCY", None)
+    monkeypatch.setattr(settings, "HTTP_MAX_CONNECTIONS_PER_HOST", 20)
+    assert AdmissionController().gate("llm:zhipu").limit == 20
+
+
+async def test_streams_beyond_connection_limit_queue_instead_of_failing(fast_loopback, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_DEFAULT_CONCURRENCY", None)
+    controller = AdmissionController()
+    llm = LoopbackLLM()
+    in_flight = 0
+    peak = 0
+
+    async def counted():
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            async for event in llm.stream_chat_completion(MESSAGES):
+                yield event
+        finally:
+            in_flight -= 1
+
+    async def one_stream():
+        return [event async for event in controller.run("llm", "loopback", PRIORITY_INTERACTIVE, counted)]
+
+    results = await asyncio.gather(*(one_stream() for _ in range(settings.HTTP_MAX_CONNECTIONS_PER_HOST + 5)))
+    assert peak == settings.HTTP_MAX_CONNECTIONS_PER_HOST
+    assert all(not any(e["type"] == "llm-error" for e in events) for events in results)
+    assert sum(1 for events in results if events[0]["type"] == "chat-queued") == 5
+    assert all(events[-1]["type"] == "llm-finish" for events in results)
+
+
+class _ExhaustedPool:
+    """每次请求都等不到空闲连接的连接池"""
+
+    def client_for(self, url):
+        return self
+
+    def stream(self, *args, **kwargs):
+        raise httpx.PoolTimeout("no free connection")
+
+
+async def test_pool_timeout_is_reported_as_local_overload():
+    client = ZhipuClient(pool=_ExhaustedPool())
+    client.api_key = "test-key"
+    events = [event async for event in client.stream_chat_completion(MESSAGES)]
+    assert events[-1]["type"] == "llm-error"
+    assert events[-1]["source"] == "admission"
+    assert events[-1]["status"] == 503
@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from app.api import chat
+from app.api.chat import TextChatRequest
+from app.core import fast_json
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def fake_items(monkeypatch):
+    """代替真实对话：记录每条的开始/结束，用于检查执行顺序与并发"""
+    log = []
+    running = set()
+    overlaps = []
+
+    async def run_item(index, item):
+        log.append(("start", index))
+        overlaps.extend((index, other) for other in running)
+        running.add(index)
+        await asyncio.sleep(0.01)
+        running.discard(index)
+        log.append(("end", index))
+        return {"index": index, "role_id": item.role_id, "session_id": item.session_id, "reply": str(index)}
+
+    monkeypatch.setattr(chat, "_run_batch_item", run_item)
+    return log, overlaps
+
+
+async def _run(items, concurrency=8):
+    lines = [line async for line in chat._run_batch([TextChatRequest(**item) for item in items], concurrency)]
+    return [fast_json.loads(line) for line in lines]
+
+
+async def test_same_session_items_run_in_order(fake_items):
+    log, overlaps = fake_items
+    results = await _run([{"role_id": "socrates", "message": str(i), "session_id": "s1"} for i in range(4)])
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert log == [(event, i) for i in range(4) for event in ("start", "end")]
+    assert overlaps == []
+
+
+async def test_different_sessions_run_concurrently(fake_items):
+    _, overlaps = fake_items
+    results = await _run([
+        {"role_id": "socrates", "message": "a", "session_id": "s1"},
+        {"role_id": "socrates", "message": "b", "session_id": "s2"},
+        {"role_id": "socrates", "message": "c"},
+    ])
+    assert sorted(r["index"] for r in results) == [0, 1, 2]
+    assert len(overlaps) == 3
+
+
+async def test_caller_session_id_does_not_collide_with_item_groups(fake_items):
+    # 第0条未指定会话；第1条的session_id恰好是 "#0"，两条不是同一会话，应并发执行
+    _, overlaps = fake_items
+    await _run([
+        {"role_id": "socrates", "message": "a"},
+        {"role_id": "socrates", "message": "b", "session_id": "#0"},
+    ])
+    assert overlaps == [(1, 0)]
+
+
+async def test_concurrency_limit(fake_items):
+    log, overlaps = fake_items
+    await _run([{"role_id": "socrates", "message": str(i)} for i in range(6)], concurrency=2)
+    assert max(len([o for o in overlaps if o[0] == i]) for i in range(6)) <= 1
+    assert len(log) == 12
+
+
+async def test_item_errors_are_reported_per_item(monkeypatch):
+    async def missing_role(role_id):
+        return None
+
+    monkeypatch.setattr(chat.role_repository, "get", missing_role)
+    results = await _run([{"role_id": "nobody", "message": "hi"}])
+    assert results == [{"index": 0, "role_id": "nobody", "session_id": None, "error": "角色 nobody 不存在"}]
@@ -0,0 +1,32 @@
+import pytest
+from app.core.http_client import HTTPClientPool, get_http_pool
+from app.core.providers import asr_providers, install_http_pool, llm_providers
+
+pytestmark = pytest.mark.anyio
+
+
+def test_pool_must_be_installed():
+    with pytest.raises(RuntimeError):
+        get_http_pool()
+    with pytest.raises(RuntimeError):
+        llm_providers.get("zhipu")
+
+
+async def test_registry_injects_installed_pool(http_pool):
+    assert llm_providers.get("zhipu").http_pool is http_pool
+    assert llm_providers.get("qwen").http_pool is http_pool
+    assert asr_providers.get("baidu").http_pool is http_pool
+    # 不访问HTTP接口的服务商不依赖连接池
+    assert llm_providers.get("loopback") is llm_providers.get("loopback")
+
+
+async def test_reinstalling_pool_rebuilds_clients(http_pool):
+    first = llm_providers.get("zhipu")
+    other = HTTPClientPool()
+    install_http_pool(other)
+    try:
+        assert llm_providers.get("zhipu") is not first
+        assert llm_providers.get("zhipu").http_pool is other
+    finally:
+        install_http_pool(http_pool)
+        await other.close()
@@ -0,0 +1,10 @@
+"""
+启动导入检查：新Worker冷启动时导入 app.main 不应加载服务商SDK和各服务商模块
+（导入耗时预算受机器负载影响，不在测试中检查，见 benchmarks/import_budget.py）
+"""
+from benchmarks.import_budget import environment, lazy_modules_loaded, probe
+
+
+def test_app_import_is_lazy():
+    loaded = lazy_modules_loaded(probe(environment())["modules"])
+    assert loaded == [], f"导入时加载了应延迟加载的模块：{loaded}"
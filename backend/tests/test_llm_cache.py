@@ -0,0 +1,76 @@
+import pytest
+from app.core.config import settings
+from app.core.llm_client import LLMClient
+from app.core.llm_router import LLMRouter
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "system", "content": "你是苏格拉底"}, {"role": "user", "content": "什么是正义"}]
+
+
+@pytest.fixture(autouse=True)
+def fast_loopback(monkeypatch, http_pool):
+    monkeypatch.setattr(settings, "LOOPBACK_TTFT_MS", 0)
+    monkeypatch.setattr(settings, "LOOPBACK_TOKENS_PER_SECOND", 0)
+    monkeypatch.setattr(settings, "LOOPBACK_ERROR_RATE", 0.0)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", False)
+
+
+def _client(provider, router_providers=None, failing=()):
+    """LLM客户端；router_providers非空时经路由调用，failing中的服务商总是返回错误"""
+    client = LLMClient()
+    client.provider = provider
+    calls = []
+    real_call = client._provider_call
+
+    async def provider_call(name, messages, priority):
+        calls.append(name)
+        if name in failing:
+            yield {"type": "llm-error", "message": f"{name} 不可用"}
+            return
+        async for event in real_call(name, messages, priority):
+            yield event
+
+    client._provider_call = provider_call
+    client._router = LLMRouter(provider_call, router_providers) if router_providers else None
+    client._router_resolved = True
+    return client, calls
+
+
+async def _collect(client):
+    return [event async for event in client.stream_chat_completion(MESSAGES, use_cache=True)]
+
+
+async def test_cache_hit_replays_tokens_and_finish():
+    client, calls = _client("loopback")
+    live = await _collect(client)
+    replay = await _collect(client)
+    assert calls == ["loopback"]
+    tokens = [e["token"] for e in live if e["type"] == "llm-token"]
+    assert [e["token"] for e in replay if e["type"] == "llm-token"] == tokens
+    assert replay[-1]["type"] == "llm-finish"
+    assert replay[-1]["finish_reason"] == "stop"
+    assert replay[-1]["provider"] == "loopback"
+    assert replay[-1]["cached"] is True
+    assert client.response_cache.stats()["hits"] == 1
+
+
+async def test_failover_reply_is_cached_and_hit_while_primary_is_down():
+    client, calls = _client("zhipu", ["zhipu", "loopback"], failing={"zhipu"})
+    live = await _collect(client)
+    assert live[-1]["provider"] == "loopback"
+    calls.clear()
+
+    replay = await _collect(client)
+    assert calls == []
+    assert replay[-1]["provider"] == "loopback"
+    assert replay[-1]["cached"] is True
+    assert client.response_cache.stats()["size"] == 1
+
+
+async def test_failed_reply_is_not_cached():
+    client, calls = _client("zhipu", ["zhipu"], failing={"zhipu"})
+    client._router = None
+    await _collect(client)
+    assert client.response_cache.stats()["stores"] == 0
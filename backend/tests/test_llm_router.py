@@ -0,0 +1,176 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.core.llm_router import LLMRouter, ProviderHealth
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.core.llm_router.time.monotonic", lambda: now[0])
+    return now
+
+
+def _health(threshold=3, reset_seconds=30):
+    return ProviderHealth("zhipu", window=50, window_seconds=300, failure_threshold=threshold, reset_seconds=reset_seconds)
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    health = _health()
+    health.record_failure()
+    health.record_failure()
+    assert health.state == "closed"
+    health.record_failure()
+    assert health.state == "open"
+    assert not health.allow_request()
+
+
+def test_success_resets_failure_count(clock):
+    health = _health()
+    health.record_failure()
+    health.record_failure()
+    health.record_success()
+    health.record_failure()
+    assert health.state == "closed"
+
+
+def test_half_open_allows_a_single_trial(clock):
+    health = _health(threshold=1)
+    health.record_failure()
+    clock[0] += 30
+    assert health.state == "half-open"
+    assert health.allow_request()
+    assert not health.allow_request()
+    health.record_success()
+    assert health.state == "closed"
+    assert health.allow_request()
+
+
+def test_failed_trial_reopens(clock):
+    health = _health(threshold=1)
+    health.record_failure()
+    clock[0] += 30
+    assert health.allow_request()
+    health.record_failure()
+    assert health.state == "open"
+    clock[0] += 29
+    assert not health.allow_request()
+
+
+def test_released_trial_can_be_retried(clock):
+    health = _health(threshold=1)
+    health.record_failure()
+    clock[0] += 30
+    assert health.allow_request()
+    health.release_trial()
+    assert health.state == "half-open"
+    assert health.allow_request()
+
+
+def _factory(behaviours, calls):
+    """服务商名 -> 事件序列；("sleep", 秒) 表示在下一条事件前等待"""
+
+    async def stream(name, messages, priority):
+        calls.append(name)
+        for item in behaviours[name]:
+            if item[0] == "sleep":
+                await asyncio.sleep(item[1])
+            else:
+                yield item[1]
+
+    return stream
+
+
+def _token(text):
+    return ("event", {"type": "llm-token", "token": text})
+
+
+FINISH = ("event", {"type": "llm-finish", "finish_reason": "stop", "usage": {}})
+
+
+async def _collect(router):
+    return [event async for event in router.stream_chat_completion(MESSAGES, 0)]
+
+
+async def test_failover_before_first_token(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DELAY_MS", 0)
+    calls = []
+    router = LLMRouter(_factory({
+        "zhipu": [("event", {"type": "llm-error", "message": "500"})],
+        "qwen": [_token("好"), FINISH],
+    }, calls), ["zhipu", "qwen"])
+    events = await _collect(router)
+    assert calls == ["zhipu", "qwen"]
+    assert [e["type"] for e in events] == ["llm-token", "llm-finish"]
+    assert router.health["zhipu"].consecutive_failures == 1
+    assert router.health["qwen"].state == "closed"
+
+
+async def test_local_overload_does_not_count_against_provider(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DELAY_MS", 0)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 1)
+    calls = []
+    router = LLMRouter(_factory({
+        "zhipu": [("event", {"type": "llm-error", "message": "繁忙", "status": 503, "source": "admission"})],
+        "qwen": [_token("好"), FINISH],
+    }, calls), ["zhipu", "qwen"])
+    await _collect(router)
+    assert router.health["zhipu"].state == "closed"
+    assert router.health["zhipu"].consecutive_failures == 0
+
+
+async def test_hedge_wins_and_primary_is_cancelled(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DELAY_MS", 20)
+    calls = []
+    cancelled = []
+
+    async def stream(name, messages, priority):
+        calls.append(name)
+        try:
+            if name == "zhipu":
+                await asyncio.sleep(5)
+            yield {"type": "llm-token", "token": name}
+            yield {"type": "llm-finish", "finish_reason": "stop", "usage": {}}
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled.append(name)
+            raise
+
+    router = LLMRouter(stream, ["zhipu", "qwen"])
+    events = await asyncio.wait_for(_collect(router), 2)
+    assert calls == ["zhipu", "qwen"]
+    assert events[0]["token"] == "qwen"
+    assert cancelled == ["zhipu"]
+    # 落败的对冲请求不计入失败
+    assert router.health["zhipu"].consecutive_failures == 0
+
+
+async def test_first_token_timeout_fails_over(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DELAY_MS", 0)
+    monkeypatch.setattr(settings, "LLM_FIRST_TOKEN_TIMEOUT", 0.05)
+    calls = []
+    router = LLMRouter(_factory({
+        "zhipu": [("sleep", 5), _token("慢")],
+        "qwen": [_token("快"), FINISH],
+    }, calls), ["zhipu", "qwen"])
+    events = await asyncio.wait_for(_collect(router), 2)
+    assert events[0]["token"] == "快"
+    assert router.health["zhipu"].consecutive_failures == 1
+
+
+async def test_open_provider_is_skipped(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DELAY_MS", 0)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 1)
+    calls = []
+    router = LLMRouter(_factory({
+        "zhipu": [("event", {"type": "llm-error", "message": "500"})],
+        "qwen": [_token("好"), FINISH],
+    }, calls), ["zhipu", "qwen"])
+    await _collect(router)
+    calls.clear()
+    await _collect(router)
+    assert calls == ["qwen"]
+    assert router.ranked()[-1] == "zhipu"
@@ -0,0 +1,68 @@
+import pytest
+from app.core.config import settings
+from app.services.role_skills import RoleSkills, SkillConfig, SkillIndex
+
+
+def _skill(name, description, enhancement="", examples=()):
+    return SkillConfig(name=name, description=description, prompt_enhancement=enhancement, examples=list(examples))
+
+
+LOGIC = _skill("逻辑推理", "从线索推理结论", "观察细节，演绎推理")
+CHEMISTRY = _skill("化学分析", "分析化学物质", "检验毒药成分")
+DISGUISE = _skill("易容伪装", "改变外貌身份", "伪装成他人")
+
+
+def test_selects_most_relevant_skill():
+    index = SkillIndex([LOGIC, CHEMISTRY, DISGUISE])
+    assert index.select("这杯茶里有毒药吗", top_k=2, min_score=0.5) == [CHEMISTRY]
+
+
+def test_ties_keep_configured_order():
+    twin_a = _skill("甲", "天文观测")
+    twin_b = _skill("乙", "天文观测")
+    index = SkillIndex([LOGIC, twin_a, twin_b])
+    assert index.select("天文观测", top_k=3, min_score=0.1) == [twin_a, twin_b]
+    assert SkillIndex([LOGIC, twin_b, twin_a]).select("天文观测", top_k=3, min_score=0.1) == [twin_b, twin_a]
+
+
+def test_top_k_and_min_score():
+    index = SkillIndex([LOGIC, CHEMISTRY, DISGUISE])
+    assert len(index.select("推理 毒药 伪装", top_k=2, min_score=0.1)) == 2
+    assert index.select("今天天气不错", top_k=2, min_score=0.1) == []
+
+
+def test_single_skill_is_selected_when_relevant():
+    index = SkillIndex([LOGIC])
+    assert index.select("帮我推理一下线索", top_k=2, min_score=1.0) == [LOGIC]
+    assert index.select("今天天气不错", top_k=2, min_score=1.0) == []
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(settings, "SKILL_ROUTER_ENABLED", True)
+    monkeypatch.setattr(settings, "SKILL_ROUTER_MIN_SCORE", 1.0)
+    manager = RoleSkills()
+    manager.skills_db = {"detective": [LOGIC]}
+    manager.indexes = {"detective": SkillIndex([LOGIC])}
+    return manager
+
+
+def test_single_skill_role_injects_details_when_relevant(manager):
+    prompt = manager.compose_system_prompt("detective", "你是侦探", "帮我推理一下线索")
+    assert "应用方法：观察细节，演绎推理" in prompt
+
+
+def test_single_skill_role_falls_back_to_names(manager, monkeypatch):
+    monkeypatch.setattr(settings, "SKILL_ROUTER_FALLBACK", "names")
+    prompt = manager.compose_system_prompt("detective", "你是侦探", "今天天气不错")
+    assert "逻辑推理：从线索推理结论" in prompt
+    assert "应用方法" not in prompt
+    monkeypatch.setattr(settings, "SKILL_ROUTER_FALLBACK", "none")
+    assert manager.compose_system_prompt("detective", "你是侦探", "今天天气不错") == "你是侦探"
+
+
+def test_prompt_cache_is_per_instance(manager):
+    other = RoleSkills()
+    manager.compose_system_prompt("detective", "你是侦探", "帮我推理一下线索")
+    assert len(manager._prompt_cache) == 1
+    assert other._prompt_cache == {}
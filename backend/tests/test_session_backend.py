@@ -0,0 +1,132 @@
+import asyncio
+import fakeredis
+import pytest
+from app.models.role import Role
+from app.services.session_backend import MemorySessionBackend, RedisSessionBackend
+from app.services.session_store import SessionStore
+
+pytestmark = pytest.mark.anyio
+
+ROLE = Role(
+    id="sherlock", name="夏洛克", description="侦探", system_prompt="你是夏洛克", default_voice="sherlock"
+)
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+def _redis_backend(server, ttl_seconds=1800):
+    return RedisSessionBackend(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), ttl_seconds)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request, redis_server):
+    if request.param == "memory":
+        return MemorySessionBackend(SessionStore(max_sessions=100, ttl_seconds=1800))
+    return _redis_backend(redis_server)
+
+
+async def test_create_and_read(backend):
+    assert not await backend.exists("s1")
+    assert await backend.create("s1", ROLE, [])
+    assert await backend.exists("s1")
+    assert (await backend.get_role("s1")).id == "sherlock"
+    assert await backend.get_history("s1") == []
+
+
+async def test_missing_session(backend):
+    assert await backend.get_role("missing") is None
+    assert await backend.get_history("missing") == []
+
+
+async def test_create_keeps_existing_history(backend):
+    await backend.create("s1", ROLE, [])
+    await backend.append("s1", {"role": "user", "content": "你好"})
+    # 重连或其他worker再次初始化同一会话，不能清空对话历史
+    assert not await backend.create("s1", ROLE, [])
+    assert await backend.get_history("s1") == [{"role": "user", "content": "你好"}]
+
+
+async def test_create_with_initial_history(backend):
+    history = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+    await backend.create("s1", ROLE, history)
+    assert await backend.get_history("s1") == history
+
+
+async def test_append_and_drop_oldest(backend):
+    await backend.create("s1", ROLE, [])
+    await backend.append("s1", *[{"role": "user", "content": str(i)} for i in range(5)])
+    await backend.drop_oldest("s1", 2)
+    assert [m["content"] for m in await backend.get_history("s1")] == ["2", "3", "4"]
+
+
+async def test_history_tokens_track_append_and_drop(backend):
+    await backend.create("s1", ROLE, [{"role": "user", "content": "a", "tokens": 3}])
+    await backend.append("s1", {"role": "assistant", "content": "b", "tokens": 5}, {"role": "user", "content": "c", "tokens": 7})
+    assert await backend.history_tokens("s1") == 15
+    await backend.drop_oldest("s1", 2)
+    assert await backend.history_tokens("s1") == 7
+    await backend.close("s1")
+    assert await backend.history_tokens("s1") == 0
+
+
+async def test_history_is_a_copy(backend):
+    await backend.create("s1", ROLE, [])
+    await backend.append("s1", {"role": "user", "content": "a"})
+    history = await backend.get_history("s1")
+    history.append({"role": "user", "content": "b"})
+    assert len(await backend.get_history("s1")) == 1
+
+
+async def test_close(backend):
+    await backend.create("s1", ROLE, [])
+    await backend.append("s1", {"role": "user", "content": "a"})
+    await backend.close("s1")
+    assert not await backend.exists("s1")
+    assert await backend.get_history("s1") == []
+
+
+async def test_redis_workers_share_sessions(redis_server):
+    worker_a = _redis_backend(redis_server)
+    worker_b = _redis_backend(redis_server)
+    await worker_a.create("s1", ROLE, [])
+    await worker_a.append("s1", {"role": "user", "content": "来自A"})
+    assert (await worker_b.get_role("s1")).id == "sherlock"
+    await worker_b.append("s1", {"role": "assistant", "content": "来自B"})
+    assert [m["content"] for m in await worker_a.get_history("s1")] == ["来自A", "来自B"]
+
+
+async def test_redis_concurrent_create_only_one_wins(redis_server):
+    workers = [_redis_backend(redis_server) for _ in range(5)]
+    results = await asyncio.gather(*(worker.create("s1", ROLE, []) for worker in workers))
+    assert results.count(True) == 1
+
+
+async def test_redis_keys_expire_together(redis_server):
+    backend = _redis_backend(redis_server, ttl_seconds=60)
+    await backend.create("s1", ROLE, [])
+    await backend.append("s1", {"role": "user", "content": "a"})
+    assert 0 < await backend.redis.ttl("session:s1:role") <= 60
+    assert 0 < await backend.redis.ttl("session:s1:history") <= 60
+
+
+def test_store_evicts_least_recently_used():
+    store = SessionStore(max_sessions=2, ttl_seconds=1800)
+    store.create("a", {})
+    store.create("b", {})
+    store.get("a")
+    store.create("c", {})
+    assert "a" in store and "c" in store and "b" not in store
+    assert store.evicted == 1
+
+
+def test_store_expires_idle_sessions(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.session_store.time.monotonic", lambda: now[0])
+    store = SessionStore(max_sessions=10, ttl_seconds=30)
+    store.create("a", {})
+    now[0] += 31
+    assert store.get("a") is None
+    assert store.expired == 1
@@ -0,0 +1,49 @@
+from app.core.sse import SSEDecoder, finish_event
+
+
+def _feed_all(*chunks):
+    decoder = SSEDecoder()
+    events = []
+    for chunk in chunks:
+        events.extend(decoder.feed(chunk))
+    return events + decoder.flush()
+
+
+def test_crlf_split_across_chunks():
+    events = _feed_all(b'data: {"a": 1}\r', b"\n\r", b"\n")
+    assert [e.data for e in events] == [b'{"a": 1}']
+    assert events[0].json() == {"a": 1}
+
+
+def test_every_byte_in_its_own_chunk():
+    raw = b"event: result\r\ndata: one\r\n\r\ndata: two\r\n\r\n"
+    events = _feed_all(*(raw[i:i + 1] for i in range(len(raw))))
+    assert [(e.event, e.data) for e in events] == [("result", b"one"), ("message", b"two")]
+
+
+def test_multi_line_data_is_joined_with_newlines():
+    events = _feed_all(b"data: first\ndata:second\ndata:  third\n\n")
+    assert events[0].data == b"first\nsecond\n third"
+
+
+def test_comments_and_unknown_fields_are_ignored():
+    events = _feed_all(b": ping\n\nfoo: bar\ndata: x\n\n")
+    assert [e.data for e in events] == [b"x"]
+
+
+def test_id_and_retry_carry_over():
+    events = _feed_all(b"id: 7\nretry: 1500\ndata: a\n\ndata: b\n\n")
+    assert [(e.id, e.retry) for e in events] == [("7", 1500), ("7", 1500)]
+
+
+def test_flush_dispatches_event_without_trailing_blank_line():
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: [DONE]") == []
+    events = decoder.flush()
+    assert len(events) == 1 and events[0].is_done
+
+
+def test_finish_event_normalizes_usage_names():
+    event = finish_event(None, {"input_tokens": 3, "output_tokens": 5})
+    assert event["finish_reason"] == "stop"
+    assert event["usage"] == {"prompt_tokens": 3, "completion_tokens": 5, "total_tokens": 8}
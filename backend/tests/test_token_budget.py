@@ -0,0 +1,70 @@
+import pytest
+from app.core.config import settings
+from app.core.token_budget import (
+    align_to_user_turn, estimate_prompt_tokens, history_token_budget, widest_provider, window_by_budget
+)
+from app.models.role import Role
+from app.services.chat_servers import ChatService
+from app.services.session_backend import MemorySessionBackend
+from app.services.session_store import SessionStore
+
+pytestmark = pytest.mark.anyio
+
+ROLE = Role(id="socrates", name="苏格拉底", description="哲学家", system_prompt="你是苏格拉底", default_voice="socrates")
+
+
+def _history(*tokens):
+    roles = ["user", "assistant"]
+    return [{"role": roles[i % 2], "content": str(i), "tokens": t} for i, t in enumerate(tokens)]
+
+
+def test_within_budget_needs_no_walk():
+    # 总数未超出预算时不读取任何消息（tokens缺失也不会被估算）
+    history = [{"role": "user"}] * 5
+    assert window_by_budget(history, total=100, budget=100) == 0
+
+
+def test_drops_oldest_until_within_budget():
+    history = _history(10, 20, 30, 40)
+    assert window_by_budget(history, total=100, budget=75) == 2
+    assert window_by_budget(history, total=100, budget=10) == 3
+
+
+def test_newest_message_is_always_kept():
+    history = _history(10, 500)
+    assert window_by_budget(history, total=510, budget=100) == 1
+
+
+def test_align_does_not_split_a_turn():
+    history = _history(1, 1, 1, 1, 1)
+    assert align_to_user_turn(history, 0) == 0
+    assert align_to_user_turn(history, 1) == 2
+    assert align_to_user_turn(history, 2) == 2
+    # 之后没有用户消息时保持原位置
+    assert align_to_user_turn(history[:4], 3) == 3
+
+
+def test_budget_uses_smallest_candidate_context(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_TOKEN_BUDGET", 100000)
+    monkeypatch.setattr(settings, "LLM_REPLY_RESERVED_TOKENS", 1000)
+    prompt = "你是苏格拉底"
+    budget = history_token_budget([("zhipu", "glm-4"), ("qwen", "qwen-turbo")], prompt)
+    assert budget == 8000 - 1000 - estimate_prompt_tokens(prompt, "qwen")
+
+
+def test_widest_provider_is_most_conservative():
+    assert widest_provider(["zhipu", "openai", "qwen"]) == "openai"
+
+
+async def test_session_history_keeps_whole_turns(monkeypatch, http_pool):
+    monkeypatch.setattr(settings, "HISTORY_TOKEN_BUDGET", 25)
+    monkeypatch.setattr(settings, "SKILL_ROUTER_ENABLED", False)
+    service = ChatService()
+    service.sessions = MemorySessionBackend(SessionStore(max_sessions=10, ttl_seconds=1800))
+    await service.sessions.create("s1", ROLE, _history(10, 10, 10, 10, 10))
+
+    messages = await service.get_session_history("s1", ROLE)
+    # 预算只够最后两条，但第4条是助手消息：截断位置对齐到最后一条用户消息
+    assert [m["content"] for m in messages[1:]] == ["4"]
+    assert messages[0]["role"] == "system"
+    assert await service.sessions.history_tokens("s1") == 10
@@ -0,0 +1,136 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.core.token_manager import TokenManager
+from app.services.baidu_asr import BaiduASRService
+
+pytestmark = pytest.mark.anyio
+
+
+class _Fetcher:
+    """可控的令牌接口：记录调用次数，每次返回新令牌"""
+
+    def __init__(self, expires_in=3600, delay=0.01, fail=False):
+        self.calls = 0
+        self.expires_in = expires_in
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("401 invalid_client")
+        return f"token-{self.calls}", self.expires_in
+
+
+def _manager(fetcher, **kwargs):
+    kwargs.setdefault("refresh_margin", 60)
+    kwargs.setdefault("retry_seconds", 30)
+    return TokenManager("测试", fetcher, **kwargs)
+
+
+async def test_concurrent_get_fetches_once():
+    fetcher = _Fetcher()
+    manager = _manager(fetcher)
+    tokens = await asyncio.gather(*(manager.get() for _ in range(20)))
+    assert tokens == ["token-1"] * 20
+    assert fetcher.calls == 1
+    manager.close()
+
+
+async def test_cached_token_is_reused():
+    fetcher = _Fetcher()
+    manager = _manager(fetcher)
+    await manager.get()
+    assert await manager.get() == "token-1"
+    assert fetcher.calls == 1
+    manager.close()
+
+
+async def test_invalidate_after_auth_failure_fetches_new_token():
+    fetcher = _Fetcher()
+    manager = _manager(fetcher)
+    rejected = await manager.get()
+    manager.invalidate(rejected)
+    assert await manager.get() == "token-2"
+    assert fetcher.calls == 2
+    manager.close()
+
+
+async def test_stale_invalidate_keeps_the_newer_token():
+    fetcher = _Fetcher()
+    manager = _manager(fetcher)
+    old = await manager.get()
+    manager.invalidate(old)
+    new = await manager.get()
+    # 另一个请求拿着旧令牌失败后再作废，不能把已刷新的新令牌也作废
+    manager.invalidate(old)
+    assert await manager.get() == new
+    assert fetcher.calls == 2
+    manager.close()
+
+
+async def test_failure_backs_off_until_retry_interval():
+    fetcher = _Fetcher(fail=True)
+    manager = _manager(fetcher)
+    results = await asyncio.gather(*(manager.get() for _ in range(5)))
+    assert results == [None] * 5
+    assert await manager.get() is None
+    assert fetcher.calls == 1
+    assert manager.stats()["failures"] == 1
+    manager.close()
+
+
+async def test_scheduled_refresh_keeps_serving_current_token():
+    fetcher = _Fetcher(expires_in=1.0)
+    manager = _manager(fetcher, refresh_margin=0.5)
+    assert await manager.get() == "token-1"
+    fetcher.delay = 0.2
+    await asyncio.sleep(0.55)
+    # 到期前按计划后台刷新：刷新进行中时立即返回现有令牌，不等待令牌接口
+    assert fetcher.calls == 2
+    assert await asyncio.wait_for(manager.get(), 0.05) == "token-1"
+    await asyncio.sleep(0.25)
+    assert await manager.get() == "token-2"
+    manager.close()
+
+
+class _Response:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class _BaiduAPI:
+    """百度令牌接口与识别接口：第一次识别以令牌过期（3302）拒绝"""
+
+    def __init__(self):
+        self.tokens_issued = 0
+        self.recognized_with = []
+
+    def client_for(self, url):
+        return self
+
+    async def post(self, url, params=None, headers=None, json=None):
+        if "oauth" in url:
+            self.tokens_issued += 1
+            return _Response(200, {"access_token": f"token-{self.tokens_issued}", "expires_in": 3600})
+        self.recognized_with.append(json["token"])
+        if len(self.recognized_with) == 1:
+            return _Response(200, {"err_no": 3302, "err_msg": "authentication failed"})
+        return _Response(200, {"err_no": 0, "result": ["你好"]})
+
+
+async def test_baidu_retries_once_with_a_fresh_token_after_auth_failure(monkeypatch):
+    monkeypatch.setattr(settings, "BAIDU_API_KEY", "key")
+    monkeypatch.setattr(settings, "BAIDU_SECRET_KEY", "secret")
+    api = _BaiduAPI()
+    service = BaiduASRService(pool=api)
+    events = [event async for event in service.transcribe_stream(b"audio")]
+    assert events[-1] == {"type": "stt-final", "text": "你好", "confidence": 0.95}
+    assert api.recognized_with == ["token-1", "token-2"]
+    service.tokens.close()
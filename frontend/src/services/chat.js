@@ -92,8 +92,12 @@ export class ChatWebSocket {
     }
   }
 
+  // 结束会话：通知后端删除对话历史后关闭连接（仅断开连接时后端会保留会话，便于重连）
   close() {
     if (this.ws) {
+      if (this.ws.readyState === WebSocket.OPEN) {
+        this.ws.send(JSON.stringify({ type: 'end-session' }));
+      }
       this.ws.close();
     }
   }